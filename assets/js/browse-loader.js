@@ -1,6 +1,7 @@
 /**
  * Browse Loader
- * Loads all metadata.json files and provides tag-based filtering
+ * Loads gallery-index.json (or every metadata.json) and provides tag-based filtering
+ * and full-text search over the prebuilt search index (scripts/photosite/search_index.py)
  * Displays images grouped by selected tags
  */
 
@@ -14,24 +15,56 @@ const collections = [
 
 let allMetadata = []; // Store all metadata
 let allTags = new Set(); // All unique tags
+let tagIndex = null; // tag -> positions in allMetadata (from gallery-index.json)
 let selectedTags = new Set(['travel', 'landscape', 'nature']); // Default tags
+let searchQuery = ''; // Current contents of the search box
+let searchResults = null; // Matching positions in allMetadata, best first (null when not searching)
+
+const SEARCH_PATH = 'assets/images/gallery/search/';
+const SEARCH_DEBOUNCE_MS = 150;
+let searchManifest = null; // Promise of search/manifest.json (resolves to null if unavailable)
+const searchShards = new Map(); // shard key -> Promise of its terms
 
 document.addEventListener('DOMContentLoaded', async () => {
+  // browse.html is pre-rendered with the default tag selection; only the
+  // tag buttons need wiring up until the selection changes
+  const prerendered = document.querySelector('#browse-galleries > section, #browse-galleries > .empty-state');
+
   await loadAllMetadata();
   renderTagButtons();
-  renderGalleries();
+  const initialQuery = setupSearch();
+  if (initialQuery) {
+    await runSearch(initialQuery);
+  } else if (!prerendered) {
+    renderGalleries();
+  }
 });
 
 /**
- * Load all metadata files from all collections
+ * Load all images from the site-wide gallery index (one request),
+ * falling back to fetching every collection's metadata in parallel
  */
 async function loadAllMetadata() {
-  for (const collectionId of collections) {
+  try {
+    const response = await fetch(dataUrl('gallery-index', 'assets/images/gallery/gallery-index.json'));
+    if (response.ok) {
+      const index = await response.json();
+      allMetadata = index.images;
+      tagIndex = index.tags;
+      Object.keys(tagIndex).forEach(tag => allTags.add(tag));
+      console.log(`Loaded ${allMetadata.length} images with ${allTags.size} unique tags`);
+      return;
+    }
+  } catch (error) {
+    console.warn('Gallery index unavailable, loading collections individually:', error);
+  }
+
+  const results = await Promise.all(collections.map(async collectionId => {
     const metadataPath = `assets/images/gallery/${collectionId}/metadata.json`;
     
     try {
       const response = await fetch(metadataPath);
-      if (!response.ok) continue;
+      if (!response.ok) return [];
       
       const metadata = await response.json();
       
@@ -46,12 +79,14 @@ async function loadAllMetadata() {
         image.collectionTitle = metadata.collection.title;
       });
       
-      allMetadata = allMetadata.concat(metadata.images);
+      return metadata.images;
     } catch (error) {
       console.error(`Error loading ${collectionId}:`, error);
+      return [];
     }
-  }
+  }));
   
+  allMetadata = results.flat();
   console.log(`Loaded ${allMetadata.length} images with ${allTags.size} unique tags`);
 }
 
@@ -116,18 +151,230 @@ function updateTagButtons() {
 /**
  * Filter images based on selected tags
  * Returns images that have AT LEAST ONE of the selected tags
+ * (and match the search, best matches first, while searching)
  */
 function getFilteredImages() {
+  if (searchResults) {
+    const images = searchResults.map(position => allMetadata[position]);
+    if (selectedTags.size === 0) return images;
+    return images.filter(image => image.tags.some(tag => selectedTags.has(tag)));
+  }
+
   if (selectedTags.size === 0) {
     return allMetadata; // Show all if no tags selected
   }
   
+  // Use the prebuilt inverted index when available
+  if (tagIndex) {
+    const positions = new Set();
+    selectedTags.forEach(tag => {
+      (tagIndex[tag] || []).forEach(position => positions.add(position));
+    });
+    return Array.from(positions).sort((a, b) => a - b).map(position => allMetadata[position]);
+  }
+  
   return allMetadata.filter(image => {
     // Image matches if it has at least one of the selected tags
     return image.tags.some(tag => selectedTags.has(tag));
   });
 }
 
+/**
+ * Wire up the search box; returns the initial query from ?q= (if any)
+ */
+function setupSearch() {
+  const input = document.getElementById('search-input');
+  if (!input) return '';
+
+  let timer = null;
+  input.addEventListener('input', () => {
+    clearTimeout(timer);
+    timer = setTimeout(() => runSearch(input.value), SEARCH_DEBOUNCE_MS);
+  });
+
+  const initialQuery = new URLSearchParams(window.location.search).get('q') || '';
+  input.value = initialQuery;
+  return initialQuery;
+}
+
+/**
+ * Run a search and re-render; results of queries overtaken by newer
+ * keystrokes are dropped
+ */
+async function runSearch(query) {
+  searchQuery = query;
+  const results = query.trim() ? await searchImages(query) : null;
+  if (query !== searchQuery) return;
+
+  searchResults = results;
+  const url = new URL(window.location.href);
+  if (query.trim()) {
+    url.searchParams.set('q', query.trim());
+  } else {
+    url.searchParams.delete('q');
+  }
+  window.history.replaceState(null, '', url);
+  renderGalleries();
+}
+
+/**
+ * Positions in allMetadata of the images matching every word of the
+ * query, best first. Each word matches the indexed terms it is a prefix
+ * of (exact stem matches count double), scored by the field weights
+ * stored in the index. Only the manifest and one shard per word are
+ * fetched; without a usable index the loaded images are scanned instead
+ */
+async function searchImages(query) {
+  const manifest = await loadSearchManifest();
+  const words = searchTokens(query, manifest);
+  if (words.length === 0) return null;
+  if (!manifest || !tagIndex || manifest.images !== allMetadata.length) {
+    return scanImages(words);
+  }
+
+  const matches = await Promise.all(words.map(async word => {
+    const stemmed = stemWord(word);
+    const terms = await loadSearchShard(manifest, stemmed);
+    const scores = new Map();
+    Object.keys(terms).forEach(term => {
+      if (!term.startsWith(stemmed) && !term.startsWith(word) && !extendsStem(word, term)) return;
+      const factor = term === stemmed ? 2 : 1;
+      const postings = terms[term];
+      let position = 0;
+      for (let i = 0; i < postings.length; i += 2) {
+        position += postings[i];
+        const score = postings[i + 1] * factor;
+        scores.set(position, Math.max(scores.get(position) || 0, score));
+      }
+    });
+    return scores;
+  }));
+
+  // Every word must match; smallest candidate set first
+  matches.sort((a, b) => a.size - b.size);
+  const ranked = [];
+  matches[0].forEach((score, position) => {
+    let total = score;
+    for (let i = 1; i < matches.length; i++) {
+      const other = matches[i].get(position);
+      if (other === undefined) return;
+      total += other;
+    }
+    ranked.push([position, total]);
+  });
+  ranked.sort((a, b) => b[1] - a[1] || a[0] - b[0]);
+  return ranked.map(([position]) => position);
+}
+
+/**
+ * Fallback search without the index: images whose words start with
+ * every query word, in gallery order
+ */
+function scanImages(words) {
+  const positions = [];
+  allMetadata.forEach((image, position) => {
+    const text = [image.title, (image.tags || []).join(' '), image.location,
+      image.collectionTitle, image.description].join(' ');
+    const imageWords = searchTokens(text, null).map(stemWord);
+    const matched = words.every(word => {
+      const stemmed = stemWord(word);
+      return imageWords.some(imageWord => imageWord.startsWith(stemmed) || imageWord.startsWith(word) ||
+        extendsStem(word, imageWord));
+    });
+    if (matched) positions.push(position);
+  });
+  return positions;
+}
+
+/**
+ * Whether a partly typed word is an indexed stem plus the start of a suffix
+ * stemWord() strips: 'hiki' and 'hikin' (-> 'hik'), 'runni' (-> 'run'),
+ * 'citie' (-> 'city'). Such words do not stem to the term themselves.
+ */
+function extendsStem(word, term) {
+  const bases = term.endsWith('y') ? [term, term.slice(0, -1) + 'i'] : [term];
+  return bases.some(base => {
+    if (word.length <= base.length || !word.startsWith(base)) return false;
+    let rest = word.slice(base.length);
+    if (rest[0] === base[base.length - 1]) rest = rest.slice(1);
+    return ['ing', 'ed', 'es', 's'].some(suffix => suffix.startsWith(rest));
+  });
+}
+
+function loadSearchManifest() {
+  if (!searchManifest) {
+    searchManifest = fetch(dataUrl('search-index', `${SEARCH_PATH}manifest.json`))
+      .then(response => (response.ok ? response.json() : null))
+      .catch(error => {
+        console.warn('Search index unavailable, searching loaded images instead:', error);
+        return null;
+      });
+  }
+  return searchManifest;
+}
+
+/**
+ * Terms of the shard holding a term: the two-character shard if the
+ * index split its first-character shard, else the one-character shard
+ */
+function loadSearchShard(manifest, term) {
+  const key = [2, 1]
+    .map(length => shardKey(term, length))
+    .find(candidate => manifest.shards[candidate]);
+  if (!key) return Promise.resolve({});
+
+  if (!searchShards.has(key)) {
+    searchShards.set(key, fetch(`${SEARCH_PATH}${key}.${manifest.shards[key]}.json`)
+      .then(response => (response.ok ? response.json() : {}))
+      .catch(() => ({})));
+  }
+  return searchShards.get(key);
+}
+
+// tokenize(), stem() and shard_key() below mirror scripts/photosite/search_index.py
+
+function searchTokens(text, manifest) {
+  const stopwords = new Set(manifest ? manifest.stopwords : []);
+  const minLength = manifest ? manifest.minTokenLength : 2;
+  const words = text.normalize('NFKD').replace(/[\u0300-\u036f]/g, '').toLowerCase()
+    .match(/[\p{L}\p{N}]+/gu) || [];
+  return words.filter(word => word.length >= minLength && !stopwords.has(word));
+}
+
+function stemWord(word) {
+  if (word.length <= 3 || !/^[a-z]+$/.test(word)) return word;
+  if (word.endsWith('ies') && word.length > 4) {
+    word = word.slice(0, -3) + 'y';
+  } else if (word.endsWith('sses')) {
+    word = word.slice(0, -2);
+  } else if (['ss', 'us', 'is'].some(suffix => word.endsWith(suffix))) {
+    // left alone
+  } else if (word.endsWith('es') && ['s', 'x', 'z', 'ch', 'sh'].some(suffix => word.slice(0, -2).endsWith(suffix))) {
+    word = word.slice(0, -2);
+  } else if (word.endsWith('s')) {
+    word = word.slice(0, -1);
+  } else {
+    const suffix = ['ing', 'ed'].find(candidate => word.endsWith(candidate));
+    if (suffix) {
+      let base = word.slice(0, -suffix.length);
+      if (base.length >= 3 && /[aeiouy]/.test(base)) {
+        if (base[base.length - 1] === base[base.length - 2] && !'lsz'.includes(base[base.length - 1])) {
+          base = base.slice(0, -1);
+        }
+        word = base;
+      }
+    }
+  }
+  if (word.length > 3 && word.endsWith('e')) {
+    word = word.slice(0, -1);
+  }
+  return word;
+}
+
+function shardKey(term, length) {
+  return Array.from(term).slice(0, length).map(c => (/[a-z0-9]/.test(c) ? c : '_')).join('');
+}
+
 /**
  * Group images by collection (for display)
  */
@@ -159,7 +406,7 @@ function renderGalleries() {
   if (filteredImages.length === 0) {
     galleriesContainer.innerHTML = `
       <div class="empty-state">
-        <p>No images found matching these categories.</p>
+        <p>No images found matching ${searchResults ? 'this search and ' : ''}these categories.</p>
       </div>
     `;
     return;
@@ -187,17 +434,22 @@ function renderGalleries() {
     images.forEach(image => {
       const figure = document.createElement('figure');
       
-      const thumbPath = `assets/images/gallery/${image.collectionId}/thumbnails/${image.filename}`;
+      const thumbPath = thumbnailSrc(image, image.collectionId);
       const fullPath = `assets/images/gallery/${image.collectionId}/full-res/${image.filename}`;
       
       figure.innerHTML = `
-        <img
-          class="js-lightbox-trigger"
-          src="${thumbPath}"
-          data-full="${fullPath}"
-          alt="${image.description}"
-          data-title="${image.title}"
-        />
+        <picture>
+          ${modernImageSources(image, image.collectionId)}
+          <img
+            class="js-lightbox-trigger"
+            src="${thumbPath}"
+            ${responsiveImageAttributes(image, image.collectionId)}
+            ${placeholderStyle(image)}
+            data-full="${fullPath}"
+            alt="${image.description}"
+            data-title="${image.title}"
+          />
+        </picture>
         <figcaption>${image.title}</figcaption>
       `;
       
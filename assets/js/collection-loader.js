@@ -2,12 +2,18 @@
  * Collection Loader
  * Handles loading specific gallery collections based on URL parameter
  * Usage: collection.html?id=collection-slug
+ * Static pages pre-rendered into collections/<id>.html are left as-is
  */
 
 document.addEventListener('DOMContentLoaded', async () => {
   // 1. Get collection ID from URL
   const urlParams = new URLSearchParams(window.location.search);
-  const collectionId = urlParams.get('id');
+  const collectionId = urlParams.get('id') || document.getElementById('collection-main').dataset.collectionId;
+
+  // Pre-rendered at build time: the grid is already in the page
+  if (document.querySelector('#collection-grid figure')) {
+    return;
+  }
 
   if (!collectionId) {
     showError('No collection specified.');
@@ -58,7 +64,7 @@ function renderCollection(data) {
     const figure = document.createElement('figure');
     
     // Paths
-    const thumbPath = `assets/images/gallery/${collection.id}/thumbnails/${image.filename}`;
+    const thumbPath = thumbnailSrc(image, collection.id);
     const fullPath = `assets/images/gallery/${collection.id}/full-res/${image.filename}`;
     
     // Print info (placeholder for e-commerce)
@@ -68,13 +74,18 @@ function renderCollection(data) {
 
     figure.innerHTML = `
       <div class="image-wrapper">
-        <img 
-          class="js-lightbox-trigger"
-          src="${thumbPath}" 
-          data-full="${fullPath}" 
-          alt="${image.description}"
-          data-title="${image.title}"
-        />
+        <picture>
+          ${modernImageSources(image, collection.id)}
+          <img 
+            class="js-lightbox-trigger"
+            src="${thumbPath}" 
+            ${responsiveImageAttributes(image, collection.id)}
+            ${placeholderStyle(image)}
+            data-full="${fullPath}" 
+            alt="${image.description}"
+            data-title="${image.title}"
+          />
+        </picture>
       </div>
       <figcaption>
         <strong>${image.title}</strong>
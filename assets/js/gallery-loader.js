@@ -1,7 +1,8 @@
 /**
  * Gallery Loader
- * Dynamically loads metadata.json files and renders gallery sections
+ * Dynamically loads gallery-index.json (or metadata.json files) and renders gallery sections
  * Shows only featured images on homepage as curated previews
+ * Pages pre-rendered by scripts/build-site.py already contain the sections
  */
 
 (async function loadGalleries() {
@@ -16,30 +17,61 @@
     'japan-2025',
   'england-2024'];
 
+  // Pre-rendered at build time: nothing to render (lightbox uses event delegation)
+  if (collectionsContainer.querySelector('.gallery-section')) {
+    return;
+  }
+
   try {
-    for (const collectionId of collections) {
-      const metadataPath = `assets/images/gallery/${collectionId}/metadata.json`;
-      
-      try {
-        const response = await fetch(metadataPath);
-        
-        if (!response.ok) {
-          console.warn(`Failed to load metadata for ${collectionId}: ${response.status}`);
-          continue;
-        }
-
-        const metadata = await response.json();
-        const section = createGallerySection(metadata);
-        collectionsContainer.appendChild(section);
-      } catch (error) {
-        console.error(`Error loading ${collectionId}:`, error);
-      }
-    }
+    const sections = await loadCollectionMetadata(collections);
+    sections.forEach(metadata => {
+      collectionsContainer.appendChild(createGallerySection(metadata));
+    });
   } catch (error) {
     console.error('Error in gallery loader:', error);
   }
 })();
 
+/**
+ * Returns metadata ({collection, images}) for each collection, in order.
+ * Uses the site-wide gallery-index.json (one request) when available,
+ * otherwise fetches every collection's metadata.json in parallel
+ */
+async function loadCollectionMetadata(collections) {
+  try {
+    const response = await fetch(dataUrl('gallery-index', 'assets/images/gallery/gallery-index.json'));
+    if (response.ok) {
+      const index = await response.json();
+      return index.collections.map(collection => ({
+        collection,
+        images: index.images.filter(image => image.collectionId === collection.id)
+      }));
+    }
+  } catch (error) {
+    console.warn('Gallery index unavailable, loading collections individually:', error);
+  }
+
+  const results = await Promise.all(collections.map(async collectionId => {
+    const metadataPath = `assets/images/gallery/${collectionId}/metadata.json`;
+    
+    try {
+      const response = await fetch(metadataPath);
+      
+      if (!response.ok) {
+        console.warn(`Failed to load metadata for ${collectionId}: ${response.status}`);
+        return null;
+      }
+
+      return await response.json();
+    } catch (error) {
+      console.error(`Error loading ${collectionId}:`, error);
+      return null;
+    }
+  }));
+
+  return results.filter(Boolean);
+}
+
 /**
  * Creates a gallery section element from metadata
  * Shows only featured images as a curated preview
@@ -98,17 +130,22 @@ function createGallerySection(metadata) {
 function createImageFigure(image, collectionId) {
   const figure = document.createElement('figure');
   
-  const thumbnailPath = `assets/images/gallery/${collectionId}/thumbnails/${image.filename}`;
+  const thumbnailPath = thumbnailSrc(image, collectionId);
   const fullImagePath = `assets/images/gallery/${collectionId}/full-res/${image.filename}`;
   
   figure.innerHTML = `
-    <img
-      class="js-lightbox-trigger"
-      src="${thumbnailPath}"
-      data-full="${fullImagePath}"
-      alt="${image.description}"
-      data-title="${image.title}"
-    />
+    <picture>
+      ${modernImageSources(image, collectionId)}
+      <img
+        class="js-lightbox-trigger"
+        src="${thumbnailPath}"
+        ${responsiveImageAttributes(image, collectionId)}
+        ${placeholderStyle(image)}
+        data-full="${fullImagePath}"
+        alt="${image.description}"
+        data-title="${image.title}"
+      />
+    </picture>
     <figcaption>${image.title}</figcaption>
   `;
 
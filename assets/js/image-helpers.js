@@ -0,0 +1,86 @@
+/**
+ * Image Helpers
+ * Image URLs, srcset/sizes, <source> elements and placeholder styles shared by
+ * gallery-loader.js, collection-loader.js and browse-loader.js (load it first)
+ * scripts/photosite/prerender.py builds the same markup at build time
+ */
+
+/**
+ * URL of a generated data file: the fingerprinted version named by a
+ * <meta> tag in the pre-rendered page (cacheable forever), else the
+ * plain, revalidated path
+ */
+function dataUrl(name, fallback) {
+  const meta = document.querySelector(`meta[name="${name}"]`);
+  return meta ? meta.content : fallback;
+}
+
+/**
+ * URL of an image's default thumbnail: the content-fingerprinted file
+ * recorded in metadata.json, or the plain thumbnails/<filename> alias
+ */
+function thumbnailSrc(image, collectionId) {
+  return encodeURI(`assets/images/gallery/${collectionId}/${image.thumbnail || `thumbnails/${image.filename}`}`);
+}
+
+/**
+ * Builds a srcset string from an image's rendition ladder (recorded in
+ * metadata.json by the thumbnail tools). With a format ('avif', 'webp')
+ * only renditions that have that variant are used; empty if none
+ */
+function renditionSrcset(image, collectionId, format) {
+  const basePath = `assets/images/gallery/${collectionId}/`;
+  const candidates = [];
+
+  (image.renditions || []).forEach(rendition => {
+    const file = format ? (rendition.variants || {})[format] : rendition;
+    if (file) {
+      candidates.push(`${encodeURI(basePath + file.path)} ${rendition.width}w`);
+    }
+  });
+
+  return candidates.join(', ');
+}
+
+const IMAGE_SIZES = '(max-width: 600px) 100vw, (max-width: 1100px) 50vw, 400px';
+
+/**
+ * Builds srcset/sizes attributes for the JPEG <img>; empty if no renditions
+ */
+function responsiveImageAttributes(image, collectionId) {
+  const srcset = renditionSrcset(image, collectionId);
+  return srcset ? `srcset="${srcset}" sizes="${IMAGE_SIZES}"` : '';
+}
+
+/**
+ * URL of the default thumbnail's variant in a format, for images with no
+ * ladder rendition in that format (too small for the ladder); empty if none
+ */
+function thumbnailVariantSrc(image, collectionId, format) {
+  const file = (image.thumbnailVariants || {})[format];
+  return file ? encodeURI(`assets/images/gallery/${collectionId}/${file.path}`) : '';
+}
+
+/**
+ * Builds <source> elements for the AVIF/WebP variants, best format first,
+ * so the browser falls back to the JPEG <img> when it supports neither
+ */
+function modernImageSources(image, collectionId) {
+  return ['avif', 'webp']
+    .map(format => {
+      const srcset = renditionSrcset(image, collectionId, format) || thumbnailVariantSrc(image, collectionId, format);
+      return srcset ? `<source type="image/${format}" srcset="${srcset}" sizes="${IMAGE_SIZES}" />` : '';
+    })
+    .join('');
+}
+
+/**
+ * Inline style painting the image's placeholder preview and dominant color
+ * (from metadata.json) behind the <img> until its bytes arrive
+ */
+function placeholderStyle(image) {
+  const rules = [];
+  if (image.color) rules.push(`background-color: ${image.color}`);
+  if (image.placeholder) rules.push(`background-image: url('${image.placeholder}')`);
+  return rules.length ? `style="${rules.join('; ')}"` : '';
+}
@@ -0,0 +1,142 @@
+"""
+Synthetic photo corpora for the benchmarks.
+
+Each corpus is a folder of camera-sized JPEGs generated locally, so
+benchmark runs need no real photos and give the same files on every
+machine. The images mimic what a camera writes closely enough for decode,
+resize and encode timings to be realistic: a smooth low-frequency scene,
+mid-frequency texture and per-pixel sensor grain, saved at quality 92
+(about 3-4 bits per pixel, like an in-camera JPEG). EXIF corpora also
+carry a typical camera EXIF block (make/model, exposure, lens, GPS).
+
+Corpora are cached under PHOTOSITE_CACHE_DIR/benchmark-corpus (default
+~/.cache/photosite/benchmark-corpus) and only missing files are generated.
+"""
+
+import json
+import os
+from pathlib import Path
+
+from PIL import ExifTags, Image, ImageChops, ImageDraw, TiffImagePlugin
+
+CORPUS_DIR = Path(os.environ.get('PHOTOSITE_CACHE_DIR', Path.home() / '.cache' / 'photosite')) / 'benchmark-corpus'
+
+# Megapixels -> (width, height) of common 3:2 sensors
+SENSOR_SIZES = {
+    12: (4256, 2832),
+    24: (6000, 4000),
+    45: (8256, 5504),
+}
+
+JPEG_QUALITY = 92
+GRAIN_SIGMA = 6
+CORPUS_VERSION = 1
+
+
+def corpus_name(megapixels, exif):
+    """Folder name of a corpus, e.g. '24mp-exif'."""
+    return f"{megapixels}mp-{'exif' if exif else 'noexif'}"
+
+
+def camera_exif(index):
+    """A typical camera EXIF block (varies slightly per image)."""
+    exif = Image.Exif()
+    exif[ExifTags.Base.Make] = 'Nikon'
+    exif[ExifTags.Base.Model] = 'Nikon Z 7II'
+    exif[ExifTags.Base.Software] = 'Ver.01.10'
+    exif[ExifTags.Base.DateTime] = f'2025:03:14 18:{index % 60:02d}:11'
+    exif[ExifTags.Base.Orientation] = 1
+
+    details = exif.get_ifd(ExifTags.IFD.Exif)
+    details[ExifTags.Base.DateTimeOriginal] = f'2025:03:14 18:{index % 60:02d}:11'
+    details[ExifTags.Base.OffsetTimeOriginal] = '-06:00'
+    details[ExifTags.Base.ExposureTime] = TiffImagePlugin.IFDRational(1, 250)
+    details[ExifTags.Base.FNumber] = TiffImagePlugin.IFDRational(28, 10)
+    details[ExifTags.Base.ISOSpeedRatings] = 400
+    details[ExifTags.Base.FocalLength] = TiffImagePlugin.IFDRational(24 + index, 1)
+    details[ExifTags.Base.FocalLengthIn35mmFilm] = 24 + index
+    details[ExifTags.Base.LensModel] = 'NIKKOR Z 24-70mm f/2.8 S'
+
+    gps = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    gps[ExifTags.GPS.GPSLatitudeRef] = 'N'
+    gps[ExifTags.GPS.GPSLatitude] = (TiffImagePlugin.IFDRational(29, 1), TiffImagePlugin.IFDRational(15, 1),
+                                     TiffImagePlugin.IFDRational(30, 1))
+    gps[ExifTags.GPS.GPSLongitudeRef] = 'W'
+    gps[ExifTags.GPS.GPSLongitude] = (TiffImagePlugin.IFDRational(103, 1), TiffImagePlugin.IFDRational(15, 1),
+                                      TiffImagePlugin.IFDRational(0, 1))
+    return exif
+
+
+def synthetic_photo(size, seed):
+    """An RGB image of `size` with photo-like frequency content."""
+    import random
+
+    rng = random.Random(seed)
+    width, height = size
+
+    # Low-frequency scene: a coarse random color field, smoothly upscaled
+    coarse = Image.new('RGB', (max(2, width // 256), max(2, height // 256)))
+    coarse.putdata([tuple(rng.randrange(256) for _ in range(3))
+                    for _ in range(coarse.width * coarse.height)])
+    scene = coarse.resize(size, Image.Resampling.BICUBIC)
+
+    # A few hard-edged shapes (horizons, buildings, branches)
+    draw = ImageDraw.Draw(scene)
+    for _ in range(12):
+        x, y = rng.randrange(width), rng.randrange(height)
+        w, h = rng.randrange(width // 20, width // 3), rng.randrange(height // 20, height // 3)
+        fill = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle((x, y, x + w, y + h), fill=fill)
+        else:
+            draw.ellipse((x, y, x + w, y + h), fill=fill)
+
+    # Mid-frequency texture and per-pixel grain, centered on zero
+    texture = Image.effect_noise((max(1, width // 8), max(1, height // 8)), 24).resize(
+        size, Image.Resampling.BILINEAR)
+    grain = Image.effect_noise(size, GRAIN_SIGMA)
+    noise = ImageChops.add(texture, grain, offset=-128)
+    del texture, grain
+    return ImageChops.add(scene, Image.merge('RGB', (noise, noise, noise)), offset=-128)
+
+
+def ensure_corpus(megapixels, exif=True, count=3, root=CORPUS_DIR):
+    """
+    Create (if needed) and return a corpus folder laid out like a collection.
+
+    Returns:
+        Path: <root>/<name>, whose full-res/ holds `count` JPEGs
+    """
+    if megapixels not in SENSOR_SIZES:
+        raise ValueError(f"No sensor size for {megapixels} MP (choose from {sorted(SENSOR_SIZES)})")
+    corpus = Path(root) / corpus_name(megapixels, exif)
+    full_res = corpus / 'full-res'
+    full_res.mkdir(parents=True, exist_ok=True)
+
+    info_path = corpus / 'corpus.json'
+    info = {'version': CORPUS_VERSION, 'size': SENSOR_SIZES[megapixels],
+            'quality': JPEG_QUALITY, 'exif': exif}
+    if info_path.exists() and json.loads(info_path.read_text()) != info:
+        # Generated with other settings: start over
+        for stale in full_res.iterdir():
+            stale.unlink()
+
+    for index in range(count):
+        path = full_res / f'DSC_{index + 1:04d}.jpg'
+        if path.exists():
+            continue
+        img = synthetic_photo(SENSOR_SIZES[megapixels], seed=megapixels * 1000 + index)
+        options = {'quality': JPEG_QUALITY}
+        if exif:
+            options['exif'] = camera_exif(index)
+        partial = path.with_suffix('.part')
+        img.save(partial, 'JPEG', **options)
+        partial.replace(path)
+
+    info_path.write_text(json.dumps(info))
+    return corpus
+
+
+def corpus_images(corpus, count):
+    """The first `count` originals of a corpus."""
+    return sorted((Path(corpus) / 'full-res').glob('*.jpg'))[:count]
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Image pipeline benchmarks.
+
+Times the thumbnail and ingest paths of generate-thumbnails.py and
+scripts/generate-collection.py on synthetic camera-sized corpora (see
+corpus.py) and writes the results as JSON, so runs on different commits
+can be compared.
+
+USAGE:
+  python benchmarks/run_benchmarks.py                  # full matrix
+  python benchmarks/run_benchmarks.py --quick          # 12 MP, 2 images, smoke run
+  python benchmarks/run_benchmarks.py --sizes 24 45 --workers 1 4 \\
+      --filters lanczos bicubic --count 6 --output before.json
+  python benchmarks/run_benchmarks.py --compare before.json after.json
+
+BENCHMARKS:
+  create_thumbnail       one 800px thumbnail per original, per resample filter
+  generate_thumbnails    process_galleries() on a fresh collection (thumbnail
+                         plus rendition ladder), per worker count
+  get_image_hash         SHA-256 of every original
+  find_new_images        ingest_collection() on a fresh collection: "cold"
+                         (everything new: hash, dHash, renditions) and
+                         "warm" (second run, nothing to do)
+  draft_difference       draft decode vs full-decode LANCZOS resize of every
+                         original at the thumbnail and smallest ladder
+                         widths; the case fails if any mean pixel difference
+                         exceeds DRAFT_MAX_MEAN_DIFF (photosite.imaging)
+  quality_search         WebP/AVIF quality search on the probe rendition of
+                         every original, with the formats' fast
+                         'search_options' ("search") and their final
+                         'options' ("final"); the case fails if the picked
+                         qualities differ by more than
+                         SEARCH_QUALITY_TOLERANCE (photosite.encoding)
+
+Every case runs in its own Python process, so peak RSS is per case; for
+worker pools the largest worker's peak is reported separately. Corpora are
+generated in a child process as well, because Linux carries a process's
+peak RSS across exec and the runner must stay small. Originals are read
+from the page cache after the first case, so timings measure CPU work
+rather than disk speed.
+
+OUTPUT (JSON):
+  {"environment": {...}, "results": [{"benchmark", "corpus", "megapixels",
+   "exif", "filter", "workers", "images", "seconds", "images_per_sec",
+   "megapixels_per_sec", "input_bytes", "bytes_written", "peak_rss_mb",
+   "peak_worker_rss_mb", "max_draft_difference",
+   "max_quality_difference"}, ...]}
+"""
+
+import argparse
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCHMARK_DIR.parent
+RESULTS_DIR = BENCHMARK_DIR / 'results'
+
+sys.path.insert(0, str(BENCHMARK_DIR))
+sys.path.insert(0, str(REPO_DIR / 'scripts'))
+from corpus import CORPUS_DIR, SENSOR_SIZES, corpus_images, corpus_name, ensure_corpus
+
+BENCHMARKS = ('create_thumbnail', 'generate_thumbnails', 'get_image_hash', 'find_new_images',
+              'draft_difference', 'quality_search')
+FILTERS = ('lanczos', 'bicubic', 'bilinear', 'box')
+DEFAULT_COUNT = 4
+DEFAULT_WORKERS = (1, 2, 4)
+
+# Results whose images/sec drop by more than this fraction are regressions
+DEFAULT_THRESHOLD = 0.10
+
+
+def load_script(path, name):
+    """Import one of the repo's hyphenated scripts as a module."""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so process-pool workers can unpickle its functions
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    """(this process, largest finished child) peak resident set size in MB, or None."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None, None
+    scale = 1 if sys.platform == 'darwin' else 1024  # bytes on macOS, KB elsewhere
+    self_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    child_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return round(self_peak / 2 ** 20, 1), (round(child_peak / 2 ** 20, 1) if child_peak else None)
+
+
+def folder_bytes(folder):
+    """Total size of every file under folder."""
+    return sum(p.stat().st_size for p in Path(folder).rglob('*') if p.is_file())
+
+
+def make_collection(corpus, images, workdir):
+    """A fresh collection folder whose full-res/ links to the corpus originals."""
+    collection = Path(workdir) / 'gallery' / Path(corpus).name
+    full_res = collection / 'full-res'
+    full_res.mkdir(parents=True)
+    for image in images:
+        try:
+            os.symlink(image, full_res / image.name)
+        except OSError:
+            shutil.copy2(image, full_res / image.name)
+    return collection
+
+
+# ============================================
+# CASES (each runs in a child process)
+# ============================================
+
+def run_case(case):
+    """Run one benchmark case in this process and return its result dict."""
+    from PIL import Image
+
+    images = corpus_images(case['corpus'], case['count'])
+    workdir = Path(tempfile.mkdtemp(prefix='photosite-bench-'))
+    timings = {}
+    max_difference = None
+    max_quality_difference = None
+    try:
+        if case['benchmark'] == 'create_thumbnail':
+            thumbnails = load_script(REPO_DIR / 'generate-thumbnails.py', 'generate_thumbnails')
+            resample = Image.Resampling[case['filter'].upper()]
+            start = time.perf_counter()
+            for image in images:
+                if not thumbnails.create_thumbnail(image, workdir / image.name, resample=resample):
+                    raise RuntimeError(f"create_thumbnail failed for {image.name}")
+            timings[None] = (time.perf_counter() - start, folder_bytes(workdir))
+
+        elif case['benchmark'] == 'generate_thumbnails':
+            thumbnails = load_script(REPO_DIR / 'generate-thumbnails.py', 'generate_thumbnails')
+            collection = make_collection(case['corpus'], images, workdir)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                failures = thumbnails.process_galleries([collection], case['workers'])
+            timings[None] = (time.perf_counter() - start, folder_bytes(collection / 'thumbnails'))
+            if failures:
+                raise RuntimeError(f"{len(failures)} image(s) failed: {failures[0][1]}")
+
+        elif case['benchmark'] == 'get_image_hash':
+            collection_tool = load_script(REPO_DIR / 'scripts' / 'generate-collection.py', 'generate_collection')
+            start = time.perf_counter()
+            for image in images:
+                collection_tool.get_image_hash(image)
+            timings[None] = (time.perf_counter() - start, 0)
+
+        elif case['benchmark'] == 'find_new_images':
+            collection_tool = load_script(REPO_DIR / 'scripts' / 'generate-collection.py', 'generate_collection')
+            collection = make_collection(case['corpus'], images, workdir)
+            for phase in ('cold', 'warm'):
+                before = folder_bytes(collection)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    new_images, _, _ = collection_tool.ingest_collection(collection)
+                timings[phase] = (time.perf_counter() - start, folder_bytes(collection) - before)
+                if len(new_images) != len(images):
+                    raise RuntimeError(f"expected {len(images)} new images, got {len(new_images)}")
+
+        elif case['benchmark'] == 'draft_difference':
+            from photosite.imaging import DRAFT_MAX_MEAN_DIFF, draft_difference
+            from photosite.renditions import RENDITION_WIDTHS, THUMBNAIL_WIDTH
+            start = time.perf_counter()
+            differences = [(draft_difference(image, width), image, width)
+                           for image in images for width in (THUMBNAIL_WIDTH, min(RENDITION_WIDTHS))]
+            timings[None] = (time.perf_counter() - start, 0)
+            max_difference, worst, width = max(differences, key=lambda d: d[0])
+            if max_difference > DRAFT_MAX_MEAN_DIFF:
+                raise RuntimeError(f"draft decode of {worst.name} at {width}px differs from a full decode "
+                                   f"by {max_difference:.2f} (limit {DRAFT_MAX_MEAN_DIFF})")
+
+        elif case['benchmark'] == 'quality_search':
+            from photosite.encoding import SEARCH_QUALITY_TOLERANCE, available_formats, pick_qualities
+            from photosite.renditions import QUALITY_PROBE_WIDTH, RENDITION_QUALITY
+            probes = []
+            for image in images:
+                with Image.open(image) as img:
+                    img = img.convert('RGB')
+                    height = round(img.height * QUALITY_PROBE_WIDTH / img.width)
+                    probes.append((image, img.resize((QUALITY_PROBE_WIDTH, height), Image.Resampling.LANCZOS)))
+            picked = {}
+            for phase, options in (('search', 'search_options'), ('final', 'options')):
+                start = time.perf_counter()
+                picked[phase] = [pick_qualities(probe, RENDITION_QUALITY, options=options) for _, probe in probes]
+                timings[phase] = (time.perf_counter() - start, 0)
+            differences = [(abs(searched[fmt] - final[fmt]), image, fmt)
+                           for (image, _), searched, final in zip(probes, picked['search'], picked['final'])
+                           for fmt in available_formats()]
+            if differences:
+                max_quality_difference, worst, fmt = max(differences, key=lambda d: d[0])
+                if max_quality_difference > SEARCH_QUALITY_TOLERANCE:
+                    raise RuntimeError(f"{fmt} quality search on {worst.name} picked a quality "
+                                       f"{max_quality_difference} away from the final settings' "
+                                       f"(limit {SEARCH_QUALITY_TOLERANCE})")
+        else:
+            raise ValueError(f"Unknown benchmark {case['benchmark']}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    rss, worker_rss = peak_rss_mb()
+    input_bytes = sum(image.stat().st_size for image in images)
+    megapixels = len(images) * SENSOR_SIZES[case['megapixels']][0] * SENSOR_SIZES[case['megapixels']][1] / 1e6
+    results = []
+    for phase, (seconds, written) in timings.items():
+        results.append({
+            'benchmark': case['benchmark'] + (f' ({phase})' if phase else ''),
+            'corpus': corpus_name(case['megapixels'], case['exif']),
+            'megapixels': case['megapixels'],
+            'exif': case['exif'],
+            'filter': case.get('filter'),
+            'workers': case.get('workers', 1),
+            'images': len(images),
+            'seconds': round(seconds, 4),
+            'images_per_sec': round(len(images) / seconds, 3) if seconds else None,
+            'megapixels_per_sec': round(megapixels / seconds, 2) if seconds else None,
+            'input_bytes': input_bytes,
+            'bytes_written': written,
+            'peak_rss_mb': rss,
+            'peak_worker_rss_mb': worker_rss if case.get('workers', 1) > 1 else None,
+            'max_draft_difference': round(max_difference, 3) if max_difference is not None else None,
+            'max_quality_difference': max_quality_difference,
+        })
+    return results
+
+
+def spawn_case(case, option='--case'):
+    """Run a case in a fresh interpreter; returns its results (or raises)."""
+    completed = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), option, json.dumps(case)],
+        capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip()
+                           else f"exit status {completed.returncode}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def plan_cases(args, corpora):
+    """Every (benchmark, corpus, filter/workers) combination to run."""
+    cases = []
+    for benchmark in args.benchmarks:
+        for megapixels, exif, corpus in corpora:
+            base = {'benchmark': benchmark, 'corpus': str(corpus), 'megapixels': megapixels,
+                    'exif': exif, 'count': args.count}
+            if benchmark == 'create_thumbnail':
+                cases.extend(dict(base, filter=name) for name in args.filters)
+            elif benchmark == 'generate_thumbnails':
+                cases.extend(dict(base, workers=workers) for workers in args.workers)
+            else:
+                cases.append(base)
+    return cases
+
+
+# ============================================
+# REPORTING
+# ============================================
+
+def environment():
+    """Machine and code version the results were measured on."""
+    from PIL import __version__ as pillow_version
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    cwd=REPO_DIR, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pillow': pillow_version,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def result_key(result):
+    return (result['benchmark'], result['corpus'], result.get('filter'), result.get('workers'))
+
+
+def describe(result):
+    parts = [result['benchmark'], result['corpus']]
+    if result.get('filter'):
+        parts.append(result['filter'])
+    if result['benchmark'].startswith('generate_thumbnails'):
+        parts.append(f"{result['workers']} worker(s)")
+    return ' / '.join(parts)
+
+
+def print_result(result):
+    rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else 'n/a'
+    if result.get('peak_worker_rss_mb'):
+        rss += f" (workers {result['peak_worker_rss_mb']:.0f} MB)"
+    print(f"  {describe(result):<52} {result['images_per_sec'] or 0:8.2f} img/s "
+          f"{result['megapixels_per_sec'] or 0:8.1f} MP/s  {result['bytes_written'] / 1e6:8.2f} MB out  "
+          f"peak {rss}" + (f"  max diff {result['max_draft_difference']:.2f}"
+                           if result.get('max_draft_difference') is not None else '')
+          + (f"  max quality diff {result['max_quality_difference']}"
+             if result.get('max_quality_difference') is not None else ''))
+
+
+def compare(baseline_path, current_path, threshold):
+    """Print images/sec changes between two result files; returns the number of regressions."""
+    baseline = json.loads(Path(baseline_path).read_text())
+    current = json.loads(Path(current_path).read_text())
+    before = {result_key(r): r for r in baseline['results']}
+
+    print(f"Baseline: {baseline['environment'].get('commit')}  Current: {current['environment'].get('commit')}")
+    regressions = 0
+    for result in current['results']:
+        old = before.get(result_key(result))
+        if not old or not old['images_per_sec'] or not result['images_per_sec']:
+            continue
+        change = result['images_per_sec'] / old['images_per_sec'] - 1
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"  {describe(result):<52} {old['images_per_sec']:8.2f} -> "
+              f"{result['images_per_sec']:8.2f} img/s ({change:+.1%}){flag}")
+    return regressions
+
+
+def parse_args():
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(description="Benchmark the PhotoSite image pipeline")
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help="Benchmarks to run (default: all)")
+    parser.add_argument('--sizes', nargs='+', type=int, choices=sorted(SENSOR_SIZES),
+                        default=sorted(SENSOR_SIZES), help="Corpus sizes in megapixels (default: all)")
+    parser.add_argument('--exif', choices=('with', 'without', 'both'), default='both',
+                        help="Corpora with camera EXIF, without, or both (default: both)")
+    parser.add_argument('--count', type=int, default=DEFAULT_COUNT,
+                        help=f"Images per corpus (default: {DEFAULT_COUNT})")
+    parser.add_argument('--workers', nargs='+', type=int, default=list(DEFAULT_WORKERS),
+                        help="Worker counts for generate_thumbnails (default: 1 2 4)")
+    parser.add_argument('--filters', nargs='+', choices=FILTERS, default=['lanczos', 'bicubic', 'bilinear'],
+                        help="Resample filters for create_thumbnail (default: lanczos bicubic bilinear)")
+    parser.add_argument('--corpus-dir', type=Path, default=CORPUS_DIR,
+                        help=f"Where synthetic corpora are cached (default: {CORPUS_DIR})")
+    parser.add_argument('--output', type=Path,
+                        help="Result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--quick', action='store_true',
+                        help="Smoke run: 12 MP with EXIF, 2 images, 1 worker, LANCZOS only")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="Compare two result files instead of running")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Slowdown that counts as a regression (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--prepare', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    """Main execution function."""
+    args = parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return 0
+    if args.prepare:
+        print(json.dumps(str(ensure_corpus(**json.loads(args.prepare)))))
+        return 0
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+        return 1 if regressions else 0
+
+    if args.quick:
+        args.sizes, args.exif, args.count = [12], 'with', 2
+        args.workers, args.filters = [1], ['lanczos']
+
+    exif_options = {'with': [True], 'without': [False], 'both': [True, False]}[args.exif]
+    print("Preparing corpora...")
+    corpora = []
+    for megapixels in args.sizes:
+        for exif in exif_options:
+            corpus = spawn_case({'megapixels': megapixels, 'exif': exif, 'count': args.count,
+                                 'root': str(args.corpus_dir)}, option='--prepare')
+            corpora.append((megapixels, exif, corpus))
+            print(f"  {corpus_name(megapixels, exif)}: {args.count} image(s) in {corpus}")
+
+    env = environment()
+    results = []
+    failures = []
+    cases = plan_cases(args, corpora)
+    print(f"\nRunning {len(cases)} case(s) on {env['cpu_count']} CPU(s)...")
+    for case in cases:
+        try:
+            case_results = spawn_case(case)
+        except RuntimeError as e:
+            label = ' / '.join(str(case.get(k)) for k in ('benchmark', 'megapixels', 'filter', 'workers') if case.get(k))
+            print(f"  ✗ {label}: {e}")
+            failures.append({'case': case, 'error': str(e)})
+            continue
+        for result in case_results:
+            print_result(result)
+        results.extend(case_results)
+
+    output = args.output or RESULTS_DIR / f"{env['commit'] or 'results'}{'-dirty' if env['dirty'] else ''}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({'environment': env, 'results': results, 'failures': failures}, indent=2))
+    print(f"\nWrote {len(results)} result(s) to {output}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,26 +1,77 @@
 #!/usr/bin/env python3
 """
 PhotoSite Thumbnail Generator
-Converts full-resolution JPGs to optimized thumbnails for web galleries.
+Converts full-resolution JPGs to optimized thumbnails and responsive
+renditions for web galleries.
 
 USAGE:
   python generate-thumbnails.py
+  python generate-thumbnails.py --jobs 8     # use 8 worker processes
+  python generate-thumbnails.py --jobs 0     # one worker per CPU core
+  python generate-thumbnails.py --verify-draft   # check fast decode quality
+  python generate-thumbnails.py --watch    # rebuild images as they land
+  python generate-thumbnails.py --jobs 0 --memory-budget 3G   # cap total memory
+  python generate-thumbnails.py --profile  # run under cProfile
 
 REQUIREMENTS:
   pip install Pillow
+  pip install brotli rjsmin   (optional: .br copies, minified JS)
 
 WHAT IT DOES:
   - Scans all gallery folders for full-res images
-  - Creates 800px wide thumbnails (maintains aspect ratio)
+  - Creates 800px wide thumbnails (maintains aspect ratio) plus a ladder of
+    responsive renditions (320/640/1024/1600/2400px) in thumbnails/<width>/,
+    all from a single decode of each original
+  - Decodes JPEGs at reduced scale (libjpeg DCT scaling) before the final
+    LANCZOS resample, so 40-60 MP originals never need a full decode
   - Optimizes for web (quality 85, progressive JPEG)
-  - Preserves EXIF metadata
-  - Skips already-processed images
+  - Preserves EXIF metadata (on the 800px thumbnail)
+  - Records each rendition's size in the gallery's metadata.json (if any)
+    so the JS loaders can emit srcset/sizes, then refreshes gallery-index.json
+  - Names every rendition after a hash of its content, so browsers and CDNs
+    can cache it forever, and removes versions nothing refers to any more
+  - Writes minified .gz/.br copies of the generated JSON, JS, CSS and HTML
+    for hosts that serve precompressed files
+  - Skips images whose source and settings are unchanged since the last
+    run (tracked in each gallery's .build-manifest.json)
+  - Optionally spreads the work for every gallery across a process pool,
+    starting images only while their decode memory (estimated from the
+    file headers) fits in a memory budget; very large panoramas are
+    downscaled in strips, and ones that cannot fit at all are reported
+    instead of being decoded
+  - With --watch, keeps running and rebuilds just the originals that are
+    added or replaced in any full-res/ folder (inotify, or polling)
+  - Ends with a run report: time per stage (hash, decode, resize, encode,
+    JSON writes, ...), bytes read/written and cache hits, saved as JSON and
+    Chrome trace events (see photosite.instrument)
 """
 
 import os
+import sys
+import argparse
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
-from PIL import Image
-import PIL.ExifTags
+
+sys.path.insert(0, str(Path(__file__).parent / "scripts"))
+from photosite.compress import precompress_site
+from photosite.discovery import collection_folders, full_res_dir, source_images
+from photosite.encoding import available_formats
+from photosite.exif import update_metadata_capture
+from photosite.fingerprint import publish_assets
+from photosite.imaging import DRAFT_MAX_MEAN_DIFF, RESAMPLE_FILTER, draft_difference
+from photosite.instrument import add_report_arguments, drain, instrumented_run, merge, stage
+from photosite.manifest import BuildManifest
+from photosite.memory import budgeted_map, configure_budget, estimate_decode, format_size, memory_budget, parse_size
+from photosite.pipeline import SourceFile, refresh_images
+from photosite.prerender import prerender_site
+from photosite.renditions import (
+    QUALITIES_FIELD, RENDITION_SETTINGS, RENDITION_WIDTHS, THUMBNAIL_WIDTH, decode_ladder,
+    rendition_qualities, thumbnail_path, update_metadata_renditions, write_renditions, write_thumbnail,
+)
+from photosite.search_index import build_search_index
+from photosite.site_index import build_gallery_index
+from photosite.storage import folder_lock
+from photosite.watch import DEBOUNCE_SECONDS, watch_galleries
 
 # ============================================
 # CONFIGURATION
@@ -30,19 +81,15 @@ import PIL.ExifTags
 BASE_DIR = Path(__file__).parent
 GALLERY_DIR = BASE_DIR / "assets" / "images" / "gallery"
 
-# Thumbnail settings
-THUMBNAIL_WIDTH = 800  # Max width in pixels
-THUMBNAIL_QUALITY = 85  # JPEG quality (1-100)
-THUMBNAIL_FORMAT = "JPEG"
-
-# Supported image formats
-SUPPORTED_FORMATS = ['.jpg', '.jpeg', '.JPG', '.JPEG']
+# Thumbnail and rendition settings (widths, JPEG quality, formats) live in
+# photosite.renditions and which files count as originals in
+# photosite.discovery, so generate-collection.py builds identical outputs
 
 # ============================================
 # FUNCTIONS
 # ============================================
 
-def create_thumbnail(source_path, dest_path, width=THUMBNAIL_WIDTH):
+def create_thumbnail(source_path, dest_path, width=THUMBNAIL_WIDTH, resample=RESAMPLE_FILTER):
     """
     Create optimized thumbnail from source image.
     
@@ -50,42 +97,14 @@ def create_thumbnail(source_path, dest_path, width=THUMBNAIL_WIDTH):
         source_path: Path to full-resolution image
         dest_path: Path where thumbnail should be saved
         width: Maximum width of thumbnail in pixels
+        resample: Pillow resampling filter for the final resize
     
     Returns:
         bool: True if successful, False otherwise
     """
     try:
-        # Open image and preserve EXIF data
-        with Image.open(source_path) as img:
-            # Get EXIF data before processing
-            exif = img.info.get('exif')
-            
-            # Calculate new dimensions (maintain aspect ratio)
-            aspect_ratio = img.height / img.width
-            new_width = width
-            new_height = int(width * aspect_ratio)
-            
-            # Resize with high-quality resampling
-            img_resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Convert RGBA to RGB if needed (for JPEG compatibility)
-            if img_resized.mode == 'RGBA':
-                img_resized = img_resized.convert('RGB')
-            
-            # Save with optimization
-            save_kwargs = {
-                'format': THUMBNAIL_FORMAT,
-                'quality': THUMBNAIL_QUALITY,
-                'optimize': True,
-                'progressive': True  # Progressive JPEG for better web loading
-            }
-            
-            # Include EXIF if available
-            if exif:
-                save_kwargs['exif'] = exif
-            
-            img_resized.save(dest_path, **save_kwargs)
-            
+        # Same decode, EXIF and JPEG settings as the rendition ladder
+        write_thumbnail(source_path, dest_path, width, resample=resample)
         return True
         
     except Exception as e:
@@ -93,84 +112,358 @@ def create_thumbnail(source_path, dest_path, width=THUMBNAIL_WIDTH):
         return False
 
 
+def thumbnail_job(job):
+    """
+    Process-pool worker: build one image's thumbnail and renditions.
+    
+    Args:
+        job: (source_path, gallery_path, verify_draft, qualities) tuple; when
+             verify_draft is set the draft-decoded result is compared
+             against a full-decode LANCZOS resize; qualities are the
+             WebP/AVIF qualities cached in the manifest (None if not known)
+    
+    Returns:
+        tuple: (source_path, fields, sha256, qualities, error, recorded)
+               where fields is the build_renditions() result, qualities the
+               rendition_qualities() used, error is None on success or a
+               short message describing the failure, and recorded holds the
+               stage timings of a pool worker (photosite.instrument.drain())
+    """
+    source_path, gallery_path, verify_draft, qualities = job
+    fields = sha256 = error = None
+    try:
+        # Read the original once: hash and decode the same mapped bytes
+        with SourceFile(source_path) as source:
+            sha256 = source.sha256()
+            decoded = decode_ladder(source.stream())
+        qualities = rendition_qualities(decoded, cached=qualities)
+        fields = write_renditions(decoded, gallery_path, source_path.name, qualities=qualities)
+        del decoded
+        if verify_draft:
+            with stage('verify_draft'):
+                difference = draft_difference(source_path, THUMBNAIL_WIDTH)
+            if difference > DRAFT_MAX_MEAN_DIFF:
+                fields = sha256 = None
+                error = (
+                    f"draft decode differs from full decode by {difference:.2f} "
+                    f"(limit {DRAFT_MAX_MEAN_DIFF})"
+                )
+    except Exception as e:
+        fields = sha256 = None
+        error = f"{type(e).__name__}: {e}"
+    return source_path, fields, sha256, qualities, error, drain()
+
+
 def get_file_size_mb(path):
     """Get file size in megabytes."""
     return path.stat().st_size / (1024 * 1024)
 
 
-def process_gallery_folder(gallery_path):
+def plan_gallery_folder(gallery_path, manifest, verify_draft=False):
     """
-    Process all images in a gallery folder.
+    Find the images in a gallery folder whose renditions are stale.
+    
+    Renditions are rebuilt when the source content or RENDITION_SETTINGS
+    changed since they were recorded in the manifest. Unchanged sources
+    are skipped from their size/mtime alone, without being read.
     
     Args:
         gallery_path: Path object pointing to gallery folder
                       (e.g., assets/images/gallery/big-bend-2025/)
-    """
-    full_res_dir = gallery_path / "full-res"
-    thumbnails_dir = gallery_path / "thumbnails"
+        manifest: BuildManifest for the gallery folder
+        verify_draft: Check each new thumbnail against a full decode
     
+    Returns:
+        tuple: (jobs, skipped) where jobs is a list of (source_path,
+               gallery_path, verify_draft, qualities) tuples still to be built
+    """
     # Check if full-res directory exists
-    if not full_res_dir.exists():
+    if not full_res_dir(gallery_path).exists():
         print(f"  ⚠️  No full-res folder found in {gallery_path.name}")
-        return
-    
-    # Create thumbnails directory if it doesn't exist
-    thumbnails_dir.mkdir(exist_ok=True)
+        return [], 0
     
-    # Find all images in full-res folder
-    images = [
-        f for f in full_res_dir.iterdir()
-        if f.suffix in SUPPORTED_FORMATS
-    ]
+    # Find all originals in full-res folder (sorted so output order is stable)
+    images = source_images(gallery_path)
     
     if not images:
         print(f"  ℹ️  No images found in {gallery_path.name}/full-res/")
-        return
+        return [], 0
     
-    print(f"\n📁 Processing: {gallery_path.name}")
+    print(f"\n📁 Scanning: {gallery_path.name}")
     print(f"   Found {len(images)} image(s)")
     
-    processed = 0
+    jobs = []
     skipped = 0
     
     for img_path in images:
-        # Determine thumbnail path
-        thumb_path = thumbnails_dir / img_path.name
-        
-        # Skip if thumbnail already exists
-        if thumb_path.exists():
-            print(f"  ⏭️  Skipping {img_path.name} (thumbnail exists)")
+        # Skip if the renditions are up to date with source and settings
+        thumb_path = thumbnail_path(gallery_path, img_path.name)
+        if manifest.is_current(img_path, 'renditions', RENDITION_SETTINGS, thumb_path):
+            print(f"  ⏭️  Skipping {img_path.name} (renditions up to date)")
             skipped += 1
             continue
         
-        # Create thumbnail
-        print(f"  🔄 Creating thumbnail: {img_path.name}")
+        jobs.append((img_path, gallery_path, verify_draft, manifest.derived(img_path, QUALITIES_FIELD)))
+    
+    return jobs, skipped
+
+
+def job_memory(job):
+    """Estimated peak memory of a thumbnail job, from the original's headers."""
+    try:
+        return estimate_decode(job[0], (*RENDITION_WIDTHS, THUMBNAIL_WIDTH), available_formats())
+    except Exception:
+        # Unreadable originals fail quickly in the worker
+        return 0
+
+
+def run_thumbnail_jobs(jobs, workers=1):
+    """
+    Run thumbnail jobs, yielding results in submission order.
+    
+    With workers > 1 the jobs are spread over a process pool, and a job
+    only starts while the estimated decode memory of the running ones fits
+    in the memory budget (photosite.memory); results are still yielded in
+    the order the jobs were given, so progress output stays grouped by
+    gallery.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        yield from map(thumbnail_job, jobs)
+        return
+    
+    with stage('plan_memory'):
+        costs = [job_memory(job) for job in jobs]
+    yield from budgeted_map(thumbnail_job, jobs, costs, min(workers, len(jobs)))
+
+
+def update_gallery_metadata(gallery_path, built=None):
+    """
+    Write rendition sizes and EXIF/IPTC fields into a gallery's metadata.json.
+    
+    Args:
+        gallery_path: Path to gallery folder
+        built: filename -> build_renditions() fields for images built this run
+    """
+    if update_metadata_renditions(gallery_path, built):
+        print(f"  📝 Updated rendition sizes in {gallery_path.name}/metadata.json")
+    if update_metadata_capture(gallery_path):
+        print(f"  📝 Updated EXIF/IPTC fields in {gallery_path.name}/metadata.json")
+
+
+@contextmanager
+def gallery_locks(gallery_folders):
+    """
+    Hold the folder_lock() of every gallery folder for the duration of the block.
+    
+    Locks are taken in the order given (collection_folders() sorts them),
+    so two runs never wait on each other crosswise. Nesting is fine: the
+    locks are re-entrant.
+    """
+    with ExitStack() as locks:
+        for gallery in gallery_folders:
+            locks.enter_context(folder_lock(
+                gallery, log=lambda level, message: print(f"  ⏳ {message.strip()}")))
+        yield
+
+
+def refresh_site_files():
+    """
+    Rebuild everything derived from the galleries' metadata.json files.
+    
+    The gallery and search indexes and pre-rendered pages are rewritten,
+    then outputs are published under content-hashed names (removing old
+    versions) and precompressed. Run it under gallery_locks() so a
+    concurrent run cannot change metadata.json or renditions midway.
+    """
+    log = lambda level, message: print(message)
+    build_gallery_index(GALLERY_DIR, log=log)
+    build_search_index(GALLERY_DIR, log=log)
+    prerender_site(GALLERY_DIR, log=log)
+    publish_assets(GALLERY_DIR, log=log)
+    precompress_site(GALLERY_DIR, log=log)
+
+
+def process_galleries(gallery_folders, workers=1, verify_draft=False):
+    """
+    Build stale thumbnails and renditions for several gallery folders in one pass.
+    
+    All folders are planned first, then every pending image is pushed
+    through a single pool of `workers` processes.
+    
+    Args:
+        gallery_folders: List of gallery folder Paths
+        workers: Number of worker processes (1 = run in this process)
+        verify_draft: Check each new thumbnail against a full decode
+    
+    Returns:
+        list: (source_path, error) tuples for every image that failed
+    """
+    # Hold every gallery's lock so a concurrent run cannot interleave
+    # manifest and metadata.json updates
+    with gallery_locks(gallery_folders):
+        jobs = []
+        skipped = {}
+        manifests = {}
+        for gallery in gallery_folders:
+            manifests[gallery] = BuildManifest.load(gallery)
+            gallery_jobs, gallery_skipped = plan_gallery_folder(
+                gallery, manifests[gallery], verify_draft)
+            jobs.extend(gallery_jobs)
+            skipped[gallery] = gallery_skipped
+    
+        if not jobs:
+            for gallery, manifest in manifests.items():
+                manifest.save()
+                update_gallery_metadata(gallery)
+            print("\n  ✅ Nothing to do: all thumbnails are up to date")
+            return []
+    
+        print(f"\n🔄 Creating {len(jobs)} thumbnail(s) with {workers} worker(s)")
+    
+        processed = {}
+        built = {gallery: {} for gallery in gallery_folders}
+        failures = []
+        current_gallery = None
+    
+        results = run_thumbnail_jobs(jobs, workers)
+        for index, (img_path, fields, sha256, qualities, error, recorded) in enumerate(results, 1):
+            merge(recorded)
+            gallery = img_path.parent.parent
+            if gallery != current_gallery:
+                current_gallery = gallery
+                print(f"\n📁 Processing: {gallery.name}")
         
-        original_size = get_file_size_mb(img_path)
-        success = create_thumbnail(img_path, thumb_path)
+            if error:
+                print(f"  ❌ [{index}/{len(jobs)}] ERROR processing {img_path.name}: {error}")
+                failures.append((img_path, error))
+                continue
         
-        if success:
-            thumbnail_size = get_file_size_mb(thumb_path)
+            original_size = get_file_size_mb(img_path)
+            thumbnail_size = get_file_size_mb(thumbnail_path(gallery, img_path.name))
             compression_ratio = (1 - thumbnail_size / original_size) * 100
-            
-            print(f"     ✅ {original_size:.2f}MB → {thumbnail_size:.2f}MB "
-                  f"({compression_ratio:.0f}% reduction)")
-            processed += 1
-        else:
-            processed += 0
+            widths = "/".join(str(r['width']) for r in fields['renditions'])
+        
+            print(f"  ✅ [{index}/{len(jobs)}] {img_path.name}: "
+                  f"{original_size:.2f}MB → {thumbnail_size:.2f}MB "
+                  f"({compression_ratio:.0f}% reduction), renditions {widths or 'none'}")
+            manifests[gallery].record(img_path, 'renditions', RENDITION_SETTINGS, sha256)
+            manifests[gallery].set_derived(img_path, QUALITIES_FIELD, qualities)
+            built[gallery][img_path.name] = fields
+            processed[gallery] = processed.get(gallery, 0) + 1
+    
+        for gallery, manifest in manifests.items():
+            manifest.prune()
+            manifest.save()
+            update_gallery_metadata(gallery, built[gallery])
+    
+        print()
+        for gallery in gallery_folders:
+            print(f"  ✅ {gallery.name}: {processed.get(gallery, 0)} created, "
+                  f"{skipped.get(gallery, 0)} skipped")
     
-    print(f"  ✅ Complete: {processed} created, {skipped} skipped")
+        return failures
+
+
+def process_gallery_folder(gallery_path, workers=1):
+    """
+    Process all images in a gallery folder.
+    
+    Args:
+        gallery_path: Path object pointing to gallery folder
+                      (e.g., assets/images/gallery/big-bend-2025/)
+        workers: Number of worker processes (1 = run in this process)
+    """
+    return process_galleries([gallery_path], workers)
+
+
+def process_watch_batch(batch):
+    """
+    Rebuild the renditions of images that changed while watching.
+    
+    Only the images in the batch are read; the gallery index and
+    pre-rendered pages are refreshed afterwards.
+    
+    Args:
+        batch: {gallery folder Path: [changed image Paths]} from watch_galleries
+    """
+    log = lambda level, message: print(message)
+    with gallery_locks(collection_folders(GALLERY_DIR)):
+        for gallery, images in batch.items():
+            print(f"\n📁 Processing: {gallery.name} ({len(images)} changed)")
+            built = refresh_images(gallery, images, log=log)
+            if update_metadata_renditions(gallery, built):
+                print(f"  📝 Updated {gallery.name}/metadata.json")
+        refresh_site_files()
 
 
 # ============================================
 # MAIN EXECUTION
 # ============================================
 
+def parse_args():
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(
+        description="Generate web thumbnails for every gallery folder"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes to use (0 = one per CPU core, default: 1)"
+    )
+    parser.add_argument(
+        "--verify-draft",
+        action="store_true",
+        help="Compare each new thumbnail against a full-decode LANCZOS resize "
+             f"and report images that differ by more than {DRAFT_MAX_MEAN_DIFF}"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the initial pass, keep running and rebuild images as they "
+             "are added to or replaced in any full-res/ folder"
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="With --watch, poll for changes instead of using inotify"
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEBOUNCE_SECONDS,
+        help="With --watch, seconds a file must stop changing before it is "
+             f"read (default: {DEBOUNCE_SECONDS:g})"
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=parse_size,
+        help="Memory the run may use, e.g. 3G or 2500M; workers only start "
+             "images whose estimated decode memory fits (default: "
+             "$PHOTOSITE_MEMORY_BUDGET, else 75%% of RAM)"
+    )
+    add_report_arguments(parser)
+    return parser.parse_args()
+
+
 def main():
     """Main execution function."""
+    args = parse_args()
+    with instrumented_run("generate-thumbnails", args.report, args.trace_memory, args.profile,
+                          log=lambda level, message: print(f"📊 {message}")):
+        run(args)
+
+
+def run(args):
+    """Generate thumbnails for every gallery folder, as configured by args."""
+    workers = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    if args.memory_budget:
+        configure_budget(args.memory_budget)
+    
     print("=" * 60)
     print("PhotoSite Thumbnail Generator")
     print("=" * 60)
+    print(f"🧠 Memory budget: {format_size(memory_budget())}")
     
     # Check if gallery directory exists
     if not GALLERY_DIR.exists():
@@ -178,11 +471,8 @@ def main():
         print("   Make sure you're running this script from the PhotoSite root directory.")
         return
     
-    # Find all gallery subfolders
-    gallery_folders = [
-        f for f in GALLERY_DIR.iterdir()
-        if f.is_dir()
-    ]
+    # Find all gallery subfolders with originals
+    gallery_folders = collection_folders(GALLERY_DIR)
     
     if not gallery_folders:
         print(f"\n⚠️  No gallery folders found in {GALLERY_DIR}")
@@ -192,10 +482,18 @@ def main():
     for folder in gallery_folders:
         print(f"  - {folder.name}")
     
-    # Process each gallery folder
-    total_processed = 0
-    for gallery in gallery_folders:
-        process_gallery_folder(gallery)
+    # Process every gallery folder through one shared worker pool, keeping
+    # the locks until the site files have picked up the new metadata.json
+    with gallery_locks(gallery_folders):
+        failures = process_galleries(gallery_folders, workers, args.verify_draft)
+        refresh_site_files()
+    
+    if failures:
+        print("\n" + "=" * 60)
+        print(f"❌ {len(failures)} image(s) failed:")
+        print("=" * 60)
+        for img_path, error in failures:
+            print(f"  - {img_path.parent.parent.name}/{img_path.name}: {error}")
     
     print("\n" + "=" * 60)
     print("✅ Thumbnail generation complete!")
@@ -205,6 +503,11 @@ def main():
     print("2. Commit thumbnails to Git (they're small enough)")
     print("3. Consider hosting full-res images on Cloudflare R2/Images")
     print("4. Update your HTML to load from thumbnails/ for gallery grids")
+    
+    if args.watch:
+        print("\n" + "=" * 60)
+        watch_galleries(GALLERY_DIR, process_watch_batch, debounce=args.debounce,
+                        polling=args.poll, log=lambda level, message: print(f"👀 {message}"))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Build Site Script
+Regenerates the build artifacts derived from the collections' metadata.json
+files and originals. Every stage is incremental and only rewrites files
+whose content changed, so it is cheap to run after any edit.
+
+Usage:
+    python3 scripts/build-site.py            (run every stage)
+    python3 scripts/build-site.py index      (run selected stages)
+
+Stages:
+    exif    EXIF/IPTC fields (capture date, camera, lens, exposure, GPS,
+            keywords, ...) in every metadata.json, read from the originals'
+            JPEG headers only
+    index   assets/images/gallery/gallery-index.json - all collections,
+            a flattened image list and a tag -> image inverted index,
+            used by the home and browse pages
+    search  assets/images/gallery/search/ - the full-text search index of
+            the browse page, sharded by term prefix (run after index)
+    render  index.html, browse.html and collections/<id>.html with the
+            galleries pre-rendered from the index (run after index)
+    assets  remove content-fingerprinted renditions and index versions that
+            nothing refers to any more, and write assets/cache-manifest.json
+            listing the files safe to serve as immutable (run after render)
+    compress
+            minified .gz and .br siblings of every served JSON, JS, CSS and
+            HTML file, for hosts that serve precompressed files (run last
+            among the stages that write files)
+    variants
+            report near-duplicate originals (re-exports, Screen/Matte
+            versions) across all collections by perceptual hash
+
+generate-collection.py and generate-thumbnails.py run the relevant stages
+themselves whenever they change metadata.json. Like them, every run ends
+with a timing report (see photosite.instrument; --profile for cProfile).
+
+Requirements:
+    Python 3.8+
+    Pillow (exif and variants stages; render stage for images whose
+    metadata lacks width/height)
+    brotli, rjsmin (optional; compress stage: .br siblings, minified JS)
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from photosite.compress import precompress_site
+from photosite.exif import extract_site_capture
+from photosite.fingerprint import publish_assets
+from photosite.instrument import add_report_arguments, instrumented_run
+from photosite.perceptual import find_site_variants
+from photosite.prerender import prerender_site
+from photosite.search_index import build_search_index
+from photosite.site_index import build_gallery_index
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+GALLERY_DIR = BASE_DIR / 'assets' / 'images' / 'gallery'
+
+STAGES = {
+    'exif': extract_site_capture,
+    'index': build_gallery_index,
+    'search': build_search_index,
+    'render': prerender_site,
+    'assets': publish_assets,
+    'compress': precompress_site,
+    'variants': find_site_variants,
+}
+
+
+def log(level, message):
+    """Simple logging with color."""
+    colors = {
+        'INFO': '\033[94m',     # Blue
+        'SUCCESS': '\033[92m',  # Green
+        'WARNING': '\033[93m',  # Yellow
+        'ERROR': '\033[91m',    # Red
+    }
+    reset = '\033[0m'
+    color = colors.get(level, '')
+    print(f"{color}[{level}]{reset} {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rebuild site artifacts derived from collection metadata'
+    )
+    parser.add_argument(
+        'stages',
+        nargs='*',
+        help=f"Stages to run: {', '.join(STAGES)} (default: all)"
+    )
+    parser.add_argument(
+        '--gallery-dir',
+        default=str(GALLERY_DIR),
+        help='Gallery folder containing the collections (default: %(default)s)'
+    )
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    unknown = [stage for stage in args.stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+
+    gallery_dir = Path(args.gallery_dir)
+    if not gallery_dir.exists():
+        log('ERROR', f"Gallery directory not found: {gallery_dir}")
+        sys.exit(1)
+
+    with instrumented_run('build-site', args.report, args.trace_memory, args.profile, log=log):
+        for stage in args.stages or list(STAGES):
+            log('INFO', f"Stage: {stage}")
+            STAGES[stage](gallery_dir, log=log)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,14 +2,18 @@
 """
 Generate Collection Script
 Automates the process of adding a new photography collection to the portfolio.
-Also supports adding new images to existing collections (merge mode).
+Also supports adding new images to existing collections (merge mode), and
+processing many collections in one unattended run (batch mode).
 
 Usage:
     python3 scripts/generate-collection.py <collection-folder-path>
+    python3 scripts/generate-collection.py <folder-or-glob> [<folder-or-glob> ...]
+    python3 scripts/generate-collection.py --watch [<gallery-folder-path>]
 
 Example:
     python3 scripts/generate-collection.py assets/images/gallery/my-new-collection
     python3 scripts/generate-collection.py assets/images/gallery/japan-2025  (with new images)
+    python3 scripts/generate-collection.py 'assets/images/gallery/*-2025'  (batch)
 
 Expected folder structure:
     my-collection/
@@ -17,37 +21,107 @@ Expected folder structure:
     │   ├── image1.jpg
     │   ├── image2.jpg
     │   └── ...
-    ├── thumbnails/         (will be created/populated)
+    ├── thumbnails/         (will be created/populated, with a
+    │                        thumbnails/<width>/ folder per rendition)
+    ├── collection-info.json (optional: title, location, date, description
+    │                        and displayCategory, instead of the prompts)
     └── metadata.json       (optional: will be created or updated)
 
 This script will:
     1. Detect if collection is new or existing
-    2. Generate thumbnails (new images only if updating)
-    3. Create or update metadata.json with AI-assisted descriptions and tags
+    2. Generate thumbnails and responsive renditions (new images only if updating)
+    3. Create or update metadata.json with AI-assisted descriptions and tags,
+       pre-filled by a local analysis of the pixels and EXIF data
+       (--local-analysis)
     4. Update collections lists in JavaScript files (new collections only)
-    5. Generate metadata with smart featured selection
+    5. Generate metadata with smart featured selection (the sharpest images)
+    6. Rebuild the site-wide gallery-index.json used by the home/browse pages,
+       remove content-fingerprinted renditions that are no longer used, and
+       write precompressed .gz/.br copies of the generated files
+    7. Write a run report: time per stage (hashing, decoding, resizing,
+       encoding, API calls, JSON writes), bytes read/written, cache hits and
+       API retries (--profile adds cProfile statistics)
 
 Requirements:
     pip install Pillow requests
+    pip install brotli rjsmin   (optional: .br copies, minified JS)
+    pip install numpy           (optional: local tags, sharpness ranking)
     
 Environment Variables:
     PERPLEXITY_API_KEY - Your Perplexity API key from Settings > API
+    PERPLEXITY_API_URL - Override the API endpoint (e.g. a local stub server)
+    PHOTOSITE_CACHE_DIR - Folder for the AI description/tag cache and run
+                          reports (default: ~/.cache/photosite)
+    PHOTOSITE_MEMORY_BUDGET - Memory a run may use for decoding, e.g. 3G
+                          (default: 75% of RAM; see --memory-budget)
 """
 
 import os
 import sys
 import json
 import argparse
-import hashlib
+import glob
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from PIL import Image
 import re
-import base64
-import requests
+
+from photosite.ai_cache import TagCache, context_hash
+from photosite.analysis import analyze_images, merge_tags
+from photosite.compress import precompress_site
+from photosite.discovery import full_res_dir, source_images
+from photosite.fingerprint import publish_assets
+from photosite.instrument import add_report_arguments, count, drain, instrumented_run, merge, stage, timed
+from photosite.manifest import BuildManifest, hash_file
+from photosite.memory import BUDGET_ENV, configure_budget, memory_budget, parse_size
+from photosite.metadata import (
+    COLLECTION_INFO_FILENAME, DEFAULT_DISPLAY_CATEGORY, DEFAULT_TAGS, collection_entry, collection_info_of,
+    cover_image, fields_from_disk, image_entry, load_metadata, mark_featured, metadata_path,
+    read_collection_info, title_from_filename,
+)
+from photosite.perceptual import DEFAULT_MAX_DISTANCE
+from photosite.pipeline import ingest_images, refresh_images
+from photosite.prerender import COLLECTION_PAGES_DIR, prerender_site
+from photosite.renditions import update_metadata_renditions
+from photosite.schema import validate_collection_list
+from photosite.search_index import build_search_index
+from photosite.site_index import COLLECTIONS_PATTERN, INDEX_FILENAME, build_gallery_index
+from photosite.storage import atomic_write, folder_lock, write_metadata
+from photosite.tagging import (
+    DEFAULT_MAX_IMAGE_EDGE, DEFAULT_RATE, DEFAULT_WORKERS, TaggingClient, image_payload,
+    parse_rate,
+)
+from photosite.watch import DEBOUNCE_SECONDS, watch_galleries
 
 # Constants
-THUMBNAIL_WIDTH = 400
-THUMBNAIL_QUALITY = 85
+PERPLEXITY_MODEL = 'sonar-pro'
+
+# Tags Perplexity may choose from
+TAG_VOCABULARY = (
+    'travel', 'landscape', 'nature', 'cherry-blossom', 'japan', 'castle', 'spring',
+    'temple', 'garden', 'city', 'park', 'evening', 'lanterns', 'portrait', 'street',
+    'night', 'magical', 'peaceful', 'architecture', 'modern', 'urban', 'culture', 'history',
+    'samurai', 'gate', 'spiritual', 'dramatic', 'desert', 'wildlife', 'mountains',
+    'panoramic', 'featured', 'astro', 'city-lights', 'historical', 'seasonal', 'weather',
+    'western', 'geology', 'rock-formations', 'rodeo', 'celebration', 'festive', 'holiday',
+    'christmas', 'people', 'action', 'sports', 'alps', 'hiking', 'countryside', 'europe',
+    'austria', 'germany', 'color', 'texture', 'tree', 'water', 'waterfall', 'sunrise',
+    'sunset', 'moon', 'stars', 'milky-way', 'aurora',
+)
+
+# Longest edge of the upload for images the local analysis tagged confidently
+CONFIDENT_UPLOAD_EDGE = 512
+
+# --local-analysis modes
+LOCAL_ANALYSIS_MODES = ('off', 'tags', 'skip')
+
+# Collection info asked for interactively when a new collection has no
+# collection-info.json sidecar (see photosite.metadata)
+COLLECTION_INFO_PROMPTS = {
+    'title': "Collection Title (e.g., 'Japan 2025'): ",
+    'location': "Location(s) (e.g., 'Japan, Kyoto'): ",
+    'date': "Date/Year (e.g., '2025'): ",
+    'description': "Collection Description: ",
+}
 
 def log(level, message):
     """Simple logging with color."""
@@ -63,11 +137,7 @@ def log(level, message):
 
 def get_image_hash(image_path):
     """Get SHA256 hash of image file for deduplication."""
-    sha256_hash = hashlib.sha256()
-    with open(image_path, 'rb') as f:
-        for byte_block in iter(lambda: f.read(4096), b''):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+    return hash_file(image_path)
 
 def validate_collection_folder(collection_path):
     """Validate that collection folder has required structure."""
@@ -77,13 +147,13 @@ def validate_collection_folder(collection_path):
         log('ERROR', f"Collection folder does not exist: {collection_path}")
         return False
     
-    full_res_path = collection_path / 'full-res'
+    full_res_path = full_res_dir(collection_path)
     if not full_res_path.exists():
         log('ERROR', f"Missing 'full-res' folder: {full_res_path}")
         return False
     
     # Get list of image files
-    image_files = list(full_res_path.glob('*.jpg')) + list(full_res_path.glob('*.JPG')) + list(full_res_path.glob('*.jpeg'))
+    image_files = source_images(collection_path)
     if not image_files:
         log('ERROR', f"No JPG images found in {full_res_path}")
         return False
@@ -91,174 +161,57 @@ def validate_collection_folder(collection_path):
     log('SUCCESS', f"Found {len(image_files)} images in full-res folder")
     return True
 
-def get_image_files(collection_path):
-    """Get sorted list of image files in collection."""
-    full_res_path = Path(collection_path) / 'full-res'
-    return sorted(full_res_path.glob('*.jpg')) + sorted(full_res_path.glob('*.JPG')) + sorted(full_res_path.glob('*.jpeg'))
-
 def check_if_existing_collection(collection_path):
     """Check if collection already has metadata.json."""
-    metadata_path = Path(collection_path) / 'metadata.json'
-    return metadata_path.exists()
+    return metadata_path(collection_path).exists()
 
-def get_existing_image_hashes(collection_path):
-    """Get set of image hashes already in metadata.json.
+def ingest_collection(collection_path, max_distance=DEFAULT_MAX_DISTANCE):
+    """Find new images and build their thumbnails in a single pass.
     
-    Uses file hashing to detect duplicates, even if filenames differ
-    (e.g., image - Screen.jpg vs image - Matte.jpg)
-    """
-    metadata_path = Path(collection_path) / 'metadata.json'
-    
-    if not metadata_path.exists():
-        return {}
-    
-    try:
-        with open(metadata_path, 'r') as f:
-            metadata = json.load(f)
-        
-        # Build map of filename -> hash for images in metadata
-        # We'll compute hashes for actual files and compare
-        existing_hashes = {}
-        for img in metadata.get('images', []):
-            existing_hashes[img['filename']] = None  # Hash will be computed on demand
-        
-        return existing_hashes
-    except Exception as e:
-        log('WARNING', f"Could not read existing metadata.json: {str(e)}")
-        return {}
-
-def find_new_images(collection_path):
-    """Find new images not yet in metadata.json by comparing file hashes.
-    
-    This is more reliable than filename comparison because it handles:
+    New images are those not yet in metadata.json, compared by perceptual
+    hash rather than filename or bytes, so it handles:
     - Different naming schemes (Screen vs Matte versions)
     - Renamed files
-    - Different file formats of the same image
-    """
-    all_images = get_image_files(collection_path)
-    
-    # Build hash map of existing images in metadata
-    metadata_path = Path(collection_path) / 'metadata.json'
-    existing_hashes = set()
-    
-    if metadata_path.exists():
-        try:
-            with open(metadata_path, 'r') as f:
-                metadata = json.load(f)
-            
-            # Pre-compute hashes of referenced files
-            full_res_path = Path(collection_path) / 'full-res'
-            for img in metadata.get('images', []):
-                img_file = full_res_path / img['filename']
-                if img_file.exists():
-                    file_hash = get_image_hash(img_file)
-                    existing_hashes.add(file_hash)
-        except Exception as e:
-            log('WARNING', f"Could not compute existing image hashes: {str(e)}")
-    
-    # Find new images (not in existing_hashes)
-    new_images = []
-    for image_file in all_images:
-        file_hash = get_image_hash(image_file)
-        if file_hash not in existing_hashes:
-            new_images.append(image_file)
+    - Re-exported or re-compressed copies of the same image
     
-    return new_images, len(all_images)
-
-def generate_thumbnails(collection_path, specific_images=None):
-    """Generate thumbnail images from full-res originals.
+    Images whose dHash is within max_distance bits of an image already in
+    the collection (or of an earlier new image) are reported as variants and
+    skipped. Each new or changed original is read from disk once: the same
+    memory-mapped bytes are hashed and decoded, and the decode feeds the
+    dHash and every rendition (see photosite.pipeline). Unchanged files are
+    not read at all.
     
-    If specific_images is provided, only generate for those.
-    Otherwise, generate for all images (skip existing if thumbnails exist).
+    Returns:
+        tuple: (new_images, total_images, built) where built maps filename
+               to the rendition metadata fields of the images built now
     """
-    collection_path = Path(collection_path)
-    full_res_path = collection_path / 'full-res'
-    thumbnails_path = collection_path / 'thumbnails'
-    
-    # Create thumbnails folder if it doesn't exist
-    thumbnails_path.mkdir(exist_ok=True)
+    all_images = source_images(collection_path)
     
-    if specific_images:
-        image_files = specific_images
-        log('INFO', f"Generating thumbnails for {len(image_files)} new images...")
-    else:
-        image_files = get_image_files(collection_path)
-        log('INFO', f"Generating thumbnails for {len(image_files)} images...")
-    
-    for image_file in image_files:
-        try:
-            # Skip if thumbnail already exists
-            thumb_path = thumbnails_path / image_file.name
-            if thumb_path.exists() and specific_images is None:
-                log('SUCCESS', f"  ✓ {image_file.name} (thumbnail already exists)")
-                continue
-            
-            # Open image
-            img = Image.open(image_file)
-            
-            # Ensure RGB (in case of RGBA)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGB')
-            
-            # Calculate new height maintaining aspect ratio
-            aspect_ratio = img.height / img.width
-            new_height = int(THUMBNAIL_WIDTH * aspect_ratio)
-            
-            # Resize
-            img_thumb = img.resize((THUMBNAIL_WIDTH, new_height), Image.Resampling.LANCZOS)
-            
-            # Save thumbnail
-            thumb_path = thumbnails_path / image_file.name
-            img_thumb.save(thumb_path, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
-            
-            log('SUCCESS', f"  ✓ {image_file.name} ({img.width}x{img.height}) → {THUMBNAIL_WIDTH}x{new_height}")
-        
-        except Exception as e:
-            log('ERROR', f"  ✗ Failed to process {image_file.name}: {str(e)}")
-            continue
+    # Filenames of images already in metadata
+    metadata = load_existing_metadata(collection_path) or {}
+    existing_filenames = {img['filename'] for img in metadata.get('images', [])}
     
+    log('INFO', f"Scanning {len(all_images)} images...")
+    new_images, built = ingest_images(collection_path, all_images, existing_filenames,
+                                      max_distance, log=log)
     log('SUCCESS', "Thumbnail generation complete!")
-
-def extract_metadata_from_filename(filename):
-    """Extract basic metadata from filename.
     
-    Assumes filenames follow pattern:
-    'Title - Description - Screen.jpg' or 'Title - Screen.jpg'
+    return new_images, len(all_images), built
+
+def build_prompt(title, collection_info, analysis=None):
+    """Perplexity prompt for one image.
     
-    Returns: (title, description)
+    With a local analysis (photosite.analysis), the tags it decided either
+    way are left out of the tag list and the ones it attached are named
+    instead. Without decided tags it is the plain prompt, so answers
+    cached for it stay valid.
     """
-    # Remove extension
-    name = filename.rsplit('.', 1)[0]
-    
-    # Remove " - Screen" or " - Matte" suffix if present
-    name = re.sub(r'\s*-\s*(Screen|Matte)\s*$', '', name)
-    
-    # Split on " - " if it exists
-    parts = name.split(' - ', 1)
-    
-    title = parts[0].strip()
-    description = parts[1].strip() if len(parts) > 1 else None
-    
-    return title, description
-
-def generate_image_description_and_tags(api_key, image_path, title, collection_info):
-    """Use Perplexity Sonar to generate intelligent descriptions and tags for an image."""
-    try:
-        # Read and encode image
-        with open(image_path, 'rb') as f:
-            image_data = base64.standard_b64encode(f.read()).decode('utf-8')
-        
-        # Determine image type
-        image_ext = image_path.suffix.lower()
-        if image_ext in ['.jpg', '.jpeg']:
-            media_type = 'image/jpeg'
-        elif image_ext == '.png':
-            media_type = 'image/png'
-        else:
-            media_type = 'image/jpeg'
-        
-        # Create prompt for Perplexity
-        prompt = f"""You are a photography metadata expert. Analyze this photograph and provide metadata for a photography portfolio.
+    decided = set(analysis['decided']) if analysis else set()
+    vocabulary = ', '.join(tag for tag in TAG_VOCABULARY if tag not in decided)
+    known = ''
+    if analysis and analysis['tags']:
+        known = f"Already tagged from the pixels and EXIF data (do not repeat): {', '.join(analysis['tags'])}\n"
+    return f"""You are a photography metadata expert. Analyze this photograph and provide metadata for a photography portfolio.
 
 Collection Context:
 - Title: {collection_info['title']}
@@ -274,43 +227,78 @@ Provide your response in this exact JSON format (no additional text):
   "tags": ["tag1", "tag2", "tag3", ...]
 }}
 
-For tags, choose from this list where relevant: travel, landscape, nature, cherry-blossom, japan, castle, spring, temple, garden, city, park, evening, lanterns, portrait, street, night, magical, peaceful, architecture, modern, urban, culture, history, samurai, gate, spiritual, dramatic, desert, wildlife, mountains, panoramic, featured, astro, city-lights, historical, seasonal, weather, western, geology, rock-formations, rodeo, celebration, festive, holiday, christmas, people, action, sports, alps, hiking, countryside, europe, austria, germany, color, texture, tree, water, waterfall, sunrise, sunset, moon, stars, milky-way, aurora
-
+For tags, choose from this list where relevant: {vocabulary}
+{known}
 Make sure tags are relevant to this specific image and the collection context."""
+
+def generate_image_description_and_tags(client, image_path, title, collection_info,
+                                       cache=None, image_hash=None, analysis=None,
+                                       skip_confident=False):
+    """Use Perplexity Sonar to generate intelligent descriptions and tags for an image.
+    
+    `client` is the run's shared TaggingClient; it handles rate limiting,
+    timeouts and retries, and this function is safe to call from its
+    worker threads. If a TagCache and the image's SHA-256 are given, a
+    cached answer for the same image and prompt is returned without
+    calling the API, and fresh answers are stored.
+    
+    `analysis` is the image's local analysis (photosite.analysis): its
+    confident tags are added to the answer and the tags it ruled out are
+    dropped, and for a 'confident' image a smaller copy is uploaded. With
+    skip_confident, a confident image whose filename carries a description
+    is not sent at all; it gets its local tags and the filename description.
+    The same local tags are returned when the API call fails.
+    """
+    try:
+        if (skip_confident and analysis and analysis['confident']
+                and title_from_filename(image_path.name)[1]):
+            log('INFO', f"  Tagged {image_path.name} locally, skipping Perplexity")
+            count('api_calls_skipped')
+            return None, merge_tags(DEFAULT_TAGS, analysis)
+        
+        # Create prompt for Perplexity
+        prompt = build_prompt(title, collection_info, analysis)
+        
+        # Reuse an earlier answer for the same image bytes and prompt
+        context = context_hash(PERPLEXITY_MODEL, prompt)
+        if cache is not None and image_hash:
+            cached = cache.get(image_hash, context)
+            if cached:
+                log('INFO', f"  Using cached metadata for {image_path.name}")
+                return cached[0], merge_tags(cached[1], analysis)
+        
+        # Encode a downscaled copy (an existing rendition when possible)
+        max_edge = client.max_image_edge
+        if analysis and analysis['confident']:
+            max_edge = min(max_edge, CONFIDENT_UPLOAD_EDGE)
+        media_type, image_data = image_payload(image_path, max_edge)
         
         # Call Perplexity API with vision (Sonar model)
-        response = requests.post(
-            'https://api.perplexity.ai/chat/completions',
-            headers={
-                'Authorization': f'Bearer {api_key}',
-                'Content-Type': 'application/json'
-            },
-            json={
-                'model': 'sonar-pro',
-                'messages': [
-                    {
-                        'role': 'user',
-                        'content': [
-                            {
-                                'type': 'image_url',
-                                'image_url': {
-                                    'url': f'data:{media_type};base64,{image_data}'
-                                }
-                            },
-                            {
-                                'type': 'text',
-                                'text': prompt
+        response = client.post({
+            'model': PERPLEXITY_MODEL,
+            'messages': [
+                {
+                    'role': 'user',
+                    'content': [
+                        {
+                            'type': 'image_url',
+                            'image_url': {
+                                'url': f'data:{media_type};base64,{image_data}'
                             }
-                        ]
-                    }
-                ],
-                'max_tokens': 500
-            }
-        )
+                        },
+                        {
+                            'type': 'text',
+                            'text': prompt
+                        }
+                    ]
+                }
+            ],
+            'max_tokens': 500
+        })
         
         if response.status_code != 200:
             log('WARNING', f"  Perplexity API error ({response.status_code}): {response.text}")
-            return None, None
+            return None, merge_tags(DEFAULT_TAGS, analysis)
         
         # Parse response
         response_data = response.json()
@@ -320,35 +308,158 @@ Make sure tags are relevant to this specific image and the collection context.""
         json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
         if json_match:
             metadata = json.loads(json_match.group())
-            return metadata['description'], metadata['tags']
+            if cache is not None and image_hash:
+                cache.put(image_hash, context, metadata['description'], metadata['tags'])
+            return metadata['description'], merge_tags(metadata['tags'], analysis)
         else:
             log('WARNING', f"  Could not parse Perplexity response for {image_path.name}")
-            return None, None
+            return None, merge_tags(DEFAULT_TAGS, analysis)
     
     except Exception as e:
         log('WARNING', f"  Failed to generate metadata for {image_path.name}: {str(e)}")
-        return None, None
+        return None, merge_tags(DEFAULT_TAGS, analysis)
 
 def load_existing_metadata(collection_path):
     """Load existing metadata.json if it exists."""
-    metadata_path = Path(collection_path) / 'metadata.json'
+    try:
+        return load_metadata(collection_path)
+    except Exception as e:
+        log('WARNING', f"Could not load existing metadata: {str(e)}")
+        return None
+
+def prompt_collection_info(collection_info):
+    """Ask for every collection info field that is still missing."""
+    print("\n" + "="*60)
+    print("COLLECTION INFORMATION")
+    print("="*60)
     
-    if metadata_path.exists():
-        try:
-            with open(metadata_path, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            log('WARNING', f"Could not load existing metadata: {str(e)}")
-            return None
+    collection_info = dict(collection_info)
+    for key, prompt in COLLECTION_INFO_PROMPTS.items():
+        if collection_info.get(key):
+            print(f"{prompt}{collection_info[key]}")
+        else:
+            collection_info[key] = input(prompt).strip()
+    return collection_info
+
+def collection_info_for(collection_path, overrides=None, interactive=True):
+    """Collection info for a new collection, without prompting where possible.
+    
+    Fields come from the collection's collection-info.json sidecar
+    (keys: title, location, date, description and optionally
+    displayCategory), overridden by any non-empty `overrides` (the CLI
+    flags). Missing fields are asked for when `interactive`; otherwise the
+    title falls back to the folder name, the date to a year in the folder
+    name, and the rest are left empty with a warning.
+    """
+    collection_path = Path(collection_path)
+    collection_info = read_collection_info(collection_path)
+    collection_info.update({k: v for k, v in (overrides or {}).items() if v})
+    
+    if interactive:
+        return prompt_collection_info(collection_info)
     
-    return None
+    name = collection_path.name
+    year = re.search(r'(?:^|-)((?:19|20)\d{2})(?:-|$)', name)
+    defaults = {
+        'title': re.sub(r'[-_]+', ' ', name).title(),
+        'date': year.group(1) if year else '',
+    }
+    for key in COLLECTION_INFO_PROMPTS:
+        if not collection_info.get(key):
+            collection_info[key] = defaults.get(key, '')
+            log('WARNING', f"  {name}: no {key} in {COLLECTION_INFO_FILENAME} or flags"
+                           + (f", using '{collection_info[key]}'" if collection_info[key] else ""))
+    return collection_info
 
-def generate_metadata(collection_path, collection_id, api_key, new_images_only=False):
+def describe_batches(client, batches, cache=None, analyses=None, skip_confident=False):
+    """Describe and tag the images of several collections on one worker pool.
+    
+    `batches` is a list of (images, collection_info) pairs, one per
+    collection. Every image of every batch is queued on the client's worker
+    threads at once, so the pool stays busy across collection boundaries.
+    Yields (batch_index, (image_file, title, filename_desc, description, tags))
+    in input order; description/tags are None where the API call failed.
+    With a TagCache, images already answered for the same prompt are
+    served from the cache. `analyses` maps images to their local analysis
+    (see analyze_collection and generate_image_description_and_tags).
+    """
+    image_hashes = {}
+    if cache is not None:
+        # Hash up front on this thread; the manifest is not thread-safe
+        for images, _ in batches:
+            if not images:
+                continue
+            collection_path = Path(images[0]).parent.parent
+            with folder_lock(collection_path, log):
+                manifest = BuildManifest.load(collection_path)
+                image_hashes.update((image_file, manifest.content_hash(image_file)) for image_file in images)
+                manifest.save()
+    
+    jobs = [(index, image_file, collection_info)
+            for index, (images, collection_info) in enumerate(batches)
+            for image_file in images]
+    
+    def describe(job):
+        _, image_file, collection_info = job
+        title, _ = title_from_filename(image_file.name)
+        return generate_image_description_and_tags(
+            client, image_file, title, collection_info,
+            cache=cache, image_hash=image_hashes.get(image_file),
+            analysis=(analyses or {}).get(image_file), skip_confident=skip_confident)
+    
+    for (index, image_file, _), (description, tags) in zip(jobs, client.map(describe, jobs)):
+        title, filename_desc = title_from_filename(image_file.name)
+        log('INFO', f"Analyzed {image_file.name}")
+        yield index, (image_file, title, filename_desc, description, tags)
+
+def describe_images(client, images, collection_info, cache=None, analyses=None,
+                    skip_confident=False):
+    """Describe and tag one collection's images concurrently (see describe_batches).
+    
+    Yields (image_file, title, filename_desc, description, tags) in the
+    order of `images`.
+    """
+    for _, result in describe_batches(client, [(images, collection_info)], cache,
+                                      analyses, skip_confident):
+        yield result
+
+def analyze_collection(collection_path, new_images):
+    """Local analysis (photosite.analysis) of the images a collection's metadata.json will list.
+    
+    That is the images already in metadata.json and `new_images`, analyzed
+    in one batched pass. Returns {} when NumPy is not installed.
+    """
+    metadata = load_existing_metadata(collection_path) or {}
+    full_res = full_res_dir(collection_path)
+    existing = [full_res / img['filename'] for img in metadata.get('images', [])]
+    images = [f for f in existing if f.exists() and f not in new_images] + list(new_images)
+    log('INFO', f"Analyzing {len(images)} image(s) of {Path(collection_path).name} locally...")
+    return analyze_images(images, log=log)
+
+@timed('metadata')
+def generate_metadata(collection_path, collection_id, client, new_images, total_images,
+                      built=None, new_images_only=False, cache=None,
+                      collection_info=None, analyzed=None, analyses=None,
+                      skip_confident=False):
     """Generate metadata.json for the collection.
     
+    `new_images`, `total_images` and `built` come from ingest_collection().
     If new_images_only=True, only generate for new images and merge with existing.
-    Otherwise, create fresh metadata for all images.
+    Otherwise, create fresh metadata for all (non-variant) images.
+    `client` is the TaggingClient used for the Perplexity calls; `cache` is
+    an optional TagCache of earlier answers.
+    
+    For a new collection, `collection_info` (see collection_info_for) skips
+    the interactive prompts. `analyzed` is this collection's share of
+    describe_batches() output when the images were already described
+    alongside other collections.
+    
+    `analyses` is analyze_collection() output (computed here when None;
+    pass {} to do without): the sharpest images become the cover and the
+    featured ones, and the tagging uses it (`skip_confident`, see
+    generate_image_description_and_tags).
     """
+    built = built or {}
     collection_path = Path(collection_path)
     
     # Check if this is an update to existing collection
@@ -358,22 +469,18 @@ def generate_metadata(collection_path, collection_id, api_key, new_images_only=F
         log('INFO', "Found existing metadata.json - entering MERGE mode")
         log('INFO', "New images will be added to existing collection")
         
-        # Get only new images (by hash)
-        new_images, total_images = find_new_images(collection_path)
-        
         if not new_images:
             log('WARNING', f"No new images found! All {total_images} images already in metadata.")
             return
         
         log('INFO', f"Found {len(new_images)} new image(s) out of {total_images} total")
         
+        if analyses is None:
+            analyses = analyze_collection(collection_path, new_images)
+        sharpness = {path.name: analysis['sharpness'] for path, analysis in analyses.items()}
+        
         # Use existing collection info
-        collection_info = {
-            'title': existing_metadata['collection']['title'],
-            'location': existing_metadata['collection']['location'],
-            'date': existing_metadata['collection']['date'],
-            'description': existing_metadata['collection']['description']
-        }
+        collection_info = collection_info_of(existing_metadata)
         
         print("\n" + "="*60)
         print(f"UPDATING COLLECTION: {collection_id}")
@@ -385,60 +492,29 @@ def generate_metadata(collection_path, collection_id, api_key, new_images_only=F
         
         # Generate metadata only for new images
         new_images_data = []
-        for new_image in new_images:
-            title, filename_desc = extract_metadata_from_filename(new_image.name)
-            log('INFO', f"Analyzing {new_image.name}...")
-            
-            description, tags = generate_image_description_and_tags(
-                api_key,
-                new_image,
-                title,
-                collection_info
-            )
-            
-            if not description:
-                description = filename_desc or f"A photograph from the {collection_info['title']} collection"
-            
-            if not tags:
-                tags = ["travel"]
-            
-            log('SUCCESS', f"  Generated: {len(tags)} tags, description created")
-            
-            image_data = {
-                "id": title.lower().replace(' ', '-'),
-                "title": title,
-                "filename": new_image.name,
-                "description": description,
-                "location": collection_info['location'],
-                "tags": tags,
-                "printSizes": [
-                    {"size": "8x10", "price": 50},
-                    {"size": "11x14", "price": 85},
-                    {"size": "16x20", "price": 140},
-                    {"size": "20x30", "price": 235}
-                ],
-                "featured": False,  # Will be recalculated
-                "printAvailable": True
-            }
-            
+        if analyzed is None:
+            analyzed = describe_images(client, new_images, collection_info, cache,
+                                       analyses, skip_confident)
+        for new_image, _, _, description, tags in analyzed:
+            image_data = image_entry(
+                new_image, collection_info, description, tags,
+                built.get(new_image.name) or fields_from_disk(new_image, collection_path))
+            log('SUCCESS', f"  Generated: {len(image_data['tags'])} tags, description created")
             new_images_data.append(image_data)
         
         # Merge: keep existing images, add new ones
         all_images_data = existing_metadata['images'] + new_images_data
         
-        # Recalculate featured: first + every 3rd + last
-        for idx, img in enumerate(all_images_data):
-            img['featured'] = (idx == 0) or (idx % 3 == 0) or (idx == len(all_images_data) - 1)
+        # Recalculate featured and the cover: the sharpest images
+        mark_featured(all_images_data, sharpness)
         
         # Update metadata
         updated_metadata = existing_metadata
         updated_metadata['images'] = all_images_data
-        updated_metadata['collection']['coverImage'] = all_images_data[0]['filename']
+        updated_metadata['collection']['coverImage'] = cover_image(all_images_data, sharpness)
         
         # Save metadata.json
-        metadata_path = collection_path / 'metadata.json'
-        with open(metadata_path, 'w') as f:
-            json.dump(updated_metadata, f, indent=2)
+        write_metadata(metadata_path(collection_path), updated_metadata)
         
         log('SUCCESS', f"Updated metadata.json")
         log('INFO', f"  Total images now: {len(all_images_data)}")
@@ -449,24 +525,16 @@ def generate_metadata(collection_path, collection_id, api_key, new_images_only=F
         # Fresh metadata generation (new collection)
         log('INFO', "Generating fresh metadata.json for new collection")
         
-        all_images = get_image_files(collection_path)
+        # One image per group of variants
+        all_images = new_images
         
-        # Prompt user for collection info
-        print("\n" + "="*60)
-        print("COLLECTION INFORMATION")
-        print("="*60)
-        
-        collection_title = input("Collection Title (e.g., 'Japan 2025'): ").strip()
-        collection_location = input("Location(s) (e.g., 'Japan, Kyoto'): ").strip()
-        collection_date = input("Date/Year (e.g., '2025'): ").strip()
-        collection_description = input("Collection Description: ").strip()
+        # Prompt user for collection info unless it was given up front
+        if collection_info is None:
+            collection_info = prompt_collection_info({})
         
-        collection_info = {
-            'title': collection_title,
-            'location': collection_location,
-            'date': collection_date,
-            'description': collection_description
-        }
+        if analyses is None:
+            analyses = analyze_collection(collection_path, all_images)
+        sharpness = {path.name: analysis['sharpness'] for path, analysis in analyses.items()}
         
         print("\n" + "="*60)
         print("GENERATING IMAGE METADATA")
@@ -474,77 +542,36 @@ def generate_metadata(collection_path, collection_id, api_key, new_images_only=F
         print(f"Using Perplexity AI to analyze {len(all_images)} images...\n")
         
         images_data = []
-        for idx, image_file in enumerate(all_images):
-            title, filename_desc = extract_metadata_from_filename(image_file.name)
-            
-            log('INFO', f"Analyzing {image_file.name}...")
-            
-            description, tags = generate_image_description_and_tags(
-                api_key,
-                image_file,
-                title,
-                collection_info
-            )
-            
-            if not description:
-                description = filename_desc or f"A photograph from the {collection_title} collection"
-            
-            if not tags:
-                tags = ["travel"]
-            
-            log('SUCCESS', f"  Generated: {len(tags)} tags, description created")
-            
-            # Auto-feature: first image + every 3rd image + last image
-            is_featured = (idx == 0) or (idx % 3 == 0) or (idx == len(all_images) - 1)
-            
-            image_data = {
-                "id": title.lower().replace(' ', '-'),
-                "title": title,
-                "filename": image_file.name,
-                "description": description,
-                "location": collection_location,
-                "tags": tags,
-                "printSizes": [
-                    {"size": "8x10", "price": 50},
-                    {"size": "11x14", "price": 85},
-                    {"size": "16x20", "price": 140},
-                    {"size": "20x30", "price": 235}
-                ],
-                "featured": is_featured,
-                "printAvailable": True
-            }
-            
+        if analyzed is None:
+            analyzed = describe_images(client, all_images, collection_info, cache,
+                                       analyses, skip_confident)
+        for image_file, _, _, description, tags in analyzed:
+            image_data = image_entry(
+                image_file, collection_info, description, tags,
+                built.get(image_file.name) or fields_from_disk(image_file, collection_path))
+            log('SUCCESS', f"  Generated: {len(image_data['tags'])} tags, description created")
             images_data.append(image_data)
         
+        # Auto-feature the sharpest images (first + every 3rd + last without analysis)
+        mark_featured(images_data, sharpness)
+        
         # Create metadata object
         metadata = {
-            "collection": {
-                "id": collection_id,
-                "title": collection_title,
-                "slug": collection_id,
-                "displayCategory": "Travel & Adventure",
-                "description": collection_description,
-                "location": collection_location,
-                "date": collection_date,
-                "coverImage": images_data[0]["filename"],
-                "featured": True,
-                "printAvailable": True
-            },
+            "collection": collection_entry(collection_id, collection_info,
+                                           cover_image(images_data, sharpness)),
             "images": images_data
         }
         
         # Save metadata.json
-        metadata_path = collection_path / 'metadata.json'
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        write_metadata(metadata_path(collection_path), metadata)
         
         log('SUCCESS', f"Created metadata.json")
-        log('INFO', f"  Collection: {collection_title}")
+        log('INFO', f"  Collection: {collection_info['title']}")
         log('INFO', f"  Images: {len(images_data)}")
         log('INFO', f"  Featured images: {sum(1 for img in images_data if img['featured'])}")
 
-def update_javascript_configs(collection_id):
-    """Update JavaScript files with new collection."""
+def update_javascript_configs(collection_ids):
+    """Update JavaScript files with new collections (each file is written once)."""
     log('INFO', "Updating JavaScript configuration files...")
     
     files_to_update = [
@@ -554,55 +581,272 @@ def update_javascript_configs(collection_id):
     
     for file_path in files_to_update:
         try:
-            with open(file_path, 'r') as f:
-                content = f.read()
-            
-            # Check if collection already in list
-            if f"'{collection_id}'" in content:
-                log('WARNING', f"  ⚠ {file_path} already contains {collection_id}")
-                continue
-            
-            # Find the collections array and add new collection
-            pattern = r"(const collections = \[\s*)([^\]]+)(\s*\];)"
-            
-            def add_collection(match):
-                opening = match.group(1)
-                items = match.group(2).rstrip()
-                closing = match.group(3)
+            # Read, update and replace the file under the folder's lock so
+            # concurrent runs cannot drop each other's collections
+            with folder_lock(Path(file_path).parent, log):
+                with open(file_path, 'r') as f:
+                    content = f.read()
+                
+                # Skip collections already in the list
+                missing = []
+                for collection_id in collection_ids:
+                    if f"'{collection_id}'" in content:
+                        log('WARNING', f"  ⚠ {file_path} already contains {collection_id}")
+                    else:
+                        missing.append(collection_id)
+                if not missing:
+                    continue
+                
+                # Find the collections array and add new collection
+                pattern = r"(const collections = \[\s*)([^\]]+)(\s*\];)"
+                
+                def add_collection(match):
+                    opening = match.group(1)
+                    items = match.group(2).rstrip()
+                    closing = match.group(3)
+                    
+                    # Add new collections at the end
+                    new_items = items + "".join(f",\n  '{collection_id}'" for collection_id in missing)
+                    return opening + new_items + closing
+                
+                new_content = re.sub(pattern, add_collection, content, count=1, flags=re.DOTALL)
+                
+                if new_content == content:
+                    log('WARNING', f"  ⚠ Could not update {file_path} (pattern not found)")
+                    continue
                 
-                # Add new collection at the end
-                new_items = items + f",\n  '{collection_id}'"
-                return opening + new_items + closing
-            
-            new_content = re.sub(pattern, add_collection, content, flags=re.DOTALL)
-            
-            if new_content != content:
-                with open(file_path, 'w') as f:
-                    f.write(new_content)
+                # Check the rewritten list parses back before replacing the file
+                before = re.findall(r"'([^']+)'", COLLECTIONS_PATTERN.search(content).group(1))
+                after = re.findall(r"'([^']+)'", COLLECTIONS_PATTERN.search(new_content).group(1))
+                validate_collection_list(after, before + missing)
+                atomic_write(file_path, new_content)
                 log('SUCCESS', f"  ✓ Updated {file_path}")
-            else:
-                log('WARNING', f"  ⚠ Could not update {file_path} (pattern not found)")
         
         except Exception as e:
             log('ERROR', f"  ✗ Failed to update {file_path}: {str(e)}")
 
+def process_watch_batch(batch, client, cache=None, max_distance=DEFAULT_MAX_DISTANCE,
+                        local_analysis='tags'):
+    """Push one batch of changed originals through thumbnails, metadata and the index.
+
+    `batch` maps collection folders to the images that changed in them
+    (see photosite.watch). Images already in metadata.json get their
+    renditions and EXIF/IPTC fields rebuilt; new images are deduplicated
+    against the collection, thumbnailed and described by Perplexity, then
+    merged in. Only the images in the batch are read in full (the local
+    analysis reads the small renditions of the rest); `local_analysis`
+    is the --local-analysis mode.
+    """
+    gallery_dir = None
+    for collection_path, image_files in batch.items():
+        gallery_dir = collection_path.parent
+        print("\n" + "-" * 60)
+        log('INFO', f"{collection_path.name}: {len(image_files)} changed image(s)")
+
+        with folder_lock(collection_path, log):
+            metadata = load_existing_metadata(collection_path)
+            if metadata is None:
+                log('WARNING', f"  {collection_path.name} has no metadata.json yet; run "
+                               f"generate-collection.py {collection_path} once to set it up")
+                continue
+            existing_filenames = {img['filename'] for img in metadata.get('images', [])}
+
+            changed = [f for f in image_files if f.name in existing_filenames]
+            if changed:
+                built = refresh_images(collection_path, changed, log=log)
+                if update_metadata_renditions(collection_path, built):
+                    log('SUCCESS', f"  Updated {len(built)} image(s) in metadata.json")
+
+            added = [f for f in image_files if f.name not in existing_filenames]
+            if added:
+                # Existing images are only needed for their (cached) hashes
+                known = [f for f in source_images(collection_path) if f.name in existing_filenames]
+                new_images, built = ingest_images(collection_path, known + added, existing_filenames,
+                                                  max_distance, log=log)
+                if new_images:
+                    generate_metadata(collection_path, collection_path.name, client,
+                                      new_images, len(known) + len(added), built,
+                                      new_images_only=True, cache=cache,
+                                      analyses={} if local_analysis == 'off' else None,
+                                      skip_confident=local_analysis == 'skip')
+
+    if gallery_dir is not None:
+        build_gallery_index(gallery_dir, log=log)
+        build_search_index(gallery_dir, log=log)
+        prerender_site(gallery_dir, log=log)
+        publish_assets(gallery_dir, log=log)
+        precompress_site(gallery_dir, log=log)
+
+def expand_collection_paths(patterns):
+    """Collection folders named by paths or glob patterns, in order, without duplicates."""
+    paths = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(p for p in glob.glob(pattern) if Path(p).is_dir())
+            if not matches:
+                log('WARNING', f"No collection folders match {pattern}")
+        else:
+            matches = [pattern]
+        for match in matches:
+            path = Path(match)
+            if path.resolve() not in {p.resolve() for p in paths}:
+                paths.append(path)
+    return paths
+
+def ingest_collections(collection_paths, max_distance=DEFAULT_MAX_DISTANCE, jobs=1):
+    """Run ingest_collection() for several collections, `jobs` collections at a time.
+    
+    Each collection is deduplicated and thumbnailed in order within one
+    worker process; with jobs > 1 different collections run side by side.
+    
+    Returns:
+        list: ingest_collection() results in the order of collection_paths
+    """
+    if jobs <= 1 or len(collection_paths) <= 1:
+        results = []
+        for collection_path in collection_paths:
+            if len(collection_paths) > 1:
+                log('INFO', f"{Path(collection_path).name}:")
+            results.append(ingest_collection(collection_path, max_distance))
+        return results
+    
+    results = []
+    with ProcessPoolExecutor(max_workers=min(jobs, len(collection_paths)), initializer=configure_budget,
+                             initargs=(memory_budget(),)) as executor:
+        for result, recorded in executor.map(ingest_collection_job, collection_paths,
+                                             [max_distance] * len(collection_paths)):
+            merge(recorded)
+            results.append(result)
+    return results
+
+def ingest_collection_job(collection_path, max_distance=DEFAULT_MAX_DISTANCE):
+    """Process-pool worker for ingest_collections(): the ingest_collection()
+    result and the worker's stage timings (photosite.instrument.drain())."""
+    return ingest_collection(collection_path, max_distance), drain()
+
 def main():
     parser = argparse.ArgumentParser(
-        description='Generate a new photography collection or add images to existing collection',
+        description='Generate new photography collections or add images to existing collections',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""Examples:
   python3 scripts/generate-collection.py assets/images/gallery/my-collection
   python3 scripts/generate-collection.py assets/images/gallery/japan-2025  (with new images)
+  python3 scripts/generate-collection.py 'assets/images/gallery/*-2025' --jobs 0  (batch)
+  python3 scripts/generate-collection.py --watch  (process uploads as they land)
+
+Batch mode (several collections, or --batch) never prompts: collection info
+comes from each folder's collection-info.json and/or the --title, --location,
+--date and --description flags.
         """
     )
     
     parser.add_argument(
-        'collection_path',
-        help='Path to the collection folder (must contain full-res/ with JPGs)'
+        'collection_paths',
+        nargs='*',
+        metavar='collection_path',
+        help='Collection folder(s) or glob pattern(s) (each must contain full-res/ with JPGs); '
+             'with --watch, the gallery folder to watch (default: assets/images/gallery)'
+    )
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help=f'Never prompt; read collection info from {COLLECTION_INFO_FILENAME} and flags '
+             '(implied when several collections are given)'
+    )
+    parser.add_argument('--title', help='Collection title for new collections')
+    parser.add_argument('--location', help='Collection location(s) for new collections')
+    parser.add_argument('--date', help='Collection date/year for new collections')
+    parser.add_argument('--description', help='Collection description for new collections')
+    parser.add_argument(
+        '--display-category',
+        help=f'Display category for new collections (default: {DEFAULT_DISPLAY_CATEGORY})'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='Collections to thumbnail in parallel worker processes (0 = one per CPU core, default: 1)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f'Concurrent Perplexity requests (default: {DEFAULT_WORKERS})'
+    )
+    parser.add_argument(
+        '--rate',
+        type=parse_rate,
+        default=DEFAULT_RATE,
+        help=f'Maximum Perplexity requests per second (default: {DEFAULT_RATE})'
+    )
+    parser.add_argument(
+        '--max-upload-edge',
+        type=int,
+        default=DEFAULT_MAX_IMAGE_EDGE,
+        help=f'Longest edge in pixels of images sent to Perplexity (default: {DEFAULT_MAX_IMAGE_EDGE})'
+    )
+    parser.add_argument(
+        '--local-analysis',
+        choices=LOCAL_ANALYSIS_MODES,
+        default='tags',
+        help='Local pixel/EXIF analysis (needs numpy): "tags" attaches confident night, stars, milky-way, '
+             'astro, sunset, color and panoramic tags, trims the Perplexity request and features the '
+             'sharpest images; "skip" also skips Perplexity for confidently tagged images whose filename '
+             'has a description; "off" disables it (default: tags)'
     )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Ignore cached AI descriptions/tags and ask Perplexity again (results are re-cached)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not read or write the AI description/tag cache'
+    )
+    parser.add_argument(
+        '--variant-distance',
+        type=int,
+        default=DEFAULT_MAX_DISTANCE,
+        help=f'Max perceptual-hash distance (bits) for two files to count as variants of one image; 0 = exact only (default: {DEFAULT_MAX_DISTANCE})'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep running and process images as they land in */full-res/ (collections must already have metadata.json)'
+    )
+    parser.add_argument(
+        '--poll',
+        action='store_true',
+        help='With --watch, poll for changes instead of using inotify (e.g. on network mounts)'
+    )
+    parser.add_argument(
+        '--debounce',
+        type=float,
+        default=DEBOUNCE_SECONDS,
+        help=f'With --watch, seconds a file must stop changing before it is read (default: {DEBOUNCE_SECONDS:g})'
+    )
+    parser.add_argument(
+        '--memory-budget',
+        type=parse_size,
+        help='Memory each run may use, e.g. 3G; originals whose estimated decode memory does not fit are '
+             f'reported instead of decoded (default: ${BUDGET_ENV}, else 75%% of RAM)'
+    )
+    add_report_arguments(parser)
     
     args = parser.parse_args()
+    if args.watch and len(args.collection_paths) > 1:
+        parser.error('--watch takes a single gallery folder')
+    if not args.collection_paths and not args.watch:
+        parser.error('at least one collection_path is required (or use --watch)')
+    if args.memory_budget:
+        configure_budget(args.memory_budget)
     
+    with instrumented_run('generate-collection', args.report, args.trace_memory, args.profile, log=log):
+        run(args)
+
+def run(args):
+    """Process the collections (or watch the gallery) as configured by the command line."""
     # Check for API key
     api_key = os.environ.get('PERPLEXITY_API_KEY')
     if not api_key:
@@ -611,61 +855,189 @@ def main():
         log('INFO', "Then set it with: export PERPLEXITY_API_KEY='pplx-...'")
         sys.exit(1)
     
-    # Validate
-    if not validate_collection_folder(args.collection_path):
-        sys.exit(1)
+    if args.watch:
+        gallery_dir = Path(args.collection_paths[0] if args.collection_paths else 'assets/images/gallery')
+        if not gallery_dir.is_dir():
+            log('ERROR', f"Gallery folder does not exist: {gallery_dir}")
+            sys.exit(1)
+        client = TaggingClient(api_key, workers=args.workers, rate=args.rate,
+                               max_image_edge=args.max_upload_edge, log=log)
+        cache = None if args.no_cache else TagCache(refresh=args.refresh)
+        try:
+            watch_galleries(
+                gallery_dir,
+                lambda batch: process_watch_batch(batch, client, cache, args.variant_distance,
+                                                  args.local_analysis),
+                debounce=args.debounce, polling=args.poll, log=log)
+        finally:
+            client.close()
+            if cache is not None:
+                cache.close()
+        return
     
-    # Extract collection ID from path
-    collection_id = Path(args.collection_path).name
+    collection_paths = expand_collection_paths(args.collection_paths)
+    batch = args.batch or len(collection_paths) > 1
+    overrides = {
+        'title': args.title,
+        'location': args.location,
+        'date': args.date,
+        'description': args.description,
+        'displayCategory': args.display_category,
+    }
     
-    # Check if this is an existing collection
-    is_existing = check_if_existing_collection(args.collection_path)
+    # Validate every collection and gather its info before any work starts,
+    # so nothing waits on a prompt halfway through
+    collections = []  # (collection_path, collection_id, is_existing, collection_info)
+    for collection_path in collection_paths:
+        if not validate_collection_folder(collection_path):
+            if not batch:
+                sys.exit(1)
+            log('WARNING', f"Skipping {collection_path}")
+            continue
+        
+        # Extract collection ID from path
+        collection_id = Path(collection_path).name
+        
+        # Check if this is an existing collection
+        is_existing = check_if_existing_collection(collection_path)
+        
+        print("\n" + "="*60)
+        if is_existing:
+            print(f"DETECTED: Existing collection")
+        else:
+            print(f"DETECTED: New collection")
+        print(f"Collection ID: {collection_id}")
+        print("="*60 + "\n")
+        
+        collection_info = None
+        if not is_existing:
+            try:
+                collection_info = collection_info_for(collection_path, overrides, interactive=not batch)
+            except ValueError as e:
+                log('ERROR', f"Invalid {COLLECTION_INFO_FILENAME} for {collection_id}: {e}")
+                if not batch:
+                    sys.exit(1)
+                continue
+        collections.append((collection_path, collection_id, is_existing, collection_info))
     
-    print("\n" + "="*60)
-    if is_existing:
-        print(f"DETECTED: Existing collection")
-    else:
-        print(f"DETECTED: New collection")
-    print(f"Collection ID: {collection_id}")
-    print("="*60 + "\n")
+    if not collections:
+        log('ERROR', "No collections to process")
+        sys.exit(1)
     
-    # Step 1: Generate thumbnails
+    # Step 1: Find new images and generate their thumbnails (one pass)
     print("\n[STEP 1] Generating Thumbnails")
     print("-" * 60)
-    if is_existing:
-        new_images, total = find_new_images(args.collection_path)
-        if new_images:
-            generate_thumbnails(args.collection_path, specific_images=new_images)
-        else:
-            log('INFO', f"All {total} images already have thumbnails. Skipping.")
-    else:
-        generate_thumbnails(args.collection_path)
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    ingested = ingest_collections([c[0] for c in collections], args.variant_distance, jobs)
+    for (_, collection_id, is_existing, _), (new_images, total, _) in zip(collections, ingested):
+        if is_existing and not new_images:
+            log('INFO', f"{collection_id}: all {total} images already have thumbnails. Skipping.")
     
-    # Step 2: Generate metadata
+    # Step 2: Generate metadata, describing every collection's new images
+    # on one shared pool of Perplexity workers
     print("\n[STEP 2] Creating Metadata (with Perplexity AI)")
     print("-" * 60)
-    generate_metadata(args.collection_path, collection_id, api_key, new_images_only=is_existing)
+    client = TaggingClient(api_key, workers=args.workers, rate=args.rate,
+                           max_image_edge=args.max_upload_edge, log=log)
+    cache = None if args.no_cache else TagCache(refresh=args.refresh)
+    completed = []
+    failures = []
+    try:
+        batches = []
+        for (collection_path, _, is_existing, collection_info), (new_images, _, _) in zip(collections, ingested):
+            if is_existing:
+                collection_info = collection_info_of(load_existing_metadata(collection_path))
+            batches.append((new_images, collection_info))
+        
+        # Local analysis of every collection that gets new images, each in
+        # one batched pass (also ranks the cover and featured images)
+        analyses = [{} for _ in batches]
+        all_analyses = {}
+        if args.local_analysis != 'off':
+            for index, (collection_path, _, _, _) in enumerate(collections):
+                if batches[index][0]:
+                    analyses[index] = analyze_collection(collection_path, batches[index][0])
+                    all_analyses.update(analyses[index])
+        
+        analyzed = [[] for _ in batches]
+        queued = sum(len(images) for images, _ in batches)
+        if queued:
+            log('INFO', f"Analyzing {queued} image(s) from {len(batches)} collection(s)...")
+        with stage('describe'):
+            for index, result in describe_batches(client, batches, cache, all_analyses,
+                                                  args.local_analysis == 'skip'):
+                analyzed[index].append(result)
+        
+        for index, ((collection_path, collection_id, is_existing, collection_info),
+                    (new_images, total, built)) in enumerate(zip(collections, ingested)):
+            try:
+                with folder_lock(collection_path, log):
+                    generate_metadata(collection_path, collection_id, client,
+                                      new_images, total, built,
+                                      new_images_only=is_existing, cache=cache,
+                                      collection_info=collection_info, analyzed=analyzed[index],
+                                      analyses=analyses[index])
+            except Exception as e:
+                if not batch:
+                    raise
+                log('ERROR', f"✗ Failed to write metadata for {collection_id}: {str(e)}")
+                failures.append(collection_id)
+                continue
+            completed.append((collection_id, is_existing))
+    finally:
+        client.close()
+        if cache is not None:
+            log('INFO', f"AI cache: {cache.hits} hit(s), {cache.misses} miss(es)")
+            cache.close()
     
-    # Step 3: Update JS configs (only for new collections)
-    if not is_existing:
+    # Step 3: Update JS configs once, for every new collection
+    new_collection_ids = [collection_id for collection_id, is_existing in completed if not is_existing]
+    if new_collection_ids:
         print("\n[STEP 3] Updating Configuration Files")
         print("-" * 60)
-        update_javascript_configs(collection_id)
+        update_javascript_configs(new_collection_ids)
+    
+    # Step 4: Rebuild the site-wide gallery index, search index and pre-rendered pages
+    print("\n[STEP 4] Updating Gallery Index and Pages")
+    print("-" * 60)
+    gallery_dirs = sorted({Path(c[0]).resolve().parent for c in collections})
+    for gallery_dir in gallery_dirs:
+        build_gallery_index(gallery_dir, log=log)
+        build_search_index(gallery_dir, log=log)
+        prerender_site(gallery_dir, log=log)
+        publish_assets(gallery_dir, log=log)
+        precompress_site(gallery_dir, log=log)
     
     # Summary
     print("\n" + "="*60)
     print("✓ COLLECTION PROCESSING COMPLETE!")
     print("="*60)
+    if batch:
+        print(f"\n{len(completed)} collection(s) processed:")
+        for collection_id, is_existing in completed:
+            print(f"  - {collection_id} ({'updated' if is_existing else 'new'})")
+        if failures:
+            print(f"\n✗ {len(failures)} collection(s) failed: {', '.join(failures)}")
+        print("\nNext steps:")
+        print("  1. Review each metadata.json (Perplexity made intelligent guesses)")
+        print("  2. git add assets/images/gallery/ *.html {}/".format(COLLECTION_PAGES_DIR))
+        print("  3. git commit -m 'Add {} collections'".format(len(completed)))
+        print("  git push origin main\n")
+        if failures:
+            sys.exit(1)
+        return
+    
+    collection_id, is_existing = completed[0]
     print(f"\nCollection '{collection_id}' is ready!\n")
     print("Next steps:")
     print("  1. Review metadata.json (Perplexity made intelligent guesses)")
     print("  2. Customize tags and descriptions as needed")
     if not is_existing:
         print("  3. Update displayCategory if needed")
-        print("  4. git add assets/images/gallery/{}/".format(collection_id))
+        print("  4. git add assets/images/gallery/{}/ assets/images/gallery/{} *.html {}/".format(collection_id, INDEX_FILENAME, COLLECTION_PAGES_DIR))
         print("  5. git commit -m 'Add {} collection'".format(collection_id))
     else:
-        print("  3. git add assets/images/gallery/{}/".format(collection_id))
+        print("  3. git add assets/images/gallery/{}/ assets/images/gallery/{} *.html {}/".format(collection_id, INDEX_FILENAME, COLLECTION_PAGES_DIR))
         print("  4. git commit -m 'Update {} collection with new images'".format(collection_id))
     print("  git push origin main")
     print("\nYour homepage will auto-update!\n")
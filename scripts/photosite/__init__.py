@@ -0,0 +1,7 @@
+"""
+PhotoSite build helpers shared by generate-thumbnails.py and
+scripts/generate-collection.py.
+
+The command-line tools add the scripts/ folder to sys.path and import
+the individual modules, e.g. ``from photosite.manifest import BuildManifest``.
+"""
@@ -0,0 +1,121 @@
+"""
+Persistent cache of AI-generated descriptions and tags.
+
+Entries are keyed by the image's SHA-256 and a hash of the request
+context (model + prompt, which includes the image title and collection
+info), so an image that was tagged before - in a collection that was
+deleted and rebuilt, or copied from another collection with the same
+context - is answered locally instead of calling the API again.
+
+The cache is a single SQLite file, by default
+~/.cache/photosite/ai-tags.sqlite3 (override the folder with
+PHOTOSITE_CACHE_DIR). Entries expire after ttl_days, and the least
+recently used entries are dropped beyond max_entries.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from photosite.instrument import count
+
+CACHE_DIR = Path(os.environ.get('PHOTOSITE_CACHE_DIR', Path.home() / '.cache' / 'photosite'))
+CACHE_FILENAME = 'ai-tags.sqlite3'
+DEFAULT_TTL_DAYS = 365
+DEFAULT_MAX_ENTRIES = 50000
+
+
+def context_hash(*parts):
+    """Stable hash of the request context (model name, prompt, ...)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class TagCache:
+    """SQLite-backed (image hash, context hash) -> (description, tags) cache."""
+
+    def __init__(self, path=None, ttl_days=DEFAULT_TTL_DAYS,
+                 max_entries=DEFAULT_MAX_ENTRIES, refresh=False):
+        self.path = Path(path) if path else CACHE_DIR / CACHE_FILENAME
+        self.ttl = ttl_days * 24 * 60 * 60
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS tags (
+                image_hash TEXT NOT NULL,
+                context_hash TEXT NOT NULL,
+                description TEXT NOT NULL,
+                tags TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (image_hash, context_hash)
+            )
+        ''')
+        self.db.commit()
+        self.evict()
+
+    def get(self, image_hash, context):
+        """
+        Cached (description, tags) for an image/context, or None.
+
+        Always None when the cache was opened with refresh=True.
+        """
+        if self.refresh:
+            self.misses += 1
+            count('ai_cache_misses')
+            return None
+        with self.lock:
+            row = self.db.execute(
+                'SELECT description, tags, created FROM tags '
+                'WHERE image_hash = ? AND context_hash = ?',
+                (image_hash, context)
+            ).fetchone()
+            if row is None or time.time() - row[2] > self.ttl:
+                self.misses += 1
+                count('ai_cache_misses')
+                return None
+            self.db.execute(
+                'UPDATE tags SET last_used = ? WHERE image_hash = ? AND context_hash = ?',
+                (time.time(), image_hash, context)
+            )
+            self.db.commit()
+            self.hits += 1
+            count('ai_cache_hits')
+        return row[0], json.loads(row[1])
+
+    def put(self, image_hash, context, description, tags):
+        """Store the API result for an image/context."""
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?, ?, ?)',
+                (image_hash, context, description, json.dumps(tags), now, now)
+            )
+            self.db.commit()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used beyond max_entries."""
+        with self.lock:
+            self.db.execute('DELETE FROM tags WHERE created < ?', (time.time() - self.ttl,))
+            self.db.execute(
+                'DELETE FROM tags WHERE rowid IN ('
+                'SELECT rowid FROM tags ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,323 @@
+"""
+Local image analysis: tags and sharpness from pixel statistics and EXIF.
+
+Several tags of the Perplexity vocabulary describe how a photograph looks
+rather than what it shows, and can be told from its pixels and exposure
+data without the API:
+
+    night      mostly dark pixels, a long exposure or high ISO
+    stars      many isolated bright points on a dark frame
+    milky-way  stars plus a broad, faint band of light in the sky
+    astro      stars or the Milky Way
+    sunset     warm, saturated red/orange light in the upper part of the frame
+    color      high colorfulness (Hasler & Suesstrunk)
+    panoramic  an aspect ratio of PANORAMA_ASPECT or more
+
+analyze_images() works on a whole collection at once: every image is read
+from its smallest rendition that covers ANALYSIS_SIZE (or draft-decoded
+from the original when it has none), resampled to an ANALYSIS_SIZE square
+and stacked into one array, ANALYSIS_BATCH images at a time, so each
+statistic is a single vectorized NumPy expression over the batch. The
+variance of the Laplacian of the luminance is kept as a sharpness score,
+which generate-collection.py uses to pick the cover and featured images.
+
+Each tag gets a score between 0 and 1. Scores of CONFIDENT_SCORE or more
+attach the tag; scores of 1 - CONFIDENT_SCORE or less rule it out. Tags
+decided either way are left out of the Perplexity prompt, and an image
+with every tag decided is 'confident'. NumPy is optional: without it
+analyze_images() returns nothing and tagging works as before.
+"""
+
+import math
+from pathlib import Path
+
+from PIL import Image
+
+from photosite.exif import EXIF_FIELD, read_capture_metadata
+from photosite.imaging import TRANSPOSED_ORIENTATIONS, open_original, open_scaled, orientation, upright
+from photosite.instrument import count, timed
+from photosite.renditions import RENDITION_WIDTHS, current_file, rendition_path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+LOCAL_TAGS = ('night', 'stars', 'milky-way', 'astro', 'sunset', 'color', 'panoramic')
+
+ANALYSIS_SIZE = 384   # side of the square every image is resampled to
+ANALYSIS_BATCH = 32   # images stacked into one array
+CONFIDENT_SCORE = 0.8
+
+PANORAMA_ASPECT = 2.0
+DARK_LUMINANCE = 0.15       # luminance (0-1) below which a pixel counts as dark
+HISTOGRAM_BINS = 20         # of 0.05 luminance each
+SKY_LUMINANCE = 0.12        # a star is a local maximum on surroundings darker than this...
+STAR_CONTRAST = 0.08        # ...and at least this much brighter than them
+SKY_BLOCKS = 16             # sky glow is measured on a SKY_BLOCKS x SKY_BLOCKS grid
+
+# Rec. 709 luma weights
+LUMA_WEIGHTS = (0.2126, 0.7152, 0.0722)
+
+
+def _ramp(values, low, high):
+    """0 at or below low, 1 at or above high, linear in between (element-wise)."""
+    return np.clip((values - low) / (high - low), 0.0, 1.0)
+
+
+def exposure_seconds(exif):
+    """Exposure time in seconds from a metadata.json 'exif' entry ('1/250', '30'), or None."""
+    value = (exif or {}).get('exposureTime')
+    if not value:
+        return None
+    try:
+        numerator, _, denominator = str(value).partition('/')
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def analysis_source(image_file):
+    """
+    Smallest current rendition of an original that covers ANALYSIS_SIZE, or None.
+
+    Renditions older than the original are ignored.
+    """
+    image_file = Path(image_file)
+    collection_path = image_file.parent.parent
+    source_mtime = image_file.stat().st_mtime
+    for width in sorted(RENDITION_WIDTHS):
+        if width < ANALYSIS_SIZE:
+            continue
+        path = current_file(rendition_path(collection_path, width, image_file.name))
+        if path is None or path.stat().st_mtime < source_mtime:
+            continue
+        with Image.open(path) as rendition:
+            if min(rendition.size) >= ANALYSIS_SIZE:
+                return path
+    return None
+
+
+def load_pixels(image_file):
+    """
+    An image resampled to an ANALYSIS_SIZE square, upright.
+
+    Returns:
+        tuple: (uint8 array of shape (ANALYSIS_SIZE, ANALYSIS_SIZE, 3),
+                aspect ratio width / height of the upright image)
+    """
+    square = (ANALYSIS_SIZE, ANALYSIS_SIZE)
+    source = analysis_source(image_file)
+    if source is not None:
+        with Image.open(source) as img:
+            aspect = img.width / img.height
+            pixels = img.convert('RGB').resize(square, Image.Resampling.BOX)
+        return np.asarray(pixels), aspect
+
+    count('analysis_original_decodes')
+    with open_original(image_file) as probe:
+        width, height = probe.size
+        if orientation(probe) in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+    img, _ = open_scaled(image_file, min(width, math.ceil(ANALYSIS_SIZE * max(1.0, width / height))))
+    with img:
+        pixels = upright(img)[0].convert('RGB').resize(square, Image.Resampling.BOX)
+    return np.asarray(pixels), width / height
+
+
+def pixel_statistics(pixels):
+    """
+    Per-image statistics of a batch of images.
+
+    Args:
+        pixels: uint8 array of shape (N, H, W, 3)
+
+    Returns:
+        dict: name -> float array of shape (N,): 'histogram' (N, HISTOGRAM_BINS
+              luminance shares), 'dark' (share of dark pixels), 'colorfulness',
+              'warmSky' (share of warm, saturated pixels in the upper 60%),
+              'stars' (star-like points per 10,000 dark pixels), 'skyGlow'
+              (mean luminance of the darker blocks of the upper two thirds)
+              and 'sharpness'
+    """
+    n, height, width, _ = pixels.shape
+    rgb = pixels.astype(np.float32) / 255.0
+    red, green, blue = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    luma = rgb @ np.asarray(LUMA_WEIGHTS, dtype=np.float32)
+
+    # Luminance histogram of every image with one bincount
+    bins = np.minimum((luma * HISTOGRAM_BINS).astype(np.int64), HISTOGRAM_BINS - 1)
+    offsets = (np.arange(n) * HISTOGRAM_BINS)[:, None, None]
+    histogram = np.bincount((bins + offsets).ravel(), minlength=n * HISTOGRAM_BINS)
+    histogram = histogram.reshape(n, HISTOGRAM_BINS) / (height * width)
+    dark = histogram[:, :round(DARK_LUMINANCE * HISTOGRAM_BINS)].sum(axis=1)
+
+    # Colorfulness: spread and strength of the opponent color channels
+    rg = (red - green) * 255.0
+    yb = ((red + green) / 2 - blue) * 255.0
+    colorfulness = (np.hypot(rg.std(axis=(1, 2)), yb.std(axis=(1, 2)))
+                    + 0.3 * np.hypot(rg.mean(axis=(1, 2)), yb.mean(axis=(1, 2))))
+
+    # Red to orange hues (R > G > B, hue below 45 degrees), saturated and lit
+    top = rgb[:, :int(height * 0.6)]
+    high, low = top.max(axis=-1), top.min(axis=-1)
+    saturation = np.where(high > 0, (high - low) / np.maximum(high, 1e-6), 0.0)
+    hue = 60.0 * (top[..., 1] - top[..., 2]) / np.maximum(high - low, 1e-6)
+    warm = ((top[..., 0] == high) & (top[..., 1] >= top[..., 2]) & (hue < 45.0)
+            & (saturation > 0.35) & (high > 0.2))
+    warm_sky = warm.mean(axis=(1, 2))
+
+    # Stars: local maxima on a dark surround, clearly brighter than their
+    # 8 neighbours, counted against the dark area they can appear in
+    center = luma[:, 1:-1, 1:-1]
+    brightest = np.zeros_like(center)
+    surround = np.zeros_like(center)
+    for dy, dx in ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)):
+        neighbour = luma[:, 1 + dy:height - 1 + dy, 1 + dx:width - 1 + dx]
+        np.maximum(brightest, neighbour, out=brightest)
+        surround += neighbour
+    surround /= 8
+    dark_surround = surround < SKY_LUMINANCE
+    peaks = (center > brightest) & (center - surround >= STAR_CONTRAST) & dark_surround
+    stars = peaks.sum(axis=(1, 2)) * 10000.0 / np.maximum(dark_surround.sum(axis=(1, 2)), 1)
+
+    # Milky Way: diffuse glow across the darker blocks of the sky
+    block = height // SKY_BLOCKS
+    blocks = luma[:, :block * SKY_BLOCKS, :block * SKY_BLOCKS].reshape(
+        n, SKY_BLOCKS, block, SKY_BLOCKS, block).mean(axis=(2, 4))
+    sky = blocks[:, :SKY_BLOCKS * 2 // 3].reshape(n, -1)
+    dark_sky = sky < 0.3
+    sky_glow = (sky * dark_sky).sum(axis=1) / np.maximum(dark_sky.sum(axis=1), 1)
+
+    # Sharpness: variance of the Laplacian of the luminance
+    laplacian = (4 * center - luma[:, :-2, 1:-1] - luma[:, 2:, 1:-1]
+                 - luma[:, 1:-1, :-2] - luma[:, 1:-1, 2:])
+    sharpness = laplacian.var(axis=(1, 2)) * 1000.0
+
+    return {
+        'histogram': histogram,
+        'dark': dark,
+        'colorfulness': colorfulness,
+        'warmSky': warm_sky,
+        'stars': stars,
+        'skyGlow': sky_glow,
+        'sharpness': sharpness,
+    }
+
+
+def tag_scores(stats, aspect, exposure, iso):
+    """
+    Scores (0-1) of the LOCAL_TAGS for a batch.
+
+    Args:
+        stats: pixel_statistics() of the batch
+        aspect, exposure, iso: float arrays of shape (N,), NaN where unknown
+
+    Returns:
+        dict: tag -> float array of shape (N,)
+    """
+    darkness = _ramp(stats['dark'], 0.25, 0.65)
+    # EXIF nudges the darkness call either way: long or high-ISO exposures
+    # towards night, short low-ISO ones away from it
+    has_exif = ~(np.isnan(exposure) & np.isnan(iso))
+    night_exposure = np.fmax(_ramp(np.log2(exposure), -5.0, 1.0), _ramp(iso, 1600.0, 6400.0))
+    night_exposure = np.nan_to_num(night_exposure, nan=0.5)
+    night = np.clip(darkness + np.where(has_exif, 0.4 * (night_exposure - 0.5), 0.0), 0.0, 1.0)
+
+    stars = _ramp(stats['stars'], 60.0, 150.0) * _ramp(stats['dark'], 0.3, 0.5)
+    milky_way = stars * _ramp(stats['skyGlow'], 0.06, 0.1)
+    long_exposure = np.nan_to_num(_ramp(exposure, 2.0, 15.0), nan=0.0)
+    astro = np.clip(np.fmax(stars, milky_way) + 0.2 * long_exposure * darkness, 0.0, 1.0)
+
+    sunset = _ramp(stats['warmSky'], 0.15, 0.45) * (1.0 - _ramp(stats['dark'], 0.7, 0.9))
+    color = _ramp(stats['colorfulness'], 30.0, 75.0)
+    panoramic = np.nan_to_num(_ramp(np.fmax(aspect, 1.0 / aspect), 1.7, PANORAMA_ASPECT), nan=0.0)
+
+    return {
+        'night': night,
+        'stars': stars,
+        'milky-way': milky_way,
+        'astro': astro,
+        'sunset': sunset,
+        'color': color,
+        'panoramic': panoramic,
+    }
+
+
+def _exif_numbers(image_file):
+    exif = read_capture_metadata(image_file).get(EXIF_FIELD, {})
+    seconds = exposure_seconds(exif)
+    return (float('nan') if seconds is None else seconds,
+            float(exif.get('iso') or 'nan'))
+
+
+def _results(files, stats, scores):
+    results = {}
+    for i, image_file in enumerate(files):
+        image_scores = {tag: round(float(scores[tag][i]), 3) for tag in LOCAL_TAGS}
+        tags = [tag for tag in LOCAL_TAGS if image_scores[tag] >= CONFIDENT_SCORE]
+        decided = [tag for tag in LOCAL_TAGS
+                   if image_scores[tag] >= CONFIDENT_SCORE or image_scores[tag] <= 1 - CONFIDENT_SCORE]
+        results[image_file] = {
+            'scores': image_scores,
+            'tags': tags,
+            'decided': decided,
+            'confident': len(decided) == len(LOCAL_TAGS),
+            'sharpness': round(float(stats['sharpness'][i]), 3),
+        }
+    return results
+
+
+@timed('analysis')
+def analyze_images(image_files, log=None):
+    """
+    Analyze a collection's originals in batches (see module docstring).
+
+    Images that cannot be read are left out with a warning.
+
+    Returns:
+        dict: image path -> {'scores': {tag: 0-1}, 'tags': confident tags,
+              'decided': tags attached or ruled out, 'confident': bool,
+              'sharpness': float}; empty when NumPy is not installed
+    """
+    log = log or (lambda level, message: None)
+    if np is None:
+        log('WARNING', "  numpy is not installed; skipping local image analysis (pip install numpy)")
+        return {}
+
+    results = {}
+    image_files = [Path(f) for f in image_files]
+    for start in range(0, len(image_files), ANALYSIS_BATCH):
+        files, pixels, aspects, exposures, isos = [], [], [], [], []
+        for image_file in image_files[start:start + ANALYSIS_BATCH]:
+            try:
+                image_pixels, aspect = load_pixels(image_file)
+                exposure, iso = _exif_numbers(image_file)
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                log('WARNING', f"  Could not analyze {image_file.name}: {e}")
+                continue
+            files.append(image_file)
+            pixels.append(image_pixels)
+            aspects.append(aspect)
+            exposures.append(exposure)
+            isos.append(iso)
+        if not files:
+            continue
+        stats = pixel_statistics(np.stack(pixels))
+        scores = tag_scores(stats, np.asarray(aspects), np.asarray(exposures), np.asarray(isos))
+        results.update(_results(files, stats, scores))
+        count('analysis_images', len(files))
+    return results
+
+
+def merge_tags(api_tags, analysis):
+    """
+    API tags with the local decisions applied.
+
+    Tags the analysis decided are taken from it (the confident ones added,
+    the ruled-out ones dropped); every other API tag is kept, in order.
+    """
+    if not analysis:
+        return list(api_tags or [])
+    tags = [tag for tag in api_tags or [] if tag not in analysis['decided']]
+    return tags + [tag for tag in analysis['tags'] if tag not in tags]
@@ -0,0 +1,208 @@
+"""
+Precompressed gzip and Brotli siblings of the site's text files.
+
+Every served JSON, JS, CSS and HTML file gets a <name>.gz and, when the
+brotli module is installed, a <name>.br next to it, compressed at maximum
+level, so a host that serves precompressed files (or a CDN rule picking
+them by Accept-Encoding) does no compression work per request:
+
+    assets/images/gallery/japan-2025/metadata.json
+    assets/images/gallery/japan-2025/metadata.json.gz
+    assets/images/gallery/japan-2025/metadata.json.br
+
+The siblings hold the minified text: JSON re-serialized without
+whitespace, CSS without comments and layout whitespace, JS through rjsmin
+when it is installed. The plain files stay as written, metadata.json
+keeping its indentation for hand edits and readable diffs.
+
+gzip output carries no timestamp, so the siblings only change when the
+content does. The content hash of each source is recorded in
+assets/.compress-cache.json (local build state), and files whose hash is
+unchanged are skipped; siblings whose source is gone are removed.
+"""
+
+import gzip
+import itertools
+import json
+import re
+from pathlib import Path
+
+from photosite.fingerprint import content_digest
+from photosite.instrument import timed
+from photosite.prerender import COLLECTION_PAGES_DIR
+from photosite.site_index import site_root
+from photosite.storage import atomic_write
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+CACHE_PATH = Path('assets') / '.compress-cache.json'
+CACHE_VERSION = 1
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Served files that are not fetched by browsers
+UNSERVED_FILENAMES = frozenset(('collection-info.json',))
+
+CSS_STRING = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+CSS_STRING_OR_COMMENT = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+
+
+def minify_json(text):
+    """JSON text re-serialized without whitespace (key order kept)."""
+    return json.dumps(json.loads(text), separators=(',', ':'), ensure_ascii=False)
+
+
+def minify_css(text):
+    """CSS without comments and without whitespace that does not separate tokens; strings are kept as they are."""
+    text = CSS_STRING_OR_COMMENT.sub(lambda match: match.group(1) or '', text)
+    parts = CSS_STRING.split(text)
+    for i in range(0, len(parts), 2):  # odd parts are strings
+        code = re.sub(r'\s+', ' ', parts[i])
+        code = re.sub(r' ?([{};,>]) ?', r'\1', code)
+        code = code.replace(': ', ':').replace(';}', '}')
+        parts[i] = code
+    return ''.join(parts).strip()
+
+
+def minify_js(text):
+    """JS through rjsmin if it is installed, else unchanged."""
+    return rjsmin.jsmin(text) if rjsmin else text
+
+
+MINIFIERS = {
+    '.json': minify_json,
+    '.css': minify_css,
+    '.js': minify_js,
+    '.html': lambda text: text,
+}
+SIBLING_SUFFIXES = ('.gz', '.br')
+
+
+def encodings():
+    """Sibling suffixes written with the installed modules."""
+    return ('.gz', '.br') if brotli else ('.gz',)
+
+
+def compress(data, suffix):
+    """data compressed for a '.gz' or '.br' sibling."""
+    if suffix == '.gz':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return brotli.compress(data, mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+
+
+def _candidates(root):
+    return itertools.chain(
+        root.glob('*'),
+        (root / COLLECTION_PAGES_DIR).glob('*'),
+        (root / 'assets').rglob('*'),
+    )
+
+
+def served_files(root):
+    """Text files of the site that get precompressed siblings."""
+    root = Path(root)
+    return sorted(
+        path for path in _candidates(root)
+        if path.suffix in MINIFIERS and not path.name.startswith('.')
+        and path.name not in UNSERVED_FILENAMES and path.is_file()
+    )
+
+
+def _settings():
+    return {'encodings': list(encodings()), 'minifyJs': rjsmin is not None}
+
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != CACHE_VERSION or cache.get('settings') != _settings():
+        return {}
+    return cache.get('files', {})
+
+
+def precompress(path):
+    """
+    Write the minified, compressed siblings of one file.
+
+    A '.br' sibling left by an earlier run is removed when brotli is not
+    installed, since it would be stale.
+
+    Raises:
+        ValueError: if the file is not UTF-8 text or not valid JSON
+    """
+    path = Path(path)
+    text = path.read_text(encoding='utf-8')
+    data = MINIFIERS[path.suffix](text).encode('utf-8')
+    for suffix in SIBLING_SUFFIXES:
+        sibling = path.with_name(path.name + suffix)
+        if suffix in encodings():
+            atomic_write(sibling, compress(data, suffix))
+        elif sibling.exists():
+            sibling.unlink()
+
+
+@timed('compress')
+def precompress_site(gallery_dir, log=None):
+    """
+    Write precompressed siblings for every served text file of the site a gallery folder belongs to.
+
+    Returns:
+        list: paths whose siblings were (re)written
+    """
+    log = log or (lambda level, message: None)
+    root = site_root(gallery_dir)
+    cache_path = root / CACHE_PATH
+    cached = _load_cache(cache_path)
+
+    files = served_files(root)
+    digests = {}
+    written = []
+    for path in files:
+        relative = path.relative_to(root).as_posix()
+        digest = content_digest(path.read_bytes())
+        digests[relative] = digest
+        siblings_exist = all(path.with_name(path.name + suffix).exists() for suffix in encodings())
+        if cached.get(relative) == digest and siblings_exist:
+            continue
+        try:
+            precompress(path)
+        except ValueError as e:
+            log('WARNING', f"  Could not compress {relative}: {e}")
+            del digests[relative]
+            continue
+        written.append(path)
+
+    # Siblings of deleted files, and of files that could not be compressed
+    sources = {root / relative for relative in digests}
+    removed = 0
+    for sibling in sorted(_candidates(root)):
+        if sibling.suffix in SIBLING_SUFFIXES and sibling.with_suffix('').suffix in MINIFIERS \
+                and sibling.with_suffix('') not in sources:
+            sibling.unlink()
+            removed += 1
+
+    if digests != cached:
+        atomic_write(cache_path, json.dumps(
+            {'version': CACHE_VERSION, 'settings': _settings(), 'files': digests},
+            separators=(',', ':'), sort_keys=True))
+
+    formats = ' and '.join('Brotli' if suffix == '.br' else 'gzip' for suffix in encodings())
+    if written or removed:
+        log('SUCCESS', f"  ✓ Precompressed {len(written)} of {len(files)} files ({formats}), "
+                       f"{removed} stale siblings removed")
+    else:
+        log('INFO', f"  Precompressed files are up to date ({len(files)} files, {formats})")
+    if not brotli:
+        log('WARNING', "  brotli is not installed; only .gz files were written (pip install brotli)")
+    return written
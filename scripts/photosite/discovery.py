@@ -0,0 +1,44 @@
+"""
+Finding collections and their originals.
+
+Every tool uses the same rules, so they agree on which files are originals
+and build the same outputs from them: a collection is a gallery subfolder
+with a full-res/ folder, and its originals are the JPEGs in it (.jpg or
+.jpeg in any letter case), sorted by filename. Hidden files (editor and
+upload temporaries such as .DSC_0001.jpg.part) are never originals.
+"""
+
+from pathlib import Path
+
+FULL_RES_DIRNAME = 'full-res'
+SOURCE_SUFFIXES = ('.jpg', '.jpeg')
+
+
+def is_source_image(path):
+    """True for originals the tools process."""
+    path = Path(path)
+    return path.suffix.lower() in SOURCE_SUFFIXES and not path.name.startswith('.')
+
+
+def full_res_dir(collection_path):
+    """Folder holding a collection's originals."""
+    return Path(collection_path) / FULL_RES_DIRNAME
+
+
+def collection_of(path):
+    """Collection folder of an original's path."""
+    return Path(path).parent.parent
+
+
+def source_images(collection_path):
+    """A collection's originals, sorted by filename (empty if it has no full-res/ folder)."""
+    folder = full_res_dir(collection_path)
+    if not folder.is_dir():
+        return []
+    return sorted((p for p in folder.iterdir() if p.is_file() and is_source_image(p)),
+                  key=lambda p: p.name)
+
+
+def collection_folders(gallery_dir):
+    """Collection folders in a gallery folder (those with a full-res/ folder), sorted by name."""
+    return sorted(p for p in Path(gallery_dir).iterdir() if full_res_dir(p).is_dir())
@@ -0,0 +1,114 @@
+"""
+Modern-format (WebP/AVIF) encoding for renditions.
+
+For each image the quality setting of every modern format is picked
+automatically: a probe rendition is encoded as JPEG at the configured
+JPEG quality, and a binary search finds the lowest WebP/AVIF quality
+whose RMS error against the source pixels is no worse than the JPEG's.
+That quality is then used for every rendition of the image, so the
+modern variants match the JPEG visually at fewer bytes. The search
+encodes with a format's faster 'search_options' (AVIF speed 10, WebP
+method 2), on the assumption that they pick the same quality as the final
+'options' would; the quality_search benchmark (benchmarks/run_benchmarks.py)
+checks that they stay within SEARCH_QUALITY_TOLERANCE and times both.
+Callers cache the result per image content (see
+photosite.renditions.rendition_qualities).
+
+AVIF is only produced when the installed Pillow can encode it, and a
+format is skipped for renditions longer than it can encode (WebP stops
+at 16383 pixels, which the wide renditions of tall panoramas exceed).
+"""
+
+import io
+
+from PIL import Image, ImageChops, ImageStat, features
+
+# format name -> Pillow plugin name, file extension, extra save options
+# (and faster ones for the quality search), longest edge the format can encode
+MODERN_FORMATS = {
+    'webp': {'pil_format': 'WEBP', 'extension': '.webp', 'options': {'method': 4},
+             'search_options': {'method': 2}, 'max_edge': 16383},
+    'avif': {'pil_format': 'AVIF', 'extension': '.avif', 'options': {'speed': 8},
+             'search_options': {'speed': 10}, 'max_edge': 65535},
+}
+
+# Search range for auto-picked qualities
+QUALITY_MIN = 40
+QUALITY_MAX = 90
+
+# Largest difference tolerated between the quality a format's
+# search_options pick and the one its final options would pick
+SEARCH_QUALITY_TOLERANCE = 3
+
+
+def available_formats():
+    """Modern formats the installed Pillow build can encode, in preference order."""
+    return [name for name in ('avif', 'webp') if features.check(name)]
+
+
+def _encode(img, pil_format, quality, **options):
+    buffer = io.BytesIO()
+    img.save(buffer, format=pil_format, quality=quality, **options)
+    return buffer.getvalue()
+
+
+def encoding_error(img, data):
+    """RMS pixel error (0-255 scale) of encoded bytes against the source image."""
+    with Image.open(io.BytesIO(data)) as decoded:
+        decoded = decoded.convert('RGB')
+        channel_rms = ImageStat.Stat(ImageChops.difference(img, decoded)).rms
+    return sum(channel_rms) / len(channel_rms)
+
+
+def match_quality(img, fmt, target_error, options='search_options'):
+    """
+    Lowest quality for `fmt` whose error does not exceed target_error.
+
+    `options` names the format's option set to encode with ('options'
+    searches with the final settings). Returns QUALITY_MAX if even that
+    cannot match the target.
+    """
+    spec = MODERN_FORMATS[fmt]
+    low, high = QUALITY_MIN, QUALITY_MAX
+    while low < high:
+        quality = (low + high) // 2
+        data = _encode(img, spec['pil_format'], quality, **spec[options])
+        if encoding_error(img, data) <= target_error:
+            high = quality
+        else:
+            low = quality + 1
+    return low
+
+
+def pick_qualities(probe, jpeg_quality, formats=None, options='search_options'):
+    """
+    Choose a per-format quality for one image.
+
+    Args:
+        probe: RGB rendition of the image used for the comparison
+        jpeg_quality: JPEG quality the renditions are saved with
+        formats: formats to tune (default: available_formats())
+        options: option set the search encodes with (see match_quality)
+
+    Returns:
+        dict: format name -> quality
+    """
+    formats = available_formats() if formats is None else formats
+    target_error = encoding_error(probe, _encode(probe, 'JPEG', jpeg_quality))
+    return {fmt: match_quality(probe, fmt, target_error, options) for fmt in formats}
+
+
+def variant_path(rendition_path, fmt):
+    """Path of a modern-format sibling of a JPEG rendition."""
+    return rendition_path.with_suffix(MODERN_FORMATS[fmt]['extension'])
+
+
+def fits_format(size, fmt):
+    """True if an image of `size` can be encoded in the given modern format."""
+    return max(size) <= MODERN_FORMATS[fmt]['max_edge']
+
+
+def encode_variant(img, fmt, quality):
+    """Encoded bytes of img in the given modern format."""
+    spec = MODERN_FORMATS[fmt]
+    return _encode(img, spec['pil_format'], quality, **spec['options'])
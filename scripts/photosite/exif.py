@@ -0,0 +1,320 @@
+"""
+Header-only EXIF/IPTC extraction.
+
+A JPEG stores its EXIF (APP1) and IPTC (APP13, inside a Photoshop 8BIM
+resource) segments before the compressed image data. read_capture_metadata()
+walks the marker segments from the start of the file, reads only those two
+payloads, skips every other segment with a seek and stops at the start of
+the scan, so no pixel data is read or decoded. A typical original costs a
+few tens of kilobytes of I/O.
+
+The structured result is stored in each image's metadata.json entry:
+
+    "exif": {"captured", "camera", "lens", "focalLength", "focalLength35mm",
+             "aperture", "exposureTime", "iso", "orientation", "gps"}
+    "iptc": {"title", "caption", "keywords", "byline", "copyright",
+             "city", "state", "country"}
+
+Only fields present in the file are included.
+"""
+
+import json
+import struct
+from pathlib import Path
+
+from PIL import ExifTags, Image
+
+from photosite.discovery import collection_folders, full_res_dir
+from photosite.instrument import timed
+from photosite.storage import folder_lock, write_metadata
+
+EXIF_FIELD = 'exif'
+IPTC_FIELD = 'iptc'
+
+_SOI = b'\xff\xd8'
+_APP1 = 0xE1
+_APP13 = 0xED
+_SOS = 0xDA
+_EOI = 0xD9
+_EXIF_HEADER = b'Exif\x00\x00'
+_PHOTOSHOP_HEADER = b'Photoshop 3.0\x00'
+_IPTC_RESOURCE_ID = 0x0404
+
+# IPTC-IIM record 2 datasets -> field name
+_IPTC_DATASETS = {
+    5: 'title',
+    25: 'keywords',
+    80: 'byline',
+    90: 'city',
+    95: 'state',
+    101: 'country',
+    116: 'copyright',
+    120: 'caption',
+}
+_IPTC_REPEATABLE = {'keywords'}
+
+
+def read_app_segments(fp):
+    """
+    Return the (EXIF, IPTC) APP segment payloads of a JPEG, or None for each.
+
+    Args:
+        fp: binary file object positioned at the start of the file
+
+    Only segment headers and the APP1/APP13 payloads are read; non-JPEG
+    files return (None, None).
+    """
+    if fp.read(2) != _SOI:
+        return None, None
+
+    exif = iptc = None
+    while True:
+        marker = fp.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            break
+        code = marker[1]
+        if code == 0xFF:
+            # Fill byte before the marker
+            fp.seek(-1, 1)
+            continue
+        if code in (_SOS, _EOI):
+            break
+        if 0xD0 <= code <= 0xD7 or code == 0x01:
+            # Markers without a length
+            continue
+        header = fp.read(2)
+        if len(header) < 2:
+            break
+        length = struct.unpack('>H', header)[0] - 2
+        if code == _APP1 and exif is None:
+            payload = fp.read(length)
+            if payload.startswith(_EXIF_HEADER):
+                exif = payload
+        elif code == _APP13 and iptc is None:
+            payload = fp.read(length)
+            if payload.startswith(_PHOTOSHOP_HEADER):
+                iptc = payload
+        else:
+            fp.seek(length, 1)
+    return exif, iptc
+
+
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='replace')
+    return str(value).strip('\x00 ').strip() or None
+
+
+def _number(value, digits=2):
+    try:
+        return round(float(value), digits)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def _exposure_time(value):
+    seconds = _number(value, 6)
+    if not seconds:
+        return None
+    if seconds < 1:
+        return f'1/{round(1 / seconds)}'
+    return f'{seconds:g}'
+
+
+def _gps_coordinate(values, ref):
+    try:
+        degrees, minutes, seconds = (float(v) for v in values)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    coordinate = degrees + minutes / 60 + seconds / 3600
+    if _text(ref) in ('S', 'W'):
+        coordinate = -coordinate
+    return round(coordinate, 6)
+
+
+def parse_exif(payload):
+    """Structured fields from an APP1 EXIF payload (see module docstring)."""
+    exif = Image.Exif()
+    exif.load(payload)
+    details = exif.get_ifd(ExifTags.IFD.Exif)
+    gps_info = exif.get_ifd(ExifTags.IFD.GPSInfo)
+    tags = ExifTags.Base
+
+    make = _text(exif.get(tags.Make))
+    model = _text(exif.get(tags.Model))
+    if make and model and model.lower().startswith(make.split()[0].lower()):
+        make = None
+    captured = _text(details.get(tags.DateTimeOriginal) or exif.get(tags.DateTime))
+    if captured:
+        # '2025:03:14 18:02:11' -> ISO 8601, with the UTC offset when recorded
+        date, _, time = captured.partition(' ')
+        captured = date.replace(':', '-') + (f'T{time}' if time else '')
+        offset = _text(details.get(tags.OffsetTimeOriginal))
+        if offset and time:
+            captured += offset
+
+    fields = {
+        'captured': captured,
+        'camera': ' '.join(part for part in (make, model) if part) or None,
+        'lens': _text(details.get(tags.LensModel)),
+        'focalLength': _number(details.get(tags.FocalLength), 1),
+        'focalLength35mm': _number(details.get(tags.FocalLengthIn35mmFilm), 0),
+        'aperture': _number(details.get(tags.FNumber), 1),
+        'exposureTime': _exposure_time(details.get(tags.ExposureTime)),
+        'iso': _number(details.get(tags.ISOSpeedRatings), 0),
+        'orientation': exif.get(tags.Orientation),
+    }
+    for key in ('focalLength35mm', 'iso'):
+        if fields[key] is not None:
+            fields[key] = int(fields[key])
+
+    gps_tags = ExifTags.GPS
+    latitude = _gps_coordinate(gps_info.get(gps_tags.GPSLatitude), gps_info.get(gps_tags.GPSLatitudeRef))
+    longitude = _gps_coordinate(gps_info.get(gps_tags.GPSLongitude), gps_info.get(gps_tags.GPSLongitudeRef))
+    if latitude is not None and longitude is not None:
+        fields['gps'] = {'lat': latitude, 'lon': longitude}
+        altitude = _number(gps_info.get(gps_tags.GPSAltitude), 1)
+        if altitude is not None:
+            fields['gps']['alt'] = -altitude if gps_info.get(gps_tags.GPSAltitudeRef) == b'\x01' else altitude
+
+    return {key: value for key, value in fields.items() if value not in (None, '', 0)}
+
+
+def parse_iptc(payload):
+    """Structured fields from an APP13 Photoshop/IPTC payload (see module docstring)."""
+    data = payload[len(_PHOTOSHOP_HEADER):]
+    fields = {}
+    pos = 0
+    while pos + 12 <= len(data) and data[pos:pos + 4] == b'8BIM':
+        resource_id = struct.unpack('>H', data[pos + 4:pos + 6])[0]
+        name_length = data[pos + 6]
+        pos += 7 + name_length + ((name_length + 1) % 2)
+        size = struct.unpack('>I', data[pos:pos + 4])[0]
+        pos += 4
+        if resource_id == _IPTC_RESOURCE_ID:
+            fields.update(_parse_iim(data[pos:pos + size]))
+        pos += size + (size % 2)
+    return fields
+
+
+def _parse_iim(data):
+    fields = {}
+    pos = 0
+    while pos + 5 <= len(data) and data[pos] == 0x1C:
+        record, dataset = data[pos + 1], data[pos + 2]
+        size = struct.unpack('>H', data[pos + 3:pos + 5])[0]
+        pos += 5
+        if size & 0x8000:
+            # Extended dataset: the low bits give the length of the size field
+            count = size & 0x7FFF
+            size = int.from_bytes(data[pos:pos + count], 'big')
+            pos += count
+        value = data[pos:pos + size]
+        pos += size
+        name = _IPTC_DATASETS.get(dataset) if record == 2 else None
+        text = _text(value) if name else None
+        if not text:
+            continue
+        if name in _IPTC_REPEATABLE:
+            fields.setdefault(name, []).append(text)
+        else:
+            fields.setdefault(name, text)
+    return fields
+
+
+def read_capture_metadata(source):
+    """
+    EXIF/IPTC metadata fields for an image, read from its headers only.
+
+    Args:
+        source: path or binary file object positioned at the start
+
+    Returns:
+        dict: 'exif' and/or 'iptc' entries for the image's metadata.json
+              entry; empty if the file has neither (or is not a JPEG)
+    """
+    if hasattr(source, 'read'):
+        exif, iptc = read_app_segments(source)
+    else:
+        with open(source, 'rb') as f:
+            exif, iptc = read_app_segments(f)
+
+    fields = {}
+    if exif:
+        try:
+            parsed = parse_exif(exif)
+        except Exception:
+            parsed = {}
+        if parsed:
+            fields[EXIF_FIELD] = parsed
+    if iptc:
+        parsed = parse_iptc(iptc)
+        if parsed:
+            fields[IPTC_FIELD] = parsed
+    return fields
+
+
+@timed('metadata_update')
+def update_metadata_capture(collection_path):
+    """
+    Fill in the 'exif'/'iptc' fields of a collection's metadata.json.
+
+    Every image's original is read (headers only) and its entry updated
+    when the extracted fields differ. Does nothing if the collection has
+    no metadata.json.
+
+    Returns:
+        int: number of image entries changed
+    """
+    collection_path = Path(collection_path)
+    metadata_path = collection_path / 'metadata.json'
+    if not metadata_path.exists():
+        return 0
+
+    with folder_lock(collection_path):
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+
+        changed = 0
+        for image in metadata.get('images', []):
+            source_path = full_res_dir(collection_path) / image['filename']
+            if not source_path.exists():
+                continue
+            fields = read_capture_metadata(source_path)
+            if any(image.get(key) != fields.get(key) for key in (EXIF_FIELD, IPTC_FIELD)):
+                for key in (EXIF_FIELD, IPTC_FIELD):
+                    if key in fields:
+                        image[key] = fields[key]
+                    else:
+                        image.pop(key, None)
+                changed += 1
+
+        if changed:
+            write_metadata(metadata_path, metadata)
+    return changed
+
+
+@timed('site_exif')
+def extract_site_capture(gallery_dir, log=None):
+    """
+    Update EXIF/IPTC fields in every collection's metadata.json.
+
+    Returns:
+        int: number of image entries changed across the site
+    """
+    log = log or (lambda level, message: None)
+    total = 0
+    for collection_path in collection_folders(gallery_dir):
+        try:
+            changed = update_metadata_capture(collection_path)
+        except ValueError as e:
+            log('WARNING', f"  Invalid metadata.json for {collection_path.name} ({e}), skipping")
+            continue
+        if changed:
+            log('SUCCESS', f"  ✓ {collection_path.name}: EXIF/IPTC updated for {changed} image(s)")
+        total += changed
+    if not total:
+        log('INFO', "  EXIF/IPTC fields are up to date")
+    return total
@@ -0,0 +1,271 @@
+"""
+Content-fingerprinted file names for long-lived browser and CDN caching.
+
+Generated files that browsers fetch repeatedly are published under a name
+that carries a hash of their content:
+
+    thumbnails/640/Yozakura - Screen.3f9c1a27b0.jpg    ladder rendition
+    thumbnails/640/Yozakura - Screen.81d0e6c4aa.avif   its AVIF variant
+    thumbnails/Yozakura - Screen.5be1d2f093.jpg        default thumbnail
+    gallery-index.0c4e9a1b2d.json                      site index
+    search/manifest.77a0c3e1f4.json, search/ca.9e...   search index
+
+A fingerprinted file never changes, so it can be served with
+`Cache-Control: immutable`; new content gets a new name, which
+metadata.json, gallery-index.json and the pre-rendered pages point to.
+The plain names (thumbnails/<filename>, gallery-index.json,
+search/manifest.json) are still written as stable aliases for anything
+that links to them directly, and must be revalidated.
+
+The 'assets' stage (publish_assets) removes versions nothing refers to
+any more and writes assets/cache-manifest.json, listing every file that
+is safe to cache forever for the host's header rules.
+"""
+
+import glob
+import hashlib
+import itertools
+import json
+import os
+import re
+from pathlib import Path
+
+from photosite.discovery import source_images
+from photosite.instrument import timed
+from photosite.manifest import BuildManifest
+from photosite.storage import atomic_write, folder_lock
+
+HASH_LENGTH = 10
+FINGERPRINT_PATTERN = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{%d})(?P<suffix>\.[A-Za-z0-9]+)$' % HASH_LENGTH)
+
+CACHE_MANIFEST_PATH = Path('assets') / 'cache-manifest.json'
+CACHE_MANIFEST_VERSION = 1
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+def content_digest(data):
+    """Fingerprint of file content (str or bytes)."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def fingerprinted_name(name, data):
+    """'<stem>.<digest><suffix>' for a file name and its content."""
+    name = Path(name)
+    return f"{name.stem}.{content_digest(data)}{name.suffix}"
+
+
+def original_name(name):
+    """Plain file name of a fingerprinted name, or None if it carries no fingerprint."""
+    match = FINGERPRINT_PATTERN.match(Path(name).name)
+    return match.group('stem') + match.group('suffix') if match else None
+
+
+def write_fingerprinted(path, data):
+    """
+    Write data under the fingerprinted version of path.
+
+    An existing file is not rewritten (its name says it has this
+    content), only touched so it counts as the latest version again.
+
+    Returns:
+        Path: the fingerprinted path
+    """
+    path = Path(path)
+    target = path.with_name(fingerprinted_name(path.name, data))
+    if target.exists():
+        os.utime(target)
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(target, data)
+    return target
+
+
+def versions(path):
+    """Fingerprinted versions of path on disk."""
+    path = Path(path)
+    if not path.parent.is_dir():
+        return []
+    return [
+        candidate for candidate in path.parent.glob(f"{glob.escape(path.stem)}.*{path.suffix}")
+        if original_name(candidate.name) == path.name
+    ]
+
+
+def latest_version(path):
+    """Most recently written fingerprinted version of path, or None."""
+    found = versions(path)
+    return max(found, key=lambda p: p.stat().st_mtime_ns) if found else None
+
+
+def publish(path, data, keep=0):
+    """
+    Write path and its fingerprinted version, removing older versions.
+
+    For single files with a stable alias (gallery-index.json, the search
+    manifest). The `keep` most recent older versions are left in place
+    for pages and browsers that cached a link to them before this build.
+
+    Returns:
+        Path: the fingerprinted path
+    """
+    path = Path(path)
+    if not path.exists() or path.read_bytes() != (data.encode('utf-8') if isinstance(data, str) else data):
+        atomic_write(path, data)
+    current = write_fingerprinted(path, data)
+    older = sorted((old for old in versions(path) if old != current),
+                   key=lambda p: p.stat().st_mtime_ns, reverse=True)
+    for old in older[keep:]:
+        old.unlink()
+    return current
+
+
+def _metadata_images(collection_path):
+    """Image entries of a collection's metadata.json, or None if it has none or it cannot be read."""
+    try:
+        with open(Path(collection_path) / 'metadata.json', 'r') as f:
+            return json.load(f)['images']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def referenced_outputs(image):
+    """Collection-relative paths of the fingerprinted outputs a metadata.json image entry uses."""
+    paths = set()
+    if image.get('thumbnail'):
+        paths.add(image['thumbnail'])
+    paths.update(variant['path'] for variant in image.get('thumbnailVariants', {}).values())
+    for rendition in image.get('renditions', []):
+        paths.add(rendition['path'])
+        paths.update(variant['path'] for variant in rendition.get('variants', {}).values())
+    return paths
+
+
+def collect_garbage(collection_path):
+    """
+    Delete fingerprinted thumbnails and renditions that metadata.json no longer refers to.
+
+    Originals in full-res/ that have no metadata.json entry yet (built, but
+    not described) and images whose entry has no 'thumbnail'/'renditions'
+    fields yet keep all their files, and nothing is deleted without a
+    readable metadata.json. Unfingerprinted renditions left by older
+    versions of the tools (thumbnails/<width>/<filename>) go once a
+    fingerprinted version of them is in use; the thumbnails/<filename>
+    aliases are kept. Call under the collection's folder_lock().
+
+    When no version of an output is left, the build manifest stops
+    recording the original's renditions as current, so the next run
+    rebuilds them.
+
+    Returns:
+        list: deleted paths
+    """
+    collection_path = Path(collection_path)
+    thumbnails = collection_path / 'thumbnails'
+    images = _metadata_images(collection_path)
+    if images is None or not thumbnails.is_dir():
+        return []
+
+    referenced = set()
+    pending = set()
+    listed = set()
+    for image in images:
+        listed.add(image['filename'])
+        outputs = referenced_outputs(image)
+        if outputs:
+            referenced.update(outputs)
+        else:
+            pending.add(Path(image['filename']).stem)
+    originals = {source.stem: source for source in source_images(collection_path)}
+    pending.update(stem for stem, source in originals.items() if source.name not in listed)
+
+    superseded = {
+        (Path(relative).parent / original_name(Path(relative).name)).as_posix()
+        for relative in referenced if original_name(Path(relative).name)
+    }
+
+    deleted = []
+    lost = set()  # originals left without any version of an output
+    for path in sorted(thumbnails.rglob('*')):
+        if not path.is_file():
+            continue
+        relative = path.relative_to(collection_path).as_posix()
+        plain = original_name(path.name)
+        if plain is None:
+            if path.parent == thumbnails or relative not in superseded:
+                continue
+        elif relative in referenced or Path(plain).stem in pending:
+            continue
+        elif (path.parent / plain).relative_to(collection_path).as_posix() not in superseded:
+            lost.add(Path(plain).stem)
+        path.unlink()
+        deleted.append(path)
+
+    lost_sources = [originals[stem] for stem in sorted(lost) if stem in originals]
+    if lost_sources:
+        manifest = BuildManifest.load(collection_path)
+        for source in lost_sources:
+            manifest.forget_outputs(source)
+        manifest.save()
+    return deleted
+
+
+def immutable_files(gallery_dir, root):
+    """Root-relative paths of every current fingerprinted file of a gallery folder."""
+    gallery_dir = Path(gallery_dir)
+    files = set()
+    for collection_path in sorted(p for p in gallery_dir.iterdir() if p.is_dir()):
+        for image in _metadata_images(collection_path) or []:
+            for relative in referenced_outputs(image):
+                path = collection_path / relative
+                if path.exists():
+                    files.add(path.relative_to(root).as_posix())
+    # gallery-index and search index versions
+    for path in itertools.chain(gallery_dir.glob('*.json'), gallery_dir.glob('*/*.json')):
+        if original_name(path.name):
+            files.add(path.relative_to(root).as_posix())
+    return sorted(files)
+
+
+@timed('assets')
+def publish_assets(gallery_dir, log=None):
+    """
+    Remove unreferenced fingerprinted files and write assets/cache-manifest.json.
+
+    Returns:
+        Path or None: the cache manifest path if it was (re)written, else None
+    """
+    # Imported here: site_index itself publishes through this module
+    from photosite.site_index import site_root
+
+    log = log or (lambda level, message: None)
+    gallery_dir = Path(gallery_dir)
+    root = site_root(gallery_dir)
+
+    removed = 0
+    for collection_path in sorted(p for p in gallery_dir.iterdir() if (p / 'metadata.json').exists()):
+        with folder_lock(collection_path, log):
+            deleted = collect_garbage(collection_path)
+        for path in deleted:
+            log('INFO', f"  Removed old version {path.relative_to(gallery_dir)}")
+        removed += len(deleted)
+
+    files = immutable_files(gallery_dir, root)
+    manifest = {
+        'version': CACHE_MANIFEST_VERSION,
+        'immutable': {'cacheControl': IMMUTABLE_CACHE_CONTROL, 'files': files},
+        'default': {'cacheControl': REVALIDATE_CACHE_CONTROL},
+    }
+    content = json.dumps(manifest, indent=2) + '\n'
+    manifest_path = root / CACHE_MANIFEST_PATH
+    if manifest_path.exists() and manifest_path.read_text(encoding='utf-8') == content:
+        log('INFO', f"  {CACHE_MANIFEST_PATH.as_posix()} is up to date "
+                    f"({len(files)} immutable files, {removed} old versions removed)")
+        return None
+
+    atomic_write(manifest_path, content)
+    log('SUCCESS', f"  ✓ Wrote {CACHE_MANIFEST_PATH.as_posix()}: {len(files)} immutable files, "
+                   f"{removed} old versions removed")
+    return manifest_path
@@ -0,0 +1,196 @@
+"""
+Image decode and resize helpers shared by the thumbnail tools.
+
+JPEG originals are decoded with libjpeg DCT scaling (Pillow's
+Image.draft): the decoder produces the image directly at 1/2, 1/4 or 1/8
+size, choosing the smallest scale that is still at least as large as the
+target. A 45 MP original bound for an 800 px thumbnail is decoded at
+roughly 1/4 size, which is far less work and memory than a full decode.
+The final step is still a LANCZOS resample to the exact target size.
+
+Sizes are upright: for originals whose EXIF Orientation rotates them by
+90 degrees, widths refer to the image as displayed, and upright() turns
+the decoded pixels to match.
+
+Decodes that remain very large after DCT scaling (tall stitched
+panoramas, for one) go through downscale_upright() instead, which
+resamples them a strip of rows at a time rather than making full-size
+rotated, converted and half-resized copies. Pillow's pixel-count
+decompression-bomb check is not applied to originals (open_original());
+their decode memory is checked against the budget in photosite.memory.
+"""
+
+import math
+
+from PIL import ExifTags, Image, ImageChops, ImageOps, ImageStat
+
+# Largest mean per-channel difference (0-255 scale) tolerated between the
+# draft-decoded thumbnail and a full-decode LANCZOS thumbnail.
+DRAFT_MAX_MEAN_DIFF = 2.0
+
+# Filter for the final resample to the exact target size
+RESAMPLE_FILTER = Image.Resampling.LANCZOS
+
+# Widest support of Pillow's resampling filters (LANCZOS), in output pixels
+FILTER_SUPPORT = 3.0
+
+# Output rows resampled at a time by downscale_in_strips()
+STRIP_ROWS = 256
+
+
+def target_size(size, width):
+    """(width, height) for an image of `size` scaled to `width`, keeping aspect ratio."""
+    src_width, src_height = size
+    return width, max(1, int(width * src_height / src_width))
+
+
+# EXIF orientations that rotate the image by 90 or 270 degrees
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+# EXIF orientation -> transpose that makes the pixels upright
+ORIENTATION_TRANSPOSES = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def orientation(img):
+    """EXIF Orientation of an opened image (1 = upright), from its headers."""
+    value = img.getexif().get(ExifTags.Base.Orientation, 1)
+    return value if value in range(1, 9) else 1
+
+
+def open_original(source):
+    """
+    Image.open() for an original, without Pillow's decompression-bomb check.
+
+    Pillow warns above 89 MP and refuses above 179 MP by pixel count alone,
+    which rules out stitched panoramas that DCT scaling decodes at a
+    fraction of their size. Callers that decode check the memory that
+    takes instead (photosite.memory.check_decode).
+    """
+    limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        return Image.open(source)
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+
+def open_scaled(source_path, width):
+    """
+    Open an image for resizing to `width` pixels wide (upright).
+
+    For JPEGs the decoder is configured to DCT-scale to the nearest
+    power-of-two reduction that stays at or above the target size. Other
+    formats open normally. Pass the decoded image through upright() to
+    apply its EXIF orientation.
+
+    Returns:
+        tuple: (img, original_size) - img is an open (lazy) Pillow image;
+               original_size is the full-resolution upright (width, height),
+               which should be used for aspect-ratio math since DCT scaling
+               rounds.
+    """
+    img = open_original(source_path)
+    transposed = orientation(img) in TRANSPOSED_ORIENTATIONS
+    original_size = img.size[::-1] if transposed else img.size
+    if width < original_size[0]:
+        target = target_size(original_size, width)
+        img.draft(None, target[::-1] if transposed else target)
+    return img, original_size
+
+
+def upright(img):
+    """
+    Apply an image's EXIF orientation to its pixels.
+
+    Returns:
+        tuple: (img, exif) - the upright image (the same object when no
+               change is needed) and its EXIF bytes with the orientation
+               reset, so viewers do not rotate it a second time (None if
+               the image has no EXIF)
+    """
+    if orientation(img) == 1:
+        return img, img.info.get('exif')
+    rotated = ImageOps.exif_transpose(img)
+    return rotated, rotated.info.get('exif')
+
+
+def resize_to_width(img, width, original_size=None, resample=RESAMPLE_FILTER):
+    """Resize an (optionally draft-decoded) image to `width` pixels wide (LANCZOS by default)."""
+    size = target_size(original_size or img.size, width)
+    return img.resize(size, resample)
+
+
+def downscale_in_strips(img, size, resample=RESAMPLE_FILTER, rows=STRIP_ROWS):
+    """
+    Resize a loaded image down to `size` as RGB, `rows` output rows at a time.
+
+    Matches img.convert('RGB').resize(size, resample) to within rounding,
+    but only one strip of source rows is copied and converted at a time,
+    and there is no full-height intermediate. Each strip carries enough
+    extra rows for the filter's support, so strips join without seams.
+    """
+    src_width, src_height = img.size
+    scale = src_height / size[1]
+    margin = math.ceil(FILTER_SUPPORT * max(scale, 1)) + 2
+    output = Image.new('RGB', size)
+    for y in range(0, size[1], rows):
+        strip_rows = min(rows, size[1] - y)
+        top, bottom = y * scale, (y + strip_rows) * scale
+        crop_top = max(0, math.floor(top) - margin)
+        crop_bottom = min(src_height, math.ceil(bottom) + margin)
+        strip = img.crop((0, crop_top, src_width, crop_bottom))
+        strip = strip.convert('RGB') if strip.mode != 'RGB' else strip
+        output.paste(strip.resize((size[0], strip_rows), resample,
+                                  box=(0, top - crop_top, src_width, bottom - crop_top)), (0, y))
+    return output
+
+
+def downscale_upright(img, width, original_size, resample=RESAMPLE_FILTER):
+    """
+    Strip-wise counterpart of upright() followed by an RGB resize to `width`.
+
+    The decoded pixels are resampled in their stored orientation and only
+    the small result is turned upright, so the full-size image is never
+    copied.
+
+    Returns:
+        tuple: (img, exif) - as upright(), at `width` pixels wide
+    """
+    value = orientation(img)
+    size = target_size(original_size, width)
+    if value in TRANSPOSED_ORIENTATIONS:
+        size = size[::-1]
+    resized = downscale_in_strips(img, size, resample)
+    if value == 1:
+        return resized, img.info.get('exif')
+
+    exif = img.getexif()
+    del exif[ExifTags.Base.Orientation]
+    return resized.transpose(ORIENTATION_TRANSPOSES[value]), exif.tobytes()
+
+
+def draft_difference(source_path, width):
+    """
+    Compare the draft-decode path against a full-decode LANCZOS resize.
+
+    Returns:
+        float: mean absolute per-channel pixel difference (0-255 scale)
+    """
+    with open_original(source_path) as img:
+        reference = resize_to_width(upright(img)[0].convert('RGB'), width)
+
+    img, original_size = open_scaled(source_path, width)
+    with img:
+        fast = resize_to_width(upright(img)[0], width, original_size).convert('RGB')
+
+    channel_means = ImageStat.Stat(ImageChops.difference(reference, fast)).mean
+    return sum(channel_means) / len(channel_means)
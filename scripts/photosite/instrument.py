@@ -0,0 +1,415 @@
+"""
+Run instrumentation: per-stage timers, counters and a run report.
+
+Library code marks the expensive steps with stage() (or the timed()
+decorator) and counts work with count():
+
+    with stage('decode'):
+        img.load()
+    count('bytes_read', size)
+
+Each stage records its number of calls and total time and, when memory
+tracing is on (tracemalloc, noticeably slower), the peak traced memory
+while it ran. Stages nest: a stage's time includes the stages run inside
+it, and stages on worker threads (API calls) add up their busy time, so
+their total can exceed the wall time. Counters are plain totals: bytes
+read and written, cache hits and misses, API requests and retries.
+Recording is always on; it costs two clock reads per stage.
+
+The command-line tools wrap a run in instrumented_run(), which writes the report
+when the run ends (also on errors and Ctrl+C) and logs a summary:
+
+    <report>.json        per-stage calls/seconds/peak memory, counters,
+                         wall time and peak RSS
+    <report>.trace.json  every stage call as a Chrome trace event; open it
+                         in Perfetto (ui.perfetto.dev) or chrome://tracing
+    <report>.prof        cProfile statistics, with --profile
+
+Reports go to PHOTOSITE_CACHE_DIR/reports/ (default
+~/.cache/photosite/reports/) unless a path is given; the most recent
+REPORTS_KEEP runs of each tool are kept there. Process-pool workers
+return what they recorded with their results (drain()) and the parent
+merges it (merge()).
+"""
+
+import contextlib
+import functools
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+REPORTS_DIR = Path(os.environ.get('PHOTOSITE_CACHE_DIR', Path.home() / '.cache' / 'photosite')) / 'reports'
+REPORTS_KEEP = 20
+REPORT_VERSION = 1
+
+# Trace events kept per run; later stage calls are only totalled
+MAX_TRACE_EVENTS = 200000
+
+# Functions listed in the log summary of a --profile run
+PROFILE_TOP = 25
+
+
+class Recorder:
+    """Stage totals, counters and trace events recorded in one process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.memory = False
+        self.reset()
+
+    def reset(self):
+        self.stages = {}  # name -> {'calls', 'seconds'[, 'peak_bytes']}
+        self.counters = {}
+        self.events = []
+        self.dropped_events = 0
+
+    def add_stage(self, name, start_ns, duration_ns, peak_bytes=None):
+        with self.lock:
+            totals = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            totals['calls'] += 1
+            totals['seconds'] += duration_ns / 1e9
+            if peak_bytes is not None:
+                totals['peak_bytes'] = max(totals.get('peak_bytes', 0), peak_bytes)
+            if len(self.events) < MAX_TRACE_EVENTS:
+                self.events.append({
+                    'name': name, 'ph': 'X', 'ts': start_ns / 1000, 'dur': duration_ns / 1000,
+                    'pid': os.getpid(), 'tid': threading.get_native_id(),
+                })
+            else:
+                self.dropped_events += 1
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        """Everything recorded so far, as plain (picklable) data."""
+        with self.lock:
+            return {
+                'stages': {name: dict(totals) for name, totals in self.stages.items()},
+                'counters': dict(self.counters),
+                'events': list(self.events),
+                'dropped_events': self.dropped_events,
+            }
+
+    def merge(self, snapshot):
+        """Add a snapshot recorded elsewhere (a worker process) to this recorder."""
+        with self.lock:
+            for name, other in snapshot['stages'].items():
+                totals = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0})
+                totals['calls'] += other['calls']
+                totals['seconds'] += other['seconds']
+                if 'peak_bytes' in other:
+                    totals['peak_bytes'] = max(totals.get('peak_bytes', 0), other['peak_bytes'])
+            for name, amount in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            room = MAX_TRACE_EVENTS - len(self.events)
+            self.events.extend(snapshot['events'][:room])
+            self.dropped_events += snapshot['dropped_events'] + max(0, len(snapshot['events']) - room)
+
+
+_recorder = Recorder()
+
+# tracemalloc peaks of the (main-thread) stages currently open, innermost last
+_memory_stack = []
+_memory_peak = 0
+
+
+
+def _after_fork():
+    # Forked pool workers start empty instead of re-reporting the parent's totals
+    _recorder.lock = threading.Lock()
+    _recorder.reset()
+    _memory_stack.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _measures_memory():
+    return (_recorder.memory and tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak')
+            and threading.current_thread() is threading.main_thread())
+
+
+def _reset_memory_peak():
+    """Restart tracemalloc's peak, keeping the run-wide peak so far."""
+    global _memory_peak
+    peak = tracemalloc.get_traced_memory()[1]
+    _memory_peak = max(_memory_peak, peak)
+    tracemalloc.reset_peak()
+    return peak
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time the block as one call of stage `name`."""
+    measure = _measures_memory()
+    if measure:
+        peak = _reset_memory_peak()
+        if _memory_stack:
+            _memory_stack[-1] = max(_memory_stack[-1], peak)
+        _memory_stack.append(0)
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter_ns() - start
+        peak = None
+        if measure:
+            peak = max(tracemalloc.get_traced_memory()[1], _memory_stack.pop())
+            if _memory_stack:
+                _memory_stack[-1] = max(_memory_stack[-1], peak)
+        _recorder.add_stage(name, start, duration, peak)
+
+
+def timed(name):
+    """Decorator: record every call of the function as stage `name`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, amount=1):
+    """Add amount to counter `name`."""
+    _recorder.count(name, amount)
+
+
+def drain():
+    """
+    In a process-pool worker, return what was recorded since the last
+    drain and start over; None in the main process (nothing to hand back).
+    """
+    if multiprocessing.parent_process() is None:
+        return None
+    snapshot = _recorder.snapshot()
+    _recorder.reset()
+    return snapshot
+
+
+def merge(snapshot):
+    """Merge a worker's drain() result into this process's totals (None is ignored)."""
+    if snapshot is not None:
+        _recorder.merge(snapshot)
+
+
+def peak_rss_bytes():
+    """(this process, largest finished child process) peak resident set size in bytes, or None."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None, None
+    scale = 1 if sys.platform == 'darwin' else 1024  # bytes on macOS, KB elsewhere
+    self_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    child_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return self_peak, child_peak or None
+
+
+def default_report_path(tool):
+    """Timestamped report path for a run of `tool` in REPORTS_DIR."""
+    return REPORTS_DIR / f"{tool}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.json"
+
+
+def _prune_reports(tool):
+    """Keep the files of the REPORTS_KEEP most recent default-location runs of a tool."""
+    runs = {}
+    for path in REPORTS_DIR.glob(f'{tool}-*'):
+        runs.setdefault(path.name.split('.', 1)[0], []).append(path)
+    for run in sorted(runs)[:-REPORTS_KEEP]:
+        for path in runs[run]:
+            with contextlib.suppress(OSError):
+                path.unlink()
+
+
+def build_report(tool, started, wall_seconds, status, memory):
+    """The run report document for everything recorded so far."""
+    recorded = _recorder.snapshot()
+    rss, children_rss = peak_rss_bytes()
+    report = {
+        'version': REPORT_VERSION,
+        'tool': tool,
+        'argv': sys.argv[1:],
+        'started': started.isoformat(timespec='seconds'),
+        'status': status,
+        'wall_seconds': round(wall_seconds, 3),
+        'peak_rss_bytes': rss,
+        'peak_child_rss_bytes': children_rss,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': f'{platform.system()} {platform.release()} {platform.machine()}',
+            'cpu_count': os.cpu_count(),
+        },
+        'stages': {
+            name: dict(totals, seconds=round(totals['seconds'], 6))
+            for name, totals in sorted(recorded['stages'].items(),
+                                       key=lambda item: item[1]['seconds'], reverse=True)
+        },
+        'counters': dict(sorted(recorded['counters'].items())),
+        'dropped_trace_events': recorded['dropped_events'],
+    }
+    if memory and tracemalloc.is_tracing():
+        report['tracemalloc_peak_bytes'] = max(_memory_peak, tracemalloc.get_traced_memory()[1])
+    return report
+
+
+def trace_events(tool, origin_ns):
+    """Chrome trace-event document of every recorded stage call, times relative to origin_ns."""
+    recorded = _recorder.snapshot()
+    events = []
+    for pid in sorted({event['pid'] for event in recorded['events']} | {os.getpid()}):
+        name = tool if pid == os.getpid() else f'{tool} worker {pid}'
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': name}})
+    origin_us = origin_ns / 1000
+    for event in recorded['events']:
+        events.append(dict(event, ts=round(event['ts'] - origin_us, 1), dur=round(event['dur'], 1)))
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def _megabytes(value):
+    return f"{value / 2 ** 20:.1f} MB"
+
+
+def summary_lines(report):
+    """Human-readable lines summarizing a run report."""
+    rss = f", peak RSS {_megabytes(report['peak_rss_bytes'])}" if report['peak_rss_bytes'] else ''
+    if report['peak_child_rss_bytes']:
+        rss += f" (child processes {_megabytes(report['peak_child_rss_bytes'])})"
+    lines = [f"Run took {report['wall_seconds']:.2f}s{rss}"]
+    wall = report['wall_seconds'] or 1
+    if report['stages']:
+        memory = any('peak_bytes' in totals for totals in report['stages'].values())
+        lines.append(f"  {'stage':<22} {'calls':>7} {'seconds':>9} {'% wall':>7}"
+                     + (f" {'peak mem':>10}" if memory else ''))
+        for name, totals in report['stages'].items():
+            peak = _megabytes(totals['peak_bytes']) if 'peak_bytes' in totals else ''
+            lines.append(f"  {name:<22} {totals['calls']:>7} {totals['seconds']:>9.3f} "
+                         f"{totals['seconds'] / wall:>7.0%}" + (f" {peak:>10}" if memory else ''))
+    if report['counters']:
+        lines.append("  " + ", ".join(
+            f"{name} {_megabytes(value) if name.endswith('bytes') or name.startswith('bytes') else value}"
+            for name, value in report['counters'].items()))
+    return lines
+
+
+def _write_profile(profiler, path, log):
+    import pstats
+
+    profiler.dump_stats(str(path))
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP)
+    log('INFO', f"Top {PROFILE_TOP} functions by cumulative time:")
+    for line in output.getvalue().splitlines():
+        if line.strip():
+            log('INFO', f"  {line}")
+    log('INFO', f"Profile written to {path} (open with pstats or snakeviz)")
+
+
+def add_report_arguments(parser):
+    """Add the --report/--no-report/--trace-memory/--profile options to an argparse parser."""
+    group = parser.add_argument_group('instrumentation')
+    group.add_argument(
+        '--report',
+        metavar='PATH',
+        help='Write the run report (JSON) to PATH and the trace events next to it (.trace.json) '
+             f'(default: a timestamped file in {REPORTS_DIR})'
+    )
+    group.add_argument(
+        '--no-report',
+        dest='report',
+        action='store_const',
+        const=False,
+        help='Do not write a run report'
+    )
+    group.add_argument(
+        '--trace-memory',
+        action='store_true',
+        help='Record peak memory per stage with tracemalloc (slows the run down)'
+    )
+    group.add_argument(
+        '--profile',
+        action='store_true',
+        help='Run under cProfile; statistics are saved next to the report and the top functions logged'
+    )
+
+
+@contextlib.contextmanager
+def instrumented_run(tool, report=None, memory=False, profile=False, log=None):
+    """
+    Instrument one run of a tool and write its report when the block exits.
+
+    Args:
+        tool: tool name, used in the report and its default filename
+        report: report path; None for a timestamped file in REPORTS_DIR,
+                False to write no report files
+        memory: trace memory allocations for per-stage peaks
+        profile: run the block under cProfile
+        log: log(level, message) callable for the summary
+    """
+    global _memory_peak
+    log = log or (lambda level, message: None)
+    _recorder.reset()
+    _recorder.memory = memory
+    _memory_stack.clear()
+    _memory_peak = 0
+    if memory:
+        tracemalloc.start()
+
+    report_path = default_report_path(tool) if report is None else (Path(report) if report else None)
+    started = datetime.now()
+    origin_ns = time.perf_counter_ns()
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    status = 'failed'
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+        status = 'completed'
+    except KeyboardInterrupt:
+        status = 'interrupted'
+        raise
+    except SystemExit as e:
+        status = 'failed' if e.code else 'completed'
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        document = build_report(tool, started, (time.perf_counter_ns() - origin_ns) / 1e9, status, memory)
+        if memory:
+            tracemalloc.stop()
+        _recorder.memory = False
+
+        for line in summary_lines(document):
+            log('INFO', line)
+        try:
+            if report_path is not None:
+                report_path.parent.mkdir(parents=True, exist_ok=True)
+                trace_path = report_path.with_suffix('.trace.json')
+                if profiler is not None:
+                    document['profile'] = report_path.with_suffix('.prof').name
+                document['trace'] = trace_path.name
+                trace_path.write_text(json.dumps(trace_events(tool, origin_ns)))
+                report_path.write_text(json.dumps(document, indent=2))
+                log('INFO', f"Run report written to {report_path}")
+            if profiler is not None:
+                profile_path = (report_path or default_report_path(tool)).with_suffix('.prof')
+                profile_path.parent.mkdir(parents=True, exist_ok=True)
+                _write_profile(profiler, profile_path, log)
+            if report is None:
+                _prune_reports(tool)
+        except OSError as e:
+            log('WARNING', f"Could not write the run report: {e}")
@@ -0,0 +1,178 @@
+"""
+Per-collection build manifest.
+
+Records, for every source image in a collection, the file's size and
+modification time, its SHA-256 content hash, the settings each output
+(thumbnail, ...) was last built with and values derived from the content
+(perceptual hash, ...). Tools use it to decide what is stale:
+
+- size + mtime unchanged  -> trust the stored hash, never read the file
+- size/mtime changed      -> re-hash; identical content keeps its outputs
+                             and derived values
+- content or settings changed -> output is rebuilt
+
+The manifest lives at <collection>/.build-manifest.json. It is local build
+state (mtimes are machine specific) and is not committed.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+from photosite.instrument import count, stage
+from photosite.storage import write_json
+
+MANIFEST_FILENAME = '.build-manifest.json'
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file's contents."""
+    sha256_hash = hashlib.sha256()
+    with stage('hash'), open(path, 'rb') as f:
+        for byte_block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha256_hash.update(byte_block)
+            count('bytes_read', len(byte_block))
+    return sha256_hash.hexdigest()
+
+
+def _stat_key(path):
+    st = Path(path).stat()
+    return st.st_size, st.st_mtime_ns
+
+
+class BuildManifest:
+    """Content-hash manifest for one collection folder."""
+
+    def __init__(self, collection_path, files=None):
+        self.collection_path = Path(collection_path)
+        self.path = self.collection_path / MANIFEST_FILENAME
+        self.files = files if files is not None else {}
+        self.dirty = False
+
+    @classmethod
+    def load(cls, collection_path):
+        """Load the manifest for a collection (empty if missing or unreadable)."""
+        path = Path(collection_path) / MANIFEST_FILENAME
+        files = {}
+        if path.exists():
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    files = data.get('files', {})
+            except (OSError, ValueError):
+                files = {}
+        return cls(collection_path, files)
+
+    def key(self, source_path):
+        """Manifest key for a source file: its path relative to the collection."""
+        source_path = Path(source_path)
+        try:
+            return source_path.relative_to(self.collection_path).as_posix()
+        except ValueError:
+            return source_path.as_posix()
+
+    def _fresh_entry(self, source_path):
+        """Return the entry for source_path if its size and mtime still match."""
+        entry = self.files.get(self.key(source_path))
+        if entry is None:
+            return None
+        size, mtime_ns = _stat_key(source_path)
+        if entry.get('size') == size and entry.get('mtime_ns') == mtime_ns:
+            return entry
+        return None
+
+    def content_hash(self, source_path, sha256=None):
+        """
+        Return the SHA-256 of source_path, reading the file only if it changed.
+
+        If the content hash differs from the recorded one, every recorded
+        output and derived value for the file is dropped so it gets rebuilt.
+        """
+        entry = self._fresh_entry(source_path)
+        if entry is not None and entry.get('sha256') and sha256 is None:
+            count('manifest_hash_hits')
+            return entry['sha256']
+
+        if sha256 is None:
+            sha256 = hash_file(source_path)
+        size, mtime_ns = _stat_key(source_path)
+        key = self.key(source_path)
+        previous = self.files.get(key, {})
+        same_content = previous.get('sha256') == sha256
+        self.files[key] = {
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'sha256': sha256,
+            'outputs': previous.get('outputs', {}) if same_content else {},
+            'derived': previous.get('derived', {}) if same_content else {},
+        }
+        self.dirty = True
+        return sha256
+
+    def is_current(self, source_path, output, settings, output_path=None):
+        """
+        True if `output` for source_path was built from the current content
+        with exactly these settings (and output_path, if given, still exists).
+        """
+        key = self.key(source_path)
+        if key not in self.files:
+            return False
+        if self._fresh_entry(source_path) is None:
+            if not self.files[key].get('sha256'):
+                return False
+            self.content_hash(source_path)
+        entry = self.files[key]
+        if entry.get('outputs', {}).get(output) != settings:
+            return False
+        return output_path is None or Path(output_path).exists()
+
+    def record(self, source_path, output, settings, sha256=None):
+        """
+        Record that `output` was built for source_path with these settings.
+
+        sha256 is the content hash the output was built from; without it
+        the file's current hash is used (read only if the file changed), so
+        an entry never records outputs without the content they belong to.
+        """
+        self.content_hash(source_path, sha256)
+        self.files[self.key(source_path)].setdefault('outputs', {})[output] = dict(settings)
+        self.dirty = True
+
+    def forget_outputs(self, source_path):
+        """Drop the recorded outputs of source_path, so they count as stale (e.g. after their files were deleted)."""
+        entry = self.files.get(self.key(source_path))
+        if entry and entry.get('outputs'):
+            entry['outputs'] = {}
+            self.dirty = True
+
+    def derived(self, source_path, name):
+        """
+        Value `name` derived from source_path's content, or None if it was
+        never recorded or the file changed since (the file is not read).
+        """
+        entry = self._fresh_entry(source_path)
+        return entry.get('derived', {}).get(name) if entry else None
+
+    def set_derived(self, source_path, name, value):
+        """Cache a value derived from source_path's current content."""
+        self.content_hash(source_path)
+        self.files[self.key(source_path)].setdefault('derived', {})[name] = value
+        self.dirty = True
+
+    def prune(self):
+        """Drop entries whose source file no longer exists."""
+        for key in list(self.files):
+            if not (self.collection_path / key).exists():
+                del self.files[key]
+                self.dirty = True
+
+    def save(self):
+        """Write the manifest back to disk if anything changed."""
+        if not self.dirty:
+            return
+        data = {'version': MANIFEST_VERSION, 'files': self.files}
+        write_json(self.path, data, indent=2, sort_keys=True)
+        self.dirty = False
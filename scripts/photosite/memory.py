@@ -0,0 +1,276 @@
+"""
+Decode memory estimates and a memory-budgeted worker scheduler.
+
+How much memory an original takes to thumbnail is known from its headers
+before any pixel is decoded: the size it decodes at after DCT scaling
+(photosite.imaging.open_scaled), its pixel format, whether it is a
+progressive JPEG (libjpeg then holds the coefficients of the whole,
+unscaled image until the decode finishes) and the copies the resize steps
+make. decode_plan() turns that into a peak estimate in bytes, and chooses
+the strip-wise downscale (photosite.imaging.downscale_upright) for decodes
+above STRIP_THRESHOLD_BYTES.
+
+The budget is the memory the tools may use in total: --memory-budget, else
+PHOTOSITE_MEMORY_BUDGET (e.g. '3G', '2500M'), else DEFAULT_BUDGET_FRACTION
+of the machine's memory or container limit. budgeted_map() starts a job on
+the process pool only while the estimates of the running jobs and the
+workers' own baseline fit in it, so a batch of 200 MP panoramas runs
+fewer at a time than a batch of phone photos. An original whose estimate
+exceeds the budget on its own is refused with Pillow's
+DecompressionBombError rather than decoded.
+"""
+
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from PIL import Image
+
+from photosite.encoding import MODERN_FORMATS, fits_format
+from photosite.imaging import (
+    FILTER_SUPPORT, STRIP_ROWS, TRANSPOSED_ORIENTATIONS, open_scaled, orientation, target_size,
+)
+
+BUDGET_ENV = 'PHOTOSITE_MEMORY_BUDGET'
+DEFAULT_BUDGET_FRACTION = 0.75
+FALLBACK_MEMORY = 4 * 1024 ** 3  # when the machine's memory cannot be read
+
+# Resident memory of a worker process before it decodes anything
+# (interpreter, Pillow, encoder buffers)
+PROCESS_BASELINE_BYTES = 96 * 1024 ** 2
+
+# Decodes larger than this are downscaled strip by strip
+STRIP_THRESHOLD_BYTES = 256 * 1024 ** 2
+
+# Encoder working memory per pixel of the encoded image, measured with
+# Pillow's libjpeg, libwebp and libaom (AVIF) encoders
+ENCODE_BYTES_PER_PIXEL = {'jpeg': 1, 'webp': 16, 'avif': 24}
+
+CGROUP_LIMIT_FILES = (
+    '/sys/fs/cgroup/memory.max',                    # cgroup v2
+    '/sys/fs/cgroup/memory/memory.limit_in_bytes',  # cgroup v1
+)
+SIZE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$', re.IGNORECASE)
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+_budget = None
+
+
+def parse_size(text):
+    """
+    Bytes in a size such as '4G', '2500M', '1.5GB' or '1073741824' (binary units).
+
+    Raises:
+        ValueError: if text is not a size
+    """
+    match = SIZE_PATTERN.match(str(text))
+    if not match:
+        raise ValueError(f"not a size: {text!r} (expected e.g. 4G or 2500M)")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def format_size(size):
+    """Human-readable byte count (MB below 1 GB, else GB)."""
+    if size < 1024 ** 3:
+        return f"{size / 1024 ** 2:.0f} MB"
+    return f"{size / 1024 ** 3:.1f} GB"
+
+
+def machine_memory():
+    """Memory available to this process: physical memory, capped by a container (cgroup) limit."""
+    try:
+        total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        total = FALLBACK_MEMORY
+    for limit_file in CGROUP_LIMIT_FILES:
+        try:
+            limit = Path(limit_file).read_text().strip()
+        except OSError:
+            continue
+        if limit.isdigit():
+            total = min(total, int(limit))
+    return total
+
+
+def configure_budget(budget):
+    """
+    Set the memory budget of this process (None: back to the default).
+
+    Also the process-pool initializer of budgeted_map(), so workers check
+    decodes against the same budget.
+    """
+    global _budget
+    _budget = budget
+
+
+def memory_budget():
+    """Memory budget in bytes: configure_budget(), else PHOTOSITE_MEMORY_BUDGET, else a share of machine memory."""
+    if _budget is not None:
+        return _budget
+    if os.environ.get(BUDGET_ENV):
+        return parse_size(os.environ[BUDGET_ENV])
+    return int(machine_memory() * DEFAULT_BUDGET_FRACTION)
+
+
+def pixel_bytes(mode):
+    """Bytes per pixel of a Pillow image mode in memory (multi-band modes take 4)."""
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+
+def coefficient_bytes(img, original_size):
+    """
+    Memory libjpeg holds for a progressive JPEG's DCT coefficients while decoding.
+
+    Progressive scans refine the whole image, so the 16-bit coefficients of
+    every component are kept at full size whatever the DCT scaling; 0 for
+    other images.
+    """
+    if not img.info.get('progressive'):
+        return 0
+    layers = getattr(img, 'layer', None) or []
+    if layers:
+        max_h = max(h for _, h, _, _ in layers)
+        max_v = max(v for _, _, v, _ in layers)
+        samples = sum(h * v for _, h, v, _ in layers) / (max_h * max_v)
+    else:
+        samples = len(img.getbands())
+    return int(original_size[0] * original_size[1] * samples * 2)
+
+
+def process_limit():
+    """Memory one image may use: the budget less this process's baseline."""
+    return memory_budget() - PROCESS_BASELINE_BYTES
+
+
+def image_bytes(size):
+    """Memory of an RGB image of `size` (Pillow stores RGB in 4 bytes per pixel)."""
+    return size[0] * size[1] * 4
+
+
+def encode_fits(size, fmt, held=0):
+    """
+    True if an image of `size` can be encoded as fmt within the budget.
+
+    `held` is the memory already taken by the images kept around while it
+    is encoded (the other renditions).
+    """
+    if fmt in MODERN_FORMATS and not fits_format(size, fmt):
+        return False
+    return held + size[0] * size[1] * ENCODE_BYTES_PER_PIXEL[fmt] <= process_limit()
+
+
+def decode_plan(img, original_size, widths, formats=()):
+    """
+    Peak memory to decode an opened original, downscale it and encode the results.
+
+    `img` and `original_size` are what open_scaled() returned (the image
+    not loaded yet); only its headers are used. `widths` are the output
+    widths (capped at the original's), each encoded as JPEG and, where
+    encode_fits() allows, in `formats`. The peak is the largest of three
+    phases: decoding (with a progressive JPEG's coefficients), resizing
+    to the largest output, and encoding while every output is held.
+
+    Returns:
+        dict: 'bytes' (estimated peak) and 'strips' (True when the decode is
+              big enough for the strip-wise downscale, which the estimate
+              assumes)
+    """
+    decoded_width, decoded_height = img.size
+    decoded = decoded_width * decoded_height * pixel_bytes(img.mode)
+    outputs = [target_size(original_size, w)
+               for w in sorted({min(w, original_size[0]) for w in widths}, reverse=True)]
+    first_width, first_height = outputs[0]
+    if orientation(img) in TRANSPOSED_ORIENTATIONS:
+        first_width, first_height = first_height, first_width
+    held = sum(image_bytes(size) for size in outputs)
+
+    decoding = decoded + coefficient_bytes(img, original_size)
+    strips = decoded > STRIP_THRESHOLD_BYTES
+    if strips:
+        # One strip of source rows, cropped, converted and half-resampled;
+        # the decode is released before the rest of the cascade
+        scale = decoded_height / first_height
+        strip_rows = STRIP_ROWS * scale + 2 * (FILTER_SUPPORT * scale + 2)
+        resizing = decoded + int(3 * strip_rows * decoded_width * 4) + image_bytes(outputs[0])
+    else:
+        # Upright and RGB copies and the first, horizontal resample pass;
+        # the decode is held until the cascade is done
+        copies = decoded if orientation(img) != 1 else 0
+        copies += decoded_width * decoded_height * 4 if img.mode != 'RGB' else 0
+        resizing = decoded + max(copies + first_width * decoded_height * 4, held)
+
+    encoders = [0]
+    for fmt in ('jpeg', *formats):
+        fitting = [size for size in outputs if fmt == 'jpeg' or encode_fits(size, fmt, held)]
+        if fitting:
+            encoders.append(fitting[0][0] * fitting[0][1] * ENCODE_BYTES_PER_PIXEL[fmt])
+    encoding = held + max(encoders)
+
+    return {'bytes': max(decoding, resizing, encoding), 'strips': strips}
+
+
+def estimate_decode(source, widths, formats=()):
+    """Peak memory of building the outputs of an original (see decode_plan()), from its headers alone."""
+    img, original_size = open_scaled(source, max(widths))
+    with img:
+        return decode_plan(img, original_size, widths, formats)['bytes']
+
+
+def check_decode(plan):
+    """
+    Refuse decodes that would not fit in the memory budget on their own.
+
+    Raises:
+        Image.DecompressionBombError: if plan['bytes'] exceeds the budget
+    """
+    limit = process_limit()
+    if plan['bytes'] > limit:
+        raise Image.DecompressionBombError(
+            f"decoding needs about {format_size(plan['bytes'])}, more than the "
+            f"{format_size(limit)} left in the memory budget (--memory-budget / {BUDGET_ENV})"
+        )
+
+
+def budgeted_map(fn, jobs, costs, workers, budget=None):
+    """
+    ProcessPoolExecutor.map(fn, jobs), admitting jobs against a memory budget.
+
+    A job is started only while the summed costs (estimated peak bytes) of
+    the running jobs, plus PROCESS_BASELINE_BYTES for each worker and for
+    this process, stay within the budget; a job that does not fit even
+    alone runs by itself. Jobs start in order and results are yielded in
+    job order.
+    """
+    budget = memory_budget() if budget is None else budget
+    available = budget - (workers + 1) * PROCESS_BASELINE_BYTES
+    jobs = list(jobs)
+    costs = list(costs)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure_budget,
+                             initargs=(budget,)) as executor:
+        futures = []
+        running = {}  # future -> cost
+        in_use = 0
+        yielded = 0
+        while yielded < len(jobs):
+            for future in [f for f in running if f.done()]:
+                in_use -= running.pop(future)
+            while len(futures) < len(jobs) and len(running) < workers:
+                cost = costs[len(futures)]
+                if running and in_use + cost > available:
+                    break
+                future = executor.submit(fn, jobs[len(futures)])
+                futures.append(future)
+                running[future] = cost
+                in_use += cost
+            if futures[yielded].done():
+                yield futures[yielded].result()
+                futures[yielded] = None
+                yielded += 1
+            else:
+                wait(running, return_when=FIRST_COMPLETED)
@@ -0,0 +1,177 @@
+"""
+Building a collection's metadata.json.
+
+The entries generate-collection.py writes are assembled here: one per
+image (title from the filename, description and tags, default print
+sizes, then the rendition and EXIF/IPTC fields of the thumbnail step) and
+the collection header, plus the rules that pick the featured images and
+the cover (by sharpness when photosite.analysis has scored the images). Writing
+goes through photosite.storage.write_metadata, which validates the
+document against photosite.schema first.
+
+Collection info (title, location, date, description and optionally
+displayCategory) can be kept in a collection-info.json sidecar in the
+collection folder instead of being typed in.
+"""
+
+import copy
+import json
+import re
+from pathlib import Path
+
+from photosite.exif import read_capture_metadata
+from photosite.renditions import describe_renditions
+
+METADATA_FILENAME = 'metadata.json'
+COLLECTION_INFO_FILENAME = 'collection-info.json'
+COLLECTION_INFO_FIELDS = ('title', 'location', 'date', 'description')
+
+DEFAULT_DISPLAY_CATEGORY = 'Travel & Adventure'
+DEFAULT_TAGS = ('travel',)
+DEFAULT_PRINT_SIZES = (
+    {'size': '8x10', 'price': 50},
+    {'size': '11x14', 'price': 85},
+    {'size': '16x20', 'price': 140},
+    {'size': '20x30', 'price': 235},
+)
+
+
+def metadata_path(collection_path):
+    """Path of a collection's metadata.json."""
+    return Path(collection_path) / METADATA_FILENAME
+
+
+def load_metadata(collection_path):
+    """
+    A collection's metadata.json, or None if it has none.
+
+    Raises:
+        OSError, ValueError: if the file cannot be read or parsed
+    """
+    path = metadata_path(collection_path)
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def read_collection_info(collection_path):
+    """
+    The collection-info.json sidecar of a collection ({} if it has none).
+
+    Raises:
+        ValueError: if the sidecar is not a JSON object
+    """
+    sidecar = Path(collection_path) / COLLECTION_INFO_FILENAME
+    if not sidecar.exists():
+        return {}
+    with open(sidecar, 'r') as f:
+        collection_info = json.load(f)
+    if not isinstance(collection_info, dict):
+        raise ValueError(f"{sidecar} must contain a JSON object")
+    return collection_info
+
+
+def collection_info_of(metadata):
+    """Collection info (title, location, date, description) from a metadata.json document."""
+    return {key: metadata['collection'].get(key, '') for key in COLLECTION_INFO_FIELDS}
+
+
+def title_from_filename(filename):
+    """
+    Title and optional description encoded in an original's filename.
+
+    Filenames follow 'Title - Description - Screen.jpg' or 'Title - Screen.jpg';
+    the ' - Screen'/' - Matte' print-finish suffix is dropped.
+
+    Returns:
+        tuple: (title, description or None)
+    """
+    name = filename.rsplit('.', 1)[0]
+    name = re.sub(r'\s*-\s*(Screen|Matte)\s*$', '', name)
+    parts = name.split(' - ', 1)
+    title = parts[0].strip()
+    description = parts[1].strip() if len(parts) > 1 else None
+    return title, description
+
+
+def fields_from_disk(image_file, collection_path):
+    """Rendition and EXIF/IPTC fields of an image whose thumbnails were not rebuilt this run."""
+    fields = describe_renditions(image_file, collection_path) or {}
+    fields.update(read_capture_metadata(image_file))
+    return fields
+
+
+def image_entry(image_file, collection_info, description=None, tags=None, fields=None):
+    """
+    metadata.json entry for one image.
+
+    The title comes from the filename. A missing description falls back
+    to the one in the filename, then to a line naming the collection;
+    missing tags to DEFAULT_TAGS. `fields` (renditions, placeholder,
+    EXIF/IPTC, ...) are merged in last. 'featured' starts out False, see
+    mark_featured().
+    """
+    title, filename_description = title_from_filename(Path(image_file).name)
+    entry = {
+        'id': title.lower().replace(' ', '-'),
+        'title': title,
+        'filename': Path(image_file).name,
+        'description': (description or filename_description
+                        or f"A photograph from the {collection_info['title']} collection"),
+        'location': collection_info['location'],
+        'tags': list(tags or DEFAULT_TAGS),
+        'printSizes': copy.deepcopy(list(DEFAULT_PRINT_SIZES)),
+        'featured': False,
+        'printAvailable': True,
+    }
+    entry.update(fields or {})
+    return entry
+
+
+def featured_count(total):
+    """Number of images to feature in a collection: the first, every third and the last."""
+    return len(set(range(0, total, 3)) | {total - 1}) if total else 0
+
+
+def mark_featured(images, sharpness=None):
+    """
+    Feature about a third of the images (featured_count()).
+
+    With `sharpness` (filename -> score, see photosite.analysis) the
+    sharpest images are featured, images without a score coming last;
+    otherwise the first image, every third image and the last one.
+    """
+    if not sharpness:
+        for idx, image in enumerate(images):
+            image['featured'] = (idx == 0) or (idx % 3 == 0) or (idx == len(images) - 1)
+        return
+    ranked = sorted(range(len(images)), key=lambda idx: -sharpness.get(images[idx]['filename'], -1.0))
+    featured = set(ranked[:featured_count(len(images))])
+    for idx, image in enumerate(images):
+        image['featured'] = idx in featured
+
+
+def cover_image(images, sharpness=None):
+    """Filename of a collection's cover: its sharpest image with `sharpness` scores, else the first."""
+    if sharpness:
+        scored = [image for image in images if image['filename'] in sharpness]
+        if scored:
+            return max(scored, key=lambda image: sharpness[image['filename']])['filename']
+    return images[0]['filename']
+
+
+def collection_entry(collection_id, collection_info, cover_image):
+    """The 'collection' header of a new collection's metadata.json."""
+    return {
+        'id': collection_id,
+        'title': collection_info['title'],
+        'slug': collection_id,
+        'displayCategory': collection_info.get('displayCategory') or DEFAULT_DISPLAY_CATEGORY,
+        'description': collection_info['description'],
+        'location': collection_info['location'],
+        'date': collection_info['date'],
+        'coverImage': cover_image,
+        'featured': True,
+        'printAvailable': True,
+    }
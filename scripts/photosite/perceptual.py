@@ -0,0 +1,197 @@
+"""
+Perceptual hashing and near-duplicate grouping.
+
+A byte hash (SHA-256) changes completely when a photo is re-exported,
+resized, re-compressed or converted to another format. A dHash does not:
+it records whether brightness increases between horizontally adjacent
+pixels of a tiny grayscale downscale, so re-exports of the same photo
+("Screen" vs "Matte" versions, renamed or converted files) land within a
+few bits of each other while different photos are far apart.
+
+Hashes are compared by Hamming distance through a BK-tree, so looking up
+the near-duplicates of one image among thousands only visits a small
+part of the tree instead of every other image.
+
+Per-collection hashes are cached in the build manifest (keyed to the
+file's content hash, see photosite.manifest); find_site_variants() groups
+variants across every collection of the site.
+"""
+
+import hashlib
+import io
+from pathlib import Path
+
+from PIL import Image
+
+from photosite.discovery import collection_folders, source_images
+from photosite.imaging import TRANSPOSED_ORIENTATIONS, open_original, orientation, upright
+from photosite.instrument import timed
+from photosite.manifest import BuildManifest
+from photosite.storage import folder_lock
+
+HASH_SIZE = 8
+
+# Hashes at most this many bits apart (of HASH_SIZE ** 2) are variants of
+# the same photo
+DEFAULT_MAX_DISTANCE = 6
+
+# Bumped when hashes stop being comparable with the cached ones (v2: taken
+# from the upright image, like the hash of a freshly built rendition)
+DHASH_FIELD = 'dhash-v2'
+
+
+def dhash(img, hash_size=HASH_SIZE):
+    """dHash of a PIL image as a hex string of hash_size ** 2 bits."""
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col + 1] > pixels[offset + col])
+    return f'{bits:0{hash_size * hash_size // 4}x}'
+
+
+def dhash_file(path, hash_size=HASH_SIZE):
+    """
+    dHash of an image file (path or binary file object), decoded at
+    reduced scale where the format allows and turned upright by its EXIF
+    orientation, so it matches dhash() of the image's renditions.
+    """
+    with open_original(path) as img:
+        size = ((hash_size + 1) * 8, hash_size * 8)
+        img.draft('L', size[::-1] if orientation(img) in TRANSPOSED_ORIENTATIONS else size)
+        return dhash(upright(img)[0], hash_size)
+
+
+def hamming(a, b):
+    """Number of differing bits between two hex hashes."""
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def cached_dhash(manifest, source_path):
+    """
+    dHash of source_path, cached in its collection's build manifest.
+
+    A changed file is read once for both its SHA-256 and its dHash.
+    """
+    value = manifest.derived(source_path, DHASH_FIELD)
+    if value is None:
+        data = Path(source_path).read_bytes()
+        manifest.content_hash(source_path, hashlib.sha256(data).hexdigest())
+        value = dhash_file(io.BytesIO(data))
+        manifest.set_derived(source_path, DHASH_FIELD, value)
+    return value
+
+
+class BKTree:
+    """Burkhard-Keller tree of hex hashes under Hamming distance."""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        """Insert a hash with an associated item."""
+        node = (int(value, 16), item, {})
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = bin(current[0] ^ node[0]).count('1')
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, max_distance):
+        """Return [(distance, item)] for every hash within max_distance bits."""
+        if self.root is None:
+            return []
+        target = int(value, 16)
+        matches = []
+        pending = [self.root]
+        while pending:
+            node_value, item, children = pending.pop()
+            distance = bin(node_value ^ target).count('1')
+            if distance <= max_distance:
+                matches.append((distance, item))
+            # Triangle inequality: only these subtrees can hold matches
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    pending.append(child)
+        return sorted(matches, key=lambda match: match[0])
+
+
+def group_variants(hashes, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    Group items whose hashes are within max_distance bits of each other.
+
+    Args:
+        hashes: list of (item, hex hash) pairs; a None hash is never grouped
+        max_distance: largest Hamming distance still treated as a variant
+
+    Returns:
+        list: groups (lists of items, in input order), one per distinct
+              photo, ordered by their first item; singletons included
+    """
+    parent = list(range(len(hashes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    tree = BKTree()
+    for position, (_, value) in enumerate(hashes):
+        if value is None:
+            continue
+        for _, other in tree.search(value, max_distance):
+            root, other_root = find(position), find(other)
+            if root != other_root:
+                parent[max(root, other_root)] = min(root, other_root)
+        tree.add(value, position)
+
+    groups = {}
+    for position, (item, _) in enumerate(hashes):
+        groups.setdefault(find(position), []).append(item)
+    return [groups[root] for root in sorted(groups)]
+
+
+@timed('site_variants')
+def find_site_variants(gallery_dir, max_distance=DEFAULT_MAX_DISTANCE, log=None):
+    """
+    Report groups of near-duplicate originals across every collection.
+
+    Hashes come from (and are cached in) each collection's build manifest.
+
+    Returns:
+        list: groups of more than one variant, each a list of paths
+              relative to gallery_dir
+    """
+    log = log or (lambda level, message: None)
+    gallery_dir = Path(gallery_dir)
+
+    hashes = []
+    for collection_path in collection_folders(gallery_dir):
+        with folder_lock(collection_path, log):
+            manifest = BuildManifest.load(collection_path)
+            for image_file in source_images(collection_path):
+                try:
+                    value = cached_dhash(manifest, image_file)
+                except OSError as e:
+                    log('WARNING', f"  Could not hash {image_file.name}: {e}")
+                    value = None
+                hashes.append((image_file.relative_to(gallery_dir).as_posix(), value))
+            manifest.prune()
+            manifest.save()
+
+    groups = [group for group in group_variants(hashes, max_distance) if len(group) > 1]
+    for group in groups:
+        log('WARNING', f"  Variants of one photo: {', '.join(group)}")
+    log('INFO', f"  {len(hashes)} original(s) checked, {len(groups)} group(s) of variants")
+    return groups
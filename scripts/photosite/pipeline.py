@@ -0,0 +1,224 @@
+"""
+Single-pass processing of a collection's originals.
+
+Every original that needs work is memory-mapped and read from disk once;
+the mapped bytes and the one decode fan out to every consumer:
+
+    bytes (mmap) -+- SHA-256 ............... build manifest, AI cache key
+                  +- APP segments .......... EXIF/IPTC fields (photosite.exif)
+                  +- decode_ladder() -+- dHash ........ variant detection
+                                      +- renditions ... thumbnails, srcset,
+                                                        placeholder, and the
+                                                        AI upload payload
+                                                        (tagging.image_payload)
+
+Originals whose size and mtime are unchanged are not read at all: their
+hashes come from the build manifest (see photosite.manifest).
+"""
+
+import hashlib
+import io
+import mmap
+from pathlib import Path
+
+from photosite.exif import read_capture_metadata
+from photosite.instrument import count, stage, timed
+from photosite.manifest import BuildManifest
+from photosite.perceptual import DEFAULT_MAX_DISTANCE, DHASH_FIELD, BKTree, dhash, dhash_file
+from photosite.renditions import (
+    QUALITIES_FIELD, RENDITION_SETTINGS, decode_ladder, rendition_qualities, smallest_rendition,
+    thumbnail_path, write_renditions,
+)
+from photosite.storage import folder_lock
+
+
+class SourceFile:
+    """An original, memory-mapped read-only. Use as a context manager."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def sha256(self):
+        """SHA-256 hex digest of the mapped bytes."""
+        data = self._map if self._map is not None else b''
+        with stage('hash'):
+            digest = hashlib.sha256(data).hexdigest()
+        count('bytes_read', len(data))
+        return digest
+
+    def stream(self):
+        """Binary file object over the mapped bytes, rewound to the start."""
+        if self._map is None:
+            return io.BytesIO(b'')
+        self._map.seek(0)
+        return self._map
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+def _hash_existing(manifest, image_file):
+    """dHash of an image already in metadata.json, reading it only if it changed."""
+    value = manifest.derived(image_file, DHASH_FIELD)
+    if value is None:
+        with SourceFile(image_file) as source:
+            manifest.content_hash(image_file, source.sha256())
+            with stage('dhash'):
+                value = dhash_file(source.stream())
+        manifest.set_derived(image_file, DHASH_FIELD, value)
+    return value
+
+
+def _read_once(manifest, image_file):
+    """
+    Read an original once: hash, extract EXIF/IPTC and decode the mapped bytes.
+
+    Records the SHA-256 and dHash in the manifest. Returns (sha256, capture
+    fields, decode_ladder() result).
+    """
+    with SourceFile(image_file) as source:
+        sha256 = source.sha256()
+        manifest.content_hash(image_file, sha256)
+        with stage('exif'):
+            capture = read_capture_metadata(source.stream())
+        decoded = decode_ladder(source.stream())
+    with stage('dhash'):
+        value = dhash(smallest_rendition(decoded))
+    manifest.set_derived(image_file, DHASH_FIELD, value)
+    return sha256, capture, decoded
+
+
+def _write(manifest, collection_path, image_file, read, log):
+    """Write the renditions of a _read_once() result and record them; returns the metadata fields."""
+    sha256, capture, decoded = read
+    qualities = rendition_qualities(decoded, cached=manifest.derived(image_file, QUALITIES_FIELD))
+    manifest.set_derived(image_file, QUALITIES_FIELD, qualities)
+    fields = write_renditions(decoded, collection_path, image_file.name, qualities=qualities)
+    fields.update(capture)
+    manifest.record(image_file, 'renditions', RENDITION_SETTINGS, sha256)
+
+    widths = "/".join(str(r['width']) for r in fields['renditions'])
+    log('SUCCESS', f"  ✓ {image_file.name} ({fields['width']}x{fields['height']}) → {widths or 'thumbnail only'}")
+    return fields
+
+
+@timed('ingest')
+def ingest_images(collection_path, image_files, existing_filenames=(),
+                  max_distance=DEFAULT_MAX_DISTANCE, log=None):
+    """
+    Hash, deduplicate and build renditions for a collection's originals.
+
+    Images named in existing_filenames (already in metadata.json) are only
+    hashed. Every other image is new unless its dHash is within
+    max_distance bits of an existing or earlier new image, in which case it
+    is a variant and skipped. New images get their renditions built from
+    the same decode used for the dHash, unless the manifest records them as
+    current for these exact source bytes.
+
+    Returns:
+        tuple: (new_images, built) - new image paths in input order, and
+               filename -> write_renditions() fields plus EXIF/IPTC fields
+               for images built here
+    """
+    log = log or (lambda level, message: None)
+    collection_path = Path(collection_path)
+    with folder_lock(collection_path, log):
+        manifest = BuildManifest.load(collection_path)
+        existing_filenames = set(existing_filenames)
+
+        tree = BKTree()
+        for image_file in image_files:
+            if image_file.name not in existing_filenames:
+                continue
+            try:
+                tree.add(_hash_existing(manifest, image_file), image_file.name)
+            except OSError as e:
+                log('WARNING', f"  Could not hash {image_file.name}: {e}")
+
+        def variant_of(value):
+            matches = tree.search(value, max_distance)
+            return matches[0][1] if matches else None
+
+        new_images = []
+        built = {}
+        for image_file in image_files:
+            if image_file.name in existing_filenames:
+                continue
+            try:
+                # Unchanged variants, or unchanged and already built: decide
+                # from the manifest alone
+                value = manifest.derived(image_file, DHASH_FIELD)
+                match = variant_of(value) if value is not None else None
+                if match:
+                    log('INFO', f"  {image_file.name} is a variant of {match} (skipped)")
+                    continue
+                if value is not None and manifest.is_current(
+                        image_file, 'renditions', RENDITION_SETTINGS,
+                        thumbnail_path(collection_path, image_file.name)):
+                    tree.add(value, image_file.name)
+                    new_images.append(image_file)
+                    log('SUCCESS', f"  ✓ {image_file.name} (thumbnails up to date)")
+                    continue
+
+                read = _read_once(manifest, image_file)
+                match = variant_of(manifest.derived(image_file, DHASH_FIELD))
+                if match:
+                    log('INFO', f"  {image_file.name} is a variant of {match} (skipped)")
+                    continue
+                tree.add(manifest.derived(image_file, DHASH_FIELD), image_file.name)
+                new_images.append(image_file)
+                built[image_file.name] = _write(manifest, collection_path, image_file, read, log)
+
+            except Exception as e:
+                log('ERROR', f"  ✗ Failed to process {image_file.name}: {str(e)}")
+                new_images.append(image_file)
+
+        manifest.prune()
+        manifest.save()
+    return new_images, built
+
+
+@timed('refresh')
+def refresh_images(collection_path, image_files, log=None):
+    """
+    Rebuild renditions and EXIF/IPTC fields of images already in metadata.json.
+
+    Images whose renditions the manifest records as current for their
+    content are skipped without being read; the rest are read once.
+
+    Returns:
+        dict: filename -> write_renditions() fields plus EXIF/IPTC fields
+    """
+    log = log or (lambda level, message: None)
+    collection_path = Path(collection_path)
+    with folder_lock(collection_path, log):
+        manifest = BuildManifest.load(collection_path)
+
+        built = {}
+        for image_file in image_files:
+            if manifest.is_current(image_file, 'renditions', RENDITION_SETTINGS,
+                                   thumbnail_path(collection_path, image_file.name)):
+                log('SUCCESS', f"  ✓ {image_file.name} (thumbnails up to date)")
+                continue
+            try:
+                read = _read_once(manifest, image_file)
+                built[image_file.name] = _write(manifest, collection_path, image_file, read, log)
+            except Exception as e:
+                log('ERROR', f"  ✗ Failed to process {image_file.name}: {str(e)}")
+
+        manifest.save()
+    return built
@@ -0,0 +1,61 @@
+"""
+Low-quality image placeholders (LQIP) and dominant colors.
+
+Computed from pixels that are already decoded for the rendition ladder
+(the smallest rendition), so they add no extra decode of the original:
+
+    'placeholder'  data: URI of a PLACEHOLDER_WIDTH px wide JPEG (~300 bytes)
+    'color'        dominant color as '#rrggbb'
+
+The JS loaders and pre-rendered pages paint them as the <img> background
+so every tile shows its colors immediately while the real bytes stream in.
+"""
+
+import base64
+import io
+
+from PIL import Image
+
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_QUALITY = 40
+
+# Dominant color: most common of COLOR_PALETTE_SIZE median-cut colors
+# on a COLOR_SAMPLE_SIZE square sample
+COLOR_SAMPLE_SIZE = 64
+COLOR_PALETTE_SIZE = 5
+
+
+def placeholder_data_uri(img, width=PLACEHOLDER_WIDTH, quality=PLACEHOLDER_QUALITY):
+    """Tiny JPEG preview of an RGB image as a data: URI."""
+    height = max(1, round(width * img.height / img.width))
+    preview = img.resize((width, height), Image.Resampling.BOX)
+    buffer = io.BytesIO()
+    preview.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def dominant_color(img):
+    """Most common color of an RGB image as '#rrggbb'."""
+    sample = img.resize((COLOR_SAMPLE_SIZE, COLOR_SAMPLE_SIZE), Image.Resampling.BOX)
+    quantized = sample.quantize(colors=COLOR_PALETTE_SIZE, method=Image.Quantize.MEDIANCUT)
+    _, index = max(quantized.getcolors())
+    r, g, b = quantized.getpalette()[index * 3:index * 3 + 3]
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+def placeholder_fields(img):
+    """
+    Placeholder metadata fields for an already-decoded image.
+
+    Args:
+        img: PIL image, ideally a small rendition (any mode)
+
+    Returns:
+        dict: 'placeholder' and 'color' fields for the image's metadata entry
+    """
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return {
+        'placeholder': placeholder_data_uri(img),
+        'color': dominant_color(img),
+    }
@@ -0,0 +1,347 @@
+"""
+Build-time pre-rendering of the gallery pages.
+
+Reads gallery-index.json (see photosite.site_index) and writes the same
+markup the JS loaders would build straight into the HTML, so the
+galleries paint from the first byte instead of after the scripts fetch
+and parse metadata:
+
+- index.html                       featured images of every collection
+- browse.html                      tag buttons + galleries for the default tags
+- collections/<collection-id>.html one static page per collection, built
+                                   from the collection.html template
+
+Pages mark the generated regions with <!-- prerender:NAME --> ...
+<!-- /prerender:NAME --> comments; only those regions are replaced. The
+loaders see that their container already has content and only hydrate
+(attach filters; the lightbox uses event delegation) instead of
+re-rendering.
+
+Every <img> gets width/height attributes from the real thumbnail
+dimensions to avoid layout shift, and paints its placeholder preview
+and dominant color (photosite.placeholders) until it loads. Files are
+only rewritten when their content changes.
+
+The <!-- prerender:data --> region in the <head> of index.html and
+browse.html gets <meta> tags naming the current fingerprinted
+gallery-index.<hash>.json and search manifest (photosite.fingerprint),
+which the loaders fetch instead of the plain, revalidated names.
+"""
+
+import html
+import json
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from photosite.fingerprint import fingerprinted_name
+from photosite.instrument import timed
+from photosite.renditions import THUMBNAIL_WIDTH
+from photosite.search_index import MANIFEST_FILENAME, search_dir
+from photosite.site_index import INDEX_FILENAME, site_root
+from photosite.storage import atomic_write
+
+COLLECTION_PAGES_DIR = 'collections'
+
+# Must match assets/js/image-helpers.js and browse-loader.js
+IMAGE_SIZES = '(max-width: 600px) 100vw, (max-width: 1100px) 50vw, 400px'
+MODERN_FORMATS = ('avif', 'webp')
+DEFAULT_BROWSE_TAGS = ('travel', 'landscape', 'nature')
+
+REGION_PATTERN = r'(<!-- prerender:{name} -->)(.*?)(\s*<!-- /prerender:{name} -->)'
+
+
+def _e(value):
+    return html.escape(str(value), quote=True)
+
+
+def _url(*parts):
+    return quote('/'.join(str(p) for p in parts), safe='/')
+
+
+def replace_region(page, name, content, indent='      '):
+    """Replace the content of a <!-- prerender:name --> region in page markup."""
+    pattern = re.compile(REGION_PATTERN.format(name=re.escape(name)), re.DOTALL)
+    if not pattern.search(page):
+        raise ValueError(f"missing <!-- prerender:{name} --> region")
+    body = ''.join(f'\n{indent}{line}' if line else '\n' for line in content.splitlines())
+    return pattern.sub(lambda m: m.group(1) + body + m.group(3), page, count=1)
+
+
+def thumbnail_dimensions(gallery_dir, collection_id, image):
+    """(width, height) of an image's default thumbnail, or None if unknown."""
+    if image.get('width') and image.get('height'):
+        width = min(THUMBNAIL_WIDTH, image['width'])
+        return width, max(1, int(width * image['height'] / image['width']))
+
+    thumb = Path(gallery_dir) / collection_id / 'thumbnails' / image['filename']
+    if not thumb.exists():
+        return None
+    from PIL import Image
+    with Image.open(thumb) as img:
+        return img.size
+
+
+def thumbnail_src(image):
+    """Collection-relative path of an image's default thumbnail, as thumbnailSrc() in image-helpers.js."""
+    return image.get('thumbnail') or f"thumbnails/{image['filename']}"
+
+
+def data_url(root, path):
+    """
+    Site-relative URL of a generated data file's fingerprinted version.
+
+    Falls back to the plain file if that version has not been published.
+    """
+    path = Path(path)
+    current = path.with_name(fingerprinted_name(path.name, path.read_bytes()))
+    return _url((current if current.exists() else path).relative_to(root).as_posix())
+
+
+def render_data_links(root, gallery_dir, search=False):
+    """<meta> tags naming the current gallery index (and search manifest) for the loaders."""
+    lines = [f'<meta name="gallery-index" content="{data_url(root, gallery_dir / INDEX_FILENAME)}" />']
+    manifest = search_dir(gallery_dir) / MANIFEST_FILENAME
+    if search and manifest.exists():
+        lines.append(f'<meta name="search-index" content="{data_url(root, manifest)}" />')
+    return '\n'.join(lines)
+
+
+def _srcset(collection_id, image, fmt=None):
+    candidates = []
+    for rendition in image.get('renditions', []):
+        file = rendition.get('variants', {}).get(fmt) if fmt else rendition
+        if file:
+            url = _url('assets/images/gallery', collection_id, file['path'])
+            candidates.append(f"{url} {rendition['width']}w")
+    return ', '.join(candidates)
+
+
+def placeholder_style(image):
+    """Inline style for the placeholder preview/color, as placeholderStyle() in image-helpers.js."""
+    rules = []
+    if image.get('color'):
+        rules.append(f"background-color: {image['color']}")
+    if image.get('placeholder'):
+        rules.append(f"background-image: url('{image['placeholder']}')")
+    return _e('; '.join(rules))
+
+
+def render_picture(gallery_dir, collection_id, image):
+    """<picture> markup for one image, matching the loaders' output."""
+    lines = ['<picture>']
+    for fmt in MODERN_FORMATS:
+        srcset = _srcset(collection_id, image, fmt)
+        if not srcset and fmt in image.get('thumbnailVariants', {}):
+            srcset = _url('assets/images/gallery', collection_id, image['thumbnailVariants'][fmt]['path'])
+        if srcset:
+            lines.append(f'  <source type="image/{fmt}" srcset="{srcset}" sizes="{IMAGE_SIZES}" />')
+
+    attrs = [
+        'class="js-lightbox-trigger"',
+        f'src="{_url("assets/images/gallery", collection_id, thumbnail_src(image))}"',
+    ]
+    srcset = _srcset(collection_id, image)
+    if srcset:
+        attrs.append(f'srcset="{srcset}" sizes="{IMAGE_SIZES}"')
+    dimensions = thumbnail_dimensions(gallery_dir, collection_id, image)
+    if dimensions:
+        attrs.append(f'width="{dimensions[0]}" height="{dimensions[1]}"')
+    style = placeholder_style(image)
+    if style:
+        attrs.append(f'style="{style}"')
+    attrs += [
+        f'data-full="{_url("assets/images/gallery", collection_id, "full-res", image["filename"])}"',
+        f'alt="{_e(image["description"])}"',
+        f'data-title="{_e(image["title"])}"',
+    ]
+    lines.append('  <img')
+    lines += [f'    {attr}' for attr in attrs]
+    lines.append('  />')
+    lines.append('</picture>')
+    return '\n'.join(lines)
+
+
+def _indent(text, prefix):
+    return '\n'.join(prefix + line if line else line for line in text.splitlines())
+
+
+def render_figure(gallery_dir, collection_id, image):
+    """Gallery <figure> as built by createImageFigure() in gallery-loader.js."""
+    return '\n'.join([
+        '<figure>',
+        _indent(render_picture(gallery_dir, collection_id, image), '  '),
+        f'  <figcaption>{_e(image["title"])}</figcaption>',
+        '</figure>',
+    ])
+
+
+def render_gallery_section(gallery_dir, collection, images):
+    """Home page section as built by createGallerySection() in gallery-loader.js."""
+    featured = [img for img in images if img.get('featured')] or images[:6]
+    hidden = len(images) - len(featured)
+    count_text = f' (+{hidden} more)' if hidden > 0 else ''
+    figures = '\n'.join(render_figure(gallery_dir, collection['id'], img) for img in featured)
+    page = f"{COLLECTION_PAGES_DIR}/{collection['slug']}.html"
+
+    return '\n'.join([
+        f'<section class="gallery-section" id="gallery-{_e(collection["id"])}">',
+        '  <div class="collection-header">',
+        f'    <h2>{_e(collection["title"])}</h2>',
+        f'    <p class="collection-meta">{_e(collection["location"])} • {_e(collection["date"])}</p>',
+        f'    <p class="collection-description">{_e(collection["description"])}</p>',
+        '  </div>',
+        '  <div class="gallery">',
+        _indent(figures, '    '),
+        '  </div>',
+        '  <div class="view-collection-link">',
+        f'    <a href="{_url(page)}" aria-label="View all {len(images)} images in {_e(collection["title"])} collection">',
+        f'      View Full Collection{count_text} &rarr;',
+        '    </a>',
+        '  </div>',
+        '</section>',
+    ])
+
+
+def render_collection_figure(gallery_dir, collection_id, image):
+    """Collection page <figure> as built by renderCollection() in collection-loader.js."""
+    lines = [
+        '<figure>',
+        '  <div class="image-wrapper">',
+        _indent(render_picture(gallery_dir, collection_id, image), '    '),
+        '  </div>',
+        '  <figcaption>',
+        f'    <strong>{_e(image["title"])}</strong>',
+    ]
+    if image.get('printAvailable') and image.get('printSizes'):
+        lines.append(f'    <div class="print-meta">Prints starting at ${image["printSizes"][0]["price"]}</div>')
+    lines += ['  </figcaption>', '</figure>']
+    return '\n'.join(lines)
+
+
+def render_browse(gallery_dir, index, selected=DEFAULT_BROWSE_TAGS):
+    """(tag buttons, galleries) markup for browse.html with the default tag selection."""
+    selected = set(selected)
+    buttons = [f'<button class="tag-button all{" active" if not selected else ""}">All Images</button>']
+    for tag in sorted(index['tags']):
+        active = ' active' if tag in selected else ''
+        buttons.append(
+            f'<button class="tag-button{active}" data-tag="{_e(tag)}">{_e(tag.replace("-", " ", 1))}</button>')
+
+    positions = sorted({p for tag in selected for p in index['tags'].get(tag, [])})
+    images = [index['images'][p] for p in positions] if selected else index['images']
+
+    grouped = {}
+    for image in images:
+        grouped.setdefault(image['collectionId'], []).append(image)
+
+    sections = []
+    for collection_id, collection_images in grouped.items():
+        count = len(collection_images)
+        figures = '\n'.join(render_figure(gallery_dir, collection_id, img) for img in collection_images)
+        sections.append('\n'.join([
+            '<section class="category-section">',
+            '  <h3>',
+            f'    {_e(collection_images[0]["collectionTitle"])}',
+            f'    <span class="image-count">({count} image{"s" if count != 1 else ""})</span>',
+            '  </h3>',
+            '  <div class="gallery">',
+            _indent(figures, '    '),
+            '  </div>',
+            '</section>',
+        ]))
+    if not sections:
+        sections.append('<div class="empty-state">\n  <p>No images found matching these categories.</p>\n</div>')
+
+    return '\n'.join(buttons), '\n'.join(sections)
+
+
+def render_collection_page(gallery_dir, template, collection, images):
+    """Static collection page from the collection.html template."""
+    page = template.replace('<meta charset="UTF-8" />', '<meta charset="UTF-8" />\n  <base href="../" />', 1)
+    page = re.sub(r'<title>.*?</title>',
+                  f'<title>{_e(collection["title"])} · Mark Mimms Photography</title>', page, count=1)
+    page = page.replace('<main id="collection-main">',
+                        f'<main id="collection-main" data-collection-id="{_e(collection["id"])}">', 1)
+    page = replace_region(page, 'header', '\n'.join([
+        f'<h1>{_e(collection["title"])}</h1>',
+        f'<span>{_e(collection["location"])} • {_e(collection["date"])}</span>',
+    ]))
+    page = replace_region(page, 'intro', f'<p>{_e(collection["description"])}</p>')
+    page = replace_region(page, 'grid', '\n'.join(
+        render_collection_figure(gallery_dir, collection['id'], img) for img in images))
+    return page
+
+
+def _write_if_changed(path, content, written):
+    path = Path(path)
+    if path.exists() and path.read_text(encoding='utf-8') == content:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write(path, content)
+    written.append(path)
+
+
+@timed('render')
+def prerender_site(gallery_dir, log=None):
+    """
+    Pre-render index.html, browse.html and collections/<id>.html.
+
+    Returns:
+        list: paths that were (re)written
+    """
+    log = log or (lambda level, message: None)
+    gallery_dir = Path(gallery_dir)
+    root = site_root(gallery_dir)
+    index_path = gallery_dir / INDEX_FILENAME
+    if not index_path.exists():
+        log('WARNING', f"  {INDEX_FILENAME} not found; run the index stage first")
+        return []
+
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+
+    by_collection = {c['id']: [] for c in index['collections']}
+    for image in index['images']:
+        by_collection[image['collectionId']].append(image)
+
+    written = []
+
+    home_path = root / 'index.html'
+    sections = '\n'.join(
+        render_gallery_section(gallery_dir, c, by_collection[c['id']]) for c in index['collections'])
+    page = home_path.read_text(encoding='utf-8')
+    page = replace_region(page, 'data', render_data_links(root, gallery_dir), indent='  ')
+    page = replace_region(page, 'collections', sections)
+    _write_if_changed(home_path, page, written)
+
+    browse_path = root / 'browse.html'
+    buttons, galleries = render_browse(gallery_dir, index)
+    page = browse_path.read_text(encoding='utf-8')
+    page = replace_region(page, 'data', render_data_links(root, gallery_dir, search=True), indent='  ')
+    page = replace_region(page, 'tags', buttons)
+    page = replace_region(page, 'galleries', galleries)
+    _write_if_changed(browse_path, page, written)
+
+    template = (root / 'collection.html').read_text(encoding='utf-8')
+    pages_dir = root / COLLECTION_PAGES_DIR
+    expected = set()
+    for collection in index['collections']:
+        page_path = pages_dir / f"{collection['slug']}.html"
+        expected.add(page_path)
+        _write_if_changed(page_path, render_collection_page(
+            gallery_dir, template, collection, by_collection[collection['id']]), written)
+
+    # Remove pages of collections that are no longer live
+    if pages_dir.exists():
+        for stale in pages_dir.glob('*.html'):
+            if stale not in expected:
+                stale.unlink()
+                log('INFO', f"  Removed stale {stale.relative_to(root)}")
+
+    if written:
+        for path in written:
+            log('SUCCESS', f"  ✓ Rendered {path.relative_to(root)}")
+    else:
+        log('INFO', "  Pre-rendered pages are up to date")
+    return written
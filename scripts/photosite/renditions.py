@@ -0,0 +1,452 @@
+"""
+Responsive rendition ladder.
+
+Every original is decoded once (at reduced scale where possible, see
+photosite.imaging) and then resized down a ladder of widths, each step
+resampled from the previous, larger one:
+
+    <collection>/thumbnails/<stem>.<hash>.jpg          THUMBNAIL_WIDTH, used as <img src>
+    <collection>/thumbnails/<width>/<stem>.<hash>.jpg  one per RENDITION_WIDTHS entry
+
+Widths larger than the original are skipped rather than upscaled. Each
+ladder rendition and the default thumbnail also get WebP/AVIF siblings
+(thumbnails/<width>/<stem>.<hash>.webp, .avif) at qualities auto-matched
+to the JPEG, see photosite.encoding; callers cache the matched qualities
+in the build manifest (QUALITIES_FIELD), so rebuilding unchanged content
+skips the search.
+Every file name carries a hash of its content (photosite.fingerprint), so
+it can be cached forever; the default thumbnail is also written to
+thumbnails/<filename> as a stable alias.
+
+Each rendition's width, height, byte size, path and format variants are
+recorded in the image's metadata.json entry so the JS loaders can emit
+<picture>/srcset/sizes, together with the default thumbnail's path
+('thumbnail') and its format variants ('thumbnailVariants', the <source>
+fallback for images too small for the ladder), and a tiny placeholder
+preview and dominant color taken from the smallest rendition
+(photosite.placeholders).
+"""
+
+import io
+import json
+from pathlib import Path
+
+from PIL import Image
+
+from photosite.discovery import full_res_dir
+from photosite.encoding import (
+    MODERN_FORMATS, available_formats, encode_variant, pick_qualities, variant_path,
+)
+from photosite.fingerprint import latest_version, write_fingerprinted
+from photosite.imaging import (
+    RESAMPLE_FILTER, TRANSPOSED_ORIENTATIONS, downscale_upright, open_original, open_scaled, orientation,
+    resize_to_width, target_size, upright,
+)
+from photosite.instrument import count, stage, timed
+from photosite.memory import check_decode, decode_plan, encode_fits, image_bytes
+from photosite.placeholders import placeholder_fields
+from photosite.storage import atomic_write, folder_lock, write_metadata
+
+RENDITION_WIDTHS = (320, 640, 1024, 1600, 2400)
+THUMBNAIL_WIDTH = 800
+RENDITION_QUALITY = 85
+RENDITION_FORMAT = 'JPEG'
+
+# Width of the rendition used to auto-pick WebP/AVIF qualities
+QUALITY_PROBE_WIDTH = 640
+
+# Build manifest field caching an image's auto-picked qualities
+QUALITIES_FIELD = 'qualities'
+
+# Everything that affects rendition output; a change here rebuilds renditions
+RENDITION_SETTINGS = {
+    'widths': list(RENDITION_WIDTHS),
+    'thumbnail_width': THUMBNAIL_WIDTH,
+    'quality': RENDITION_QUALITY,
+    'format': RENDITION_FORMAT,
+    'progressive': True,
+    'variants': available_formats(),
+    'upright': True,
+    'fingerprinted': True,
+    'thumbnail_variants': True,
+}
+
+
+def thumbnail_path(collection_path, filename):
+    """Path of the default thumbnail's stable alias for an image."""
+    return Path(collection_path) / 'thumbnails' / filename
+
+
+def rendition_path(collection_path, width, filename):
+    """Path of one ladder rendition for an image, before fingerprinting."""
+    return Path(collection_path) / 'thumbnails' / str(width) / filename
+
+
+def current_file(path):
+    """Current fingerprinted version of an output path, else the unfingerprinted file itself, else None."""
+    found = latest_version(path)
+    if found is None and Path(path).exists():
+        found = Path(path)
+    return found
+
+
+def ladder_widths(original_width, widths=RENDITION_WIDTHS):
+    """Ladder widths that fit within the original, largest first."""
+    return sorted((w for w in widths if w <= original_width), reverse=True)
+
+
+def save_options(quality=RENDITION_QUALITY, exif=None):
+    """Pillow save() options for a JPEG rendition (EXIF bytes kept if given)."""
+    options = {
+        'format': RENDITION_FORMAT,
+        'quality': quality,
+        'optimize': True,
+        'progressive': True,
+    }
+    if exif:
+        options['exif'] = exif
+    return options
+
+
+def _encode_jpeg(img, quality, exif=None):
+    buffer = io.BytesIO()
+    img.save(buffer, **save_options(quality, exif))
+    return buffer.getvalue()
+
+
+def _variant_records(collection_path, variant_paths):
+    return {
+        fmt: {
+            'bytes': sibling.stat().st_size,
+            'path': sibling.relative_to(collection_path).as_posix(),
+        }
+        for fmt, sibling in variant_paths.items()
+    }
+
+
+def _rendition_record(collection_path, path, size, variant_paths=None):
+    record = {
+        'width': size[0],
+        'height': size[1],
+        'bytes': path.stat().st_size,
+        'path': path.relative_to(collection_path).as_posix(),
+    }
+    variants = _variant_records(collection_path, variant_paths or {})
+    if variants:
+        record['variants'] = variants
+    return record
+
+
+def _open_checked(source, widths, formats=()):
+    """open_scaled() plus its decode_plan(), refusing decodes that do not fit in the memory budget."""
+    img, original_size = open_scaled(source, max(widths))
+    plan = decode_plan(img, original_size, widths, formats)
+    try:
+        check_decode(plan)
+    except Image.DecompressionBombError:
+        img.close()
+        raise
+    return img, original_size, plan
+
+
+def decode_ladder(source, widths=RENDITION_WIDTHS, thumbnail_width=THUMBNAIL_WIDTH):
+    """
+    Decode an original once and resize it down the rendition cascade.
+
+    The original is decoded at the largest size needed and turned upright
+    per its EXIF orientation; each smaller rendition is resized from the
+    previous one. Nothing is written. Decodes too large for the memory
+    budget are refused, and very large ones downscaled in strips (see
+    photosite.memory).
+
+    Args:
+        source: path or binary file object of the original
+
+    Returns:
+        dict: 'original_size', 'exif' (bytes or None), 'ladder' (widths,
+              largest first), 'default_width' and 'resized' (width -> RGB image)
+    """
+    with stage('decode'):
+        img, original_size, plan = _open_checked(source, (*widths, thumbnail_width), available_formats())
+        img.load()
+
+    with img, stage('resize'):
+        ladder = ladder_widths(original_size[0], widths)
+        default_width = min(thumbnail_width, original_size[0])
+        steps = sorted(set(ladder) | {default_width}, reverse=True)
+
+        if plan['strips']:
+            count('strip_decodes')
+            current, exif = downscale_upright(img, steps[0], original_size)
+            img.close()  # free the decoded pixels before the cascade
+        else:
+            current, exif = upright(img)
+            current = current.convert('RGB') if current.mode != 'RGB' else current
+
+        # Resize down the cascade, each step from the previous one
+        resized = {}
+        for width in steps:
+            size = target_size(original_size, width)
+            if current.size != size:
+                current = current.resize(size, RESAMPLE_FILTER)
+            resized[width] = current
+
+    return {
+        'original_size': original_size,
+        'exif': exif,
+        'ladder': ladder,
+        'default_width': default_width,
+        'resized': resized,
+    }
+
+
+def smallest_rendition(decoded):
+    """Smallest image of a decode_ladder() result."""
+    return decoded['resized'][min(decoded['resized'])]
+
+
+def _held_bytes(decoded):
+    return sum(image_bytes(img.size) for img in decoded['resized'].values())
+
+
+def rendition_qualities(decoded, quality=RENDITION_QUALITY, formats=None, cached=None):
+    """
+    WebP/AVIF qualities matched to the JPEG for a decode_ladder() result.
+
+    The search runs on the rendition closest to QUALITY_PROBE_WIDTH.
+    `cached` is an earlier result for the same image content (kept in the
+    build manifest under QUALITIES_FIELD); it is reused when it was picked
+    for the same JPEG quality and covers every format, skipping the search.
+
+    Returns:
+        dict: 'jpeg' -> the JPEG quality, plus format name -> quality for
+              every format in `formats` (default: available_formats())
+              that can encode the probe within the memory budget
+    """
+    formats = available_formats() if formats is None else formats
+    if cached and cached.get('jpeg') == quality and all(fmt in cached for fmt in formats):
+        count('quality_cache_hits')
+        return {'jpeg': quality, **{fmt: cached[fmt] for fmt in formats}}
+
+    resized = decoded['resized']
+    probe_width = min(resized, key=lambda w: abs(w - QUALITY_PROBE_WIDTH))
+    held = _held_bytes(decoded)
+    formats = [fmt for fmt in formats if encode_fits(resized[probe_width].size, fmt, held)]
+    if not formats:
+        return {'jpeg': quality}
+    with stage('encode.quality_search'):
+        return {'jpeg': quality, **pick_qualities(resized[probe_width], quality, formats)}
+
+
+def _write_variants(img, path, qualities, formats, held):
+    """Modern-format siblings of one JPEG output; returns format -> fingerprinted path."""
+    variant_paths = {}
+    for fmt in formats:
+        if fmt not in qualities or not encode_fits(img.size, fmt, held):
+            continue  # e.g. the wide renditions of a tall panorama
+        with stage(f'encode.{fmt}'):
+            variant_data = encode_variant(img, fmt, qualities[fmt])
+        variant_paths[fmt] = write_fingerprinted(variant_path(path, fmt), variant_data)
+        count('bytes_written', len(variant_data))
+    return variant_paths
+
+
+def write_renditions(decoded, collection_path, filename, quality=RENDITION_QUALITY, formats=None,
+                     qualities=None):
+    """
+    Write the default thumbnail and every ladder rendition of a decoded image.
+
+    EXIF (with the orientation reset, as the pixels are already upright) is
+    kept on the default thumbnail only; ladder renditions are stripped to
+    save bytes. The default thumbnail and each ladder rendition are also
+    written in every format in `formats` (default: every modern format
+    Pillow can encode) that can encode them within the memory budget
+    (photosite.memory), at `qualities` (a rendition_qualities() result;
+    searched if None).
+
+    Returns:
+        dict: metadata fields for the image - original 'width'/'height',
+              the default 'thumbnail' path and its 'thumbnailVariants', a
+              'renditions' list sorted by width (smallest first) and the
+              'placeholder'/'color' fields
+    """
+    collection_path = Path(collection_path)
+    formats = available_formats() if formats is None else formats
+    resized, ladder, exif = decoded['resized'], decoded['ladder'], decoded['exif']
+    original_size = decoded['original_size']
+    held = _held_bytes(decoded)
+
+    # Match modern-format quality to the JPEG on one mid-size rendition
+    if qualities is None:
+        qualities = rendition_qualities(decoded, quality, formats)
+
+    path = thumbnail_path(collection_path, filename)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    default = resized[decoded['default_width']]
+    with stage('encode.jpeg'):
+        data = _encode_jpeg(default, quality, exif)
+    atomic_write(path, data)
+    thumbnail = write_fingerprinted(path, data)
+    count('bytes_written', 2 * len(data))
+    thumbnail_variants = _write_variants(default, path, qualities, formats, held)
+
+    records = []
+    for width in ladder:
+        path = rendition_path(collection_path, width, filename)
+        with stage('encode.jpeg'):
+            data = _encode_jpeg(resized[width], quality)
+        fingerprinted = write_fingerprinted(path, data)
+        count('bytes_written', len(data))
+        variant_paths = _write_variants(resized[width], path, qualities, formats, held)
+        records.append(_rendition_record(collection_path, fingerprinted, resized[width].size, variant_paths))
+
+    records.sort(key=lambda r: r['width'])
+    with stage('placeholder'):
+        placeholder = placeholder_fields(smallest_rendition(decoded))
+    fields = {
+        'width': original_size[0],
+        'height': original_size[1],
+        'thumbnail': thumbnail.relative_to(collection_path).as_posix(),
+        'renditions': records,
+        **placeholder,
+    }
+    if thumbnail_variants:
+        fields['thumbnailVariants'] = _variant_records(collection_path, thumbnail_variants)
+    return fields
+
+
+def write_thumbnail(source, dest_path, width=THUMBNAIL_WIDTH, quality=RENDITION_QUALITY,
+                    resample=RESAMPLE_FILTER):
+    """
+    Write one thumbnail of an original, without the rendition ladder.
+
+    Uses the same decode, orientation handling, RGB conversion and JPEG
+    settings as write_renditions(), resampling straight from the decode
+    with `resample`.
+
+    Args:
+        source: path or binary file object of the original
+        dest_path: where the thumbnail is written
+    """
+    with stage('decode'):
+        img, original_size, plan = _open_checked(source, (width,))
+        img.load()
+    with img, stage('resize'):
+        if plan['strips']:
+            thumbnail, exif = downscale_upright(img, min(width, original_size[0]), original_size, resample)
+        else:
+            current, exif = upright(img)
+            current = current.convert('RGB') if current.mode != 'RGB' else current
+            thumbnail = resize_to_width(current, min(width, original_size[0]), original_size, resample)
+    with stage('encode.jpeg'):
+        thumbnail.save(dest_path, **save_options(quality, exif))
+    count('bytes_written', Path(dest_path).stat().st_size)
+
+
+def build_renditions(source_path, collection_path, widths=RENDITION_WIDTHS,
+                     thumbnail_width=THUMBNAIL_WIDTH, quality=RENDITION_QUALITY,
+                     formats=None, filename=None):
+    """
+    Produce the default thumbnail and every ladder rendition for one image.
+
+    A single decode (decode_ladder) followed by write_renditions.
+    `source_path` may also be a binary file object, in which case
+    `filename` names the outputs.
+
+    Returns:
+        dict: see write_renditions()
+    """
+    decoded = decode_ladder(source_path, widths, thumbnail_width)
+    return write_renditions(decoded, collection_path, filename or Path(source_path).name,
+                            quality, formats)
+
+
+def describe_renditions(source_path, collection_path, widths=RENDITION_WIDTHS):
+    """
+    Rebuild an image's rendition metadata from files already on disk.
+
+    Only image headers are read, except for the smallest rendition on
+    disk (or the default thumbnail), which is decoded for the placeholder.
+    A default thumbnail that has no fingerprinted version yet (written by
+    an older version of the tools) gets one.
+
+    Returns:
+        dict: same shape as build_renditions(), or None if the source is missing
+    """
+    collection_path = Path(collection_path)
+    source_path = Path(source_path)
+    if not source_path.exists():
+        return None
+
+    with open_original(source_path) as img:
+        original_size = img.size[::-1] if orientation(img) in TRANSPOSED_ORIENTATIONS else img.size
+
+    records = []
+    smallest = None
+    for width in sorted(widths):
+        plain = rendition_path(collection_path, width, source_path.name)
+        path = current_file(plain)
+        if path:
+            smallest = smallest or path
+            variant_paths = {fmt: current_file(variant_path(plain, fmt)) for fmt in MODERN_FORMATS}
+            with Image.open(path) as rendition:
+                records.append(_rendition_record(
+                    collection_path, path, rendition.size,
+                    {fmt: p for fmt, p in variant_paths.items() if p}))
+
+    fields = {
+        'width': original_size[0],
+        'height': original_size[1],
+        'renditions': records,
+    }
+
+    alias = thumbnail_path(collection_path, source_path.name)
+    if alias.exists():
+        fields['thumbnail'] = write_fingerprinted(alias, alias.read_bytes()).relative_to(collection_path).as_posix()
+        variant_paths = {fmt: current_file(variant_path(alias, fmt)) for fmt in MODERN_FORMATS}
+        thumbnail_variants = _variant_records(collection_path, {fmt: p for fmt, p in variant_paths.items() if p})
+        if thumbnail_variants:
+            fields['thumbnailVariants'] = thumbnail_variants
+
+    preview_path = smallest or alias
+    if preview_path.exists():
+        with Image.open(preview_path) as preview:
+            fields.update(placeholder_fields(preview))
+    return fields
+
+
+@timed('metadata_update')
+def update_metadata_renditions(collection_path, built=None):
+    """
+    Write rendition fields into a collection's metadata.json.
+
+    Images in `built` (filename -> build_renditions() result) are updated
+    from those results; images that have no 'renditions' or 'placeholder'
+    yet are filled in from files on disk. Does nothing if the collection has no metadata.json.
+
+    Returns:
+        int: number of image entries changed
+    """
+    collection_path = Path(collection_path)
+    metadata_path = collection_path / 'metadata.json'
+    if not metadata_path.exists():
+        return 0
+
+    with folder_lock(collection_path):
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+
+        built = built or {}
+        changed = 0
+        for image in metadata.get('images', []):
+            fields = built.get(image['filename'])
+            if fields is None and any(k not in image for k in ('renditions', 'placeholder', 'thumbnail')):
+                fields = describe_renditions(
+                    full_res_dir(collection_path) / image['filename'], collection_path)
+            if fields and any(image.get(k) != v for k, v in fields.items()):
+                image.update(fields)
+                changed += 1
+
+        if changed:
+            write_metadata(metadata_path, metadata)
+    return changed
@@ -0,0 +1,233 @@
+"""
+Schemas for the JSON documents the tools write.
+
+The schemas use a small subset of JSON Schema (type, required,
+properties, additionalProperties, items, minimum, minLength, pattern)
+checked by validate(), so no extra package is needed. Unknown keys are
+allowed: collections may carry hand-added fields. Every document is
+validated before it is written (see photosite.storage); a failure raises
+SchemaError naming the offending path, and the file on disk is left alone.
+"""
+
+import re
+
+STRING = {'type': 'string'}
+NON_EMPTY_STRING = {'type': 'string', 'minLength': 1}
+BOOLEAN = {'type': 'boolean'}
+DIMENSION = {'type': 'integer', 'minimum': 1}
+BYTE_COUNT = {'type': 'integer', 'minimum': 0}
+OBJECT = {'type': 'object'}
+
+PRINT_SIZE_SCHEMA = {
+    'type': 'object',
+    'required': ['size', 'price'],
+    'properties': {
+        'size': NON_EMPTY_STRING,
+        'price': {'type': 'number', 'minimum': 0},
+    },
+}
+
+VARIANTS_SCHEMA = {
+    'type': 'object',
+    'additionalProperties': {
+        'type': 'object',
+        'required': ['path'],
+        'properties': {'path': NON_EMPTY_STRING, 'bytes': BYTE_COUNT},
+    },
+}
+
+RENDITION_SCHEMA = {
+    'type': 'object',
+    'required': ['width', 'height', 'path'],
+    'properties': {
+        'width': DIMENSION,
+        'height': DIMENSION,
+        'bytes': BYTE_COUNT,
+        'path': NON_EMPTY_STRING,
+        'variants': VARIANTS_SCHEMA,
+    },
+}
+
+IMAGE_SCHEMA = {
+    'type': 'object',
+    'required': ['id', 'title', 'filename', 'tags'],
+    'properties': {
+        'id': NON_EMPTY_STRING,
+        'title': STRING,
+        'filename': NON_EMPTY_STRING,
+        'description': STRING,
+        'location': STRING,
+        'tags': {'type': 'array', 'items': NON_EMPTY_STRING},
+        'printSizes': {'type': 'array', 'items': PRINT_SIZE_SCHEMA},
+        'featured': BOOLEAN,
+        'printAvailable': BOOLEAN,
+        'width': DIMENSION,
+        'height': DIMENSION,
+        'thumbnail': NON_EMPTY_STRING,
+        'thumbnailVariants': VARIANTS_SCHEMA,
+        'renditions': {'type': 'array', 'items': RENDITION_SCHEMA},
+        'placeholder': {'type': 'string', 'pattern': r'^data:image/'},
+        'color': {'type': 'string', 'pattern': r'^#[0-9a-fA-F]{6}$'},
+        'exif': OBJECT,
+        'iptc': OBJECT,
+    },
+}
+
+COLLECTION_SCHEMA = {
+    'type': 'object',
+    'required': ['id', 'title', 'slug', 'coverImage'],
+    'properties': {
+        'id': NON_EMPTY_STRING,
+        'title': STRING,
+        'slug': NON_EMPTY_STRING,
+        'displayCategory': STRING,
+        'description': STRING,
+        'location': STRING,
+        'date': STRING,
+        'coverImage': NON_EMPTY_STRING,
+        'featured': BOOLEAN,
+        'printAvailable': BOOLEAN,
+    },
+}
+
+METADATA_SCHEMA = {
+    'type': 'object',
+    'required': ['collection', 'images'],
+    'properties': {
+        'collection': COLLECTION_SCHEMA,
+        'images': {'type': 'array', 'items': IMAGE_SCHEMA},
+    },
+}
+
+INDEX_SCHEMA = {
+    'type': 'object',
+    'required': ['version', 'collections', 'images', 'tags', 'sources'],
+    'properties': {
+        'version': {'type': 'integer', 'minimum': 1},
+        'collections': {'type': 'array', 'items': COLLECTION_SCHEMA},
+        'images': {
+            'type': 'array',
+            'items': dict(IMAGE_SCHEMA, required=IMAGE_SCHEMA['required'] + ['collectionId']),
+        },
+        'tags': {
+            'type': 'object',
+            'additionalProperties': {'type': 'array', 'items': {'type': 'integer', 'minimum': 0}},
+        },
+        'sources': {'type': 'object', 'additionalProperties': STRING},
+    },
+}
+
+SEARCH_MANIFEST_SCHEMA = {
+    'type': 'object',
+    'required': ['version', 'images', 'fields', 'stopwords', 'minTokenLength', 'shards'],
+    'properties': {
+        'version': {'type': 'integer', 'minimum': 1},
+        'images': {'type': 'integer', 'minimum': 0},
+        'fields': {'type': 'object', 'additionalProperties': {'type': 'integer', 'minimum': 1}},
+        'stopwords': {'type': 'array', 'items': NON_EMPTY_STRING},
+        'minTokenLength': {'type': 'integer', 'minimum': 1},
+        'shards': {
+            'type': 'object',
+            'additionalProperties': {'type': 'string', 'pattern': r'^[0-9a-f]+$'},
+        },
+    },
+}
+
+_TYPES = {
+    'string': str,
+    'boolean': bool,
+    'object': dict,
+    'array': list,
+}
+
+
+class SchemaError(ValueError):
+    """A document does not match its schema."""
+
+
+def _type_matches(value, expected):
+    if expected == 'integer':
+        return isinstance(value, int) and not isinstance(value, bool)
+    if expected == 'number':
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, _TYPES[expected])
+
+
+def validate(document, schema, where='$'):
+    """Raise SchemaError if document does not match schema (see module docstring)."""
+    expected = schema.get('type')
+    if expected and not _type_matches(document, expected):
+        raise SchemaError(f"{where}: expected {expected}, got {type(document).__name__}")
+
+    if isinstance(document, dict):
+        for key in schema.get('required', []):
+            if key not in document:
+                raise SchemaError(f"{where}: missing required field '{key}'")
+        properties = schema.get('properties', {})
+        extra = schema.get('additionalProperties')
+        for key, value in document.items():
+            if key in properties:
+                validate(value, properties[key], f"{where}.{key}")
+            elif extra is not None:
+                validate(value, extra, f"{where}.{key}")
+    elif isinstance(document, list) and 'items' in schema:
+        for position, item in enumerate(document):
+            validate(item, schema['items'], f"{where}[{position}]")
+    elif isinstance(document, str):
+        if len(document) < schema.get('minLength', 0):
+            raise SchemaError(f"{where}: must not be empty")
+        if 'pattern' in schema and not re.search(schema['pattern'], document):
+            raise SchemaError(f"{where}: {document[:40]!r} does not match {schema['pattern']}")
+    elif 'minimum' in schema and _type_matches(document, 'number') and document < schema['minimum']:
+        raise SchemaError(f"{where}: {document} is below the minimum of {schema['minimum']}")
+
+
+def validate_metadata(metadata):
+    """
+    Validate a collection's metadata.json document.
+
+    Beyond the schema, image filenames must be unique and the cover image
+    must be one of them.
+    """
+    validate(metadata, METADATA_SCHEMA)
+    filenames = [image['filename'] for image in metadata['images']]
+    seen = set()
+    for position, filename in enumerate(filenames):
+        if filename in seen:
+            raise SchemaError(f"$.images[{position}].filename: duplicate filename {filename!r}")
+        seen.add(filename)
+    cover = metadata['collection']['coverImage']
+    if filenames and cover not in seen:
+        raise SchemaError(f"$.collection.coverImage: {cover!r} is not one of the collection's images")
+
+
+def validate_index(index):
+    """Validate a gallery-index.json document."""
+    validate(index, INDEX_SCHEMA)
+    for tag, positions in index['tags'].items():
+        if any(position >= len(index['images']) for position in positions):
+            raise SchemaError(f"$.tags.{tag}: position outside the images list")
+
+
+def validate_search_manifest(manifest):
+    """Validate a search/manifest.json document."""
+    validate(manifest, SEARCH_MANIFEST_SCHEMA)
+    for key in manifest['shards']:
+        if not re.fullmatch(r'[a-z0-9_]{1,2}', key):
+            raise SchemaError(f"$.shards: {key!r} is not a valid shard key")
+
+
+def validate_collection_list(collection_ids, expected_ids):
+    """
+    Check the collection IDs parsed back from a rewritten JS collection list.
+
+    Every expected ID must appear exactly once and be a plain slug that is
+    safe inside a single-quoted JS string.
+    """
+    for collection_id in collection_ids:
+        if not re.fullmatch(r'[A-Za-z0-9][A-Za-z0-9_.-]*', collection_id):
+            raise SchemaError(f"collections: {collection_id!r} is not a valid collection ID")
+    for collection_id in expected_ids:
+        count = collection_ids.count(collection_id)
+        if count != 1:
+            raise SchemaError(f"collections: {collection_id!r} appears {count} times")
@@ -0,0 +1,316 @@
+"""
+Full-text search index for the browse page.
+
+Built from gallery-index.json into assets/images/gallery/search/:
+
+    manifest.json      {
+                         "version": 1,
+                         "images": N,                      # length of gallery-index "images"
+                         "fields": {"title": 4, ...},      # field weights
+                         "stopwords": [...], "minTokenLength": 2,
+                         "shards": {"a": "<hash>", "ca": "<hash>", ...}
+                       }
+    <key>.<hash>.json  {"<term>": [position, weight, position delta, weight, ...], ...}
+
+Shards and the manifest carry a hash of their content in their name
+(photosite.fingerprint); browse.html links to the current
+manifest.<hash>.json, manifest.json being the stable alias.
+
+Titles, tags, locations, collection titles and descriptions are split into
+lowercase, accent-free words, stopwords dropped, and reduced to a stem by
+stem(). Each term maps to the images (positions in gallery-index.json
+"images") that contain it, with the summed weight of the fields it
+appears in; positions are delta-encoded to keep shards small.
+
+Terms are sharded by their first character; a shard bigger than
+SHARD_SPLIT_BYTES is split by the first two characters instead. For a
+query word the browse page fetches the manifest plus the one shard its
+key selects, and prefix matches are found within that shard, so a search
+costs the same few small requests however many images the site has.
+tokenize() and stem() are mirrored in browse-loader.js and must stay in
+step with it.
+
+Rebuilds are incremental: the terms of each collection are cached in
+search/.terms-cache.json (local build state) with the hash of the
+metadata.json they came from, so only changed collections are tokenized
+again, and only shards whose content changed are rewritten. The previous
+manifest.<hash>.json and the shards it names are kept for one more build,
+so a browser or page still holding it right after a deploy does not get
+404s for its shards.
+"""
+
+import json
+import re
+import unicodedata
+from pathlib import Path
+
+from photosite.fingerprint import content_digest, fingerprinted_name, original_name, publish, versions
+from photosite.instrument import timed
+from photosite.schema import validate_search_manifest
+from photosite.site_index import INDEX_FILENAME
+from photosite.storage import atomic_write
+
+SEARCH_DIRNAME = 'search'
+MANIFEST_FILENAME = 'manifest.json'
+CACHE_FILENAME = '.terms-cache.json'
+SEARCH_VERSION = 1
+
+FIELD_WEIGHTS = {
+    'title': 4,
+    'tags': 3,
+    'location': 2,
+    'collectionTitle': 2,
+    'description': 1,
+}
+MIN_TOKEN_LENGTH = 2
+STOPWORDS = frozenset((
+    'a an and are as at be by for from has in into is it its of on or '
+    'that the their this to was were with'
+).split())
+SHARD_SPLIT_BYTES = 16 * 1024
+
+SHARD_ALPHABET = frozenset('abcdefghijklmnopqrstuvwxyz0123456789')
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+COMBINING_MARKS = re.compile('[\\u0300-\\u036f]')
+
+
+def search_dir(gallery_dir):
+    """Folder the search index is written to."""
+    return Path(gallery_dir) / SEARCH_DIRNAME
+
+
+def stem(word):
+    """
+    Light suffix-stripping stem of a lowercase word.
+
+    Plurals, -ing/-ed forms and a final 'e' are removed, so 'cities',
+    'city' -> 'city'; 'hikes', 'hiking', 'hiked' -> 'hik'; 'running' ->
+    'run'. Words of three letters or fewer and words with digits are left
+    alone.
+    """
+    if len(word) <= 3 or not re.fullmatch(r'[a-z]+', word):
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        word = word[:-3] + 'y'
+    elif word.endswith('sses'):
+        word = word[:-2]
+    elif word.endswith(('ss', 'us', 'is')):
+        pass
+    elif word.endswith('es') and word[:-2].endswith(('s', 'x', 'z', 'ch', 'sh')):
+        word = word[:-2]
+    elif word.endswith('s'):
+        word = word[:-1]
+    else:
+        for suffix in ('ing', 'ed'):
+            if word.endswith(suffix):
+                base = word[:-len(suffix)]
+                if len(base) >= 3 and re.search(r'[aeiouy]', base):
+                    if base[-1] == base[-2] and base[-1] not in 'lsz':
+                        base = base[:-1]
+                    word = base
+                break
+    if len(word) > 3 and word.endswith('e'):
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Lowercase, accent-free words of text, without stopwords or words shorter than MIN_TOKEN_LENGTH."""
+    text = COMBINING_MARKS.sub('', unicodedata.normalize('NFKD', text)).lower()
+    return [
+        token for token in TOKEN_PATTERN.findall(text)
+        if len(token) >= MIN_TOKEN_LENGTH and token not in STOPWORDS
+    ]
+
+
+def image_terms(image):
+    """Stemmed terms of one gallery-index image and their weight (summed over fields)."""
+    weights = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        value = image.get(field) or ''
+        if isinstance(value, list):
+            value = ' '.join(str(item) for item in value)
+        for term in {stem(token) for token in tokenize(str(value))}:
+            weights[term] = weights.get(term, 0) + weight
+    return weights
+
+
+def collection_terms(images):
+    """
+    Terms of a collection's images, in the delta-encoded shard format.
+
+    Returns:
+        dict: term -> [last local position, first local position, weight,
+              position delta, weight, ...]
+    """
+    terms = {}
+    for local, image in enumerate(images):
+        for term, weight in image_terms(image).items():
+            postings = terms.get(term)
+            if postings is None:
+                terms[term] = [local, local, weight]
+            else:
+                postings.extend((local - postings[0], weight))
+                postings[0] = local
+    return terms
+
+
+def shard_key(term, length):
+    """Shard key of a term: its first `length` characters, '_' standing in for anything but a-z and 0-9."""
+    return ''.join(c if c in SHARD_ALPHABET else '_' for c in term[:length])
+
+
+def _dumps(document):
+    return json.dumps(document, separators=(',', ':'), ensure_ascii=False, sort_keys=True)
+
+
+def build_shards(postings):
+    """
+    Split the encoded postings into shards.
+
+    Returns:
+        dict: shard key -> serialized shard content
+    """
+    groups = {}
+    for term in sorted(postings):
+        groups.setdefault(shard_key(term, 1), {})[term] = postings[term]
+
+    shards = {}
+    for key, terms in groups.items():
+        content = _dumps(terms)
+        if len(content.encode('utf-8')) <= SHARD_SPLIT_BYTES:
+            shards[key] = content
+            continue
+        split = {}
+        for term, encoded in terms.items():
+            split.setdefault(shard_key(term, 2), {})[term] = encoded
+        for sub_key, sub_terms in split.items():
+            shards[sub_key] = _dumps(sub_terms)
+    return shards
+
+
+def _load_cache(cache_path):
+    if not cache_path.exists():
+        return {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != SEARCH_VERSION:
+        return {}
+    return cache.get('collections', {})
+
+
+def _shard_names(manifest_path):
+    """File names of the shards a search manifest version refers to (none if it cannot be read)."""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            shards = json.load(f)['shards']
+    except (OSError, ValueError, KeyError, TypeError):
+        return set()
+    return {f'{key}.{digest}.json' for key, digest in shards.items()}
+
+
+@timed('search')
+def build_search_index(gallery_dir, log=None):
+    """
+    Write the search index for a gallery folder from its gallery-index.json.
+
+    Returns:
+        list: paths that were (re)written
+    """
+    log = log or (lambda level, message: None)
+    gallery_dir = Path(gallery_dir)
+    index_path = gallery_dir / INDEX_FILENAME
+    if not index_path.exists():
+        log('WARNING', f"  {INDEX_FILENAME} not found; run the index stage first")
+        return []
+
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    sources = index.get('sources', {})
+
+    out_dir = search_dir(gallery_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cache_path = out_dir / CACHE_FILENAME
+    cached = _load_cache(cache_path)
+
+    by_collection = {c['id']: [] for c in index['collections']}
+    for image in index['images']:
+        by_collection[image['collectionId']].append(image)
+
+    # Collections are appended in position order: only the first delta of
+    # each collection's postings needs rebasing onto the term's last position
+    postings = {}
+    last_positions = {}
+    cache = {}
+    start = 0
+    reused = 0
+    for collection in index['collections']:
+        collection_id = collection['id']
+        images = by_collection[collection_id]
+        source = sources.get(collection_id)
+        entry = cached.get(collection_id)
+        if entry and source and entry.get('source') == source:
+            terms = entry['terms']
+            reused += 1
+        else:
+            terms = collection_terms(images)
+        cache[collection_id] = {'source': source, 'terms': terms}
+
+        for term, local_postings in terms.items():
+            merged = postings.get(term)
+            if merged is None:
+                postings[term] = merged = []
+            merged.append(start + local_postings[1] - last_positions.get(term, 0))
+            merged.extend(local_postings[2:])
+            last_positions[term] = start + local_postings[0]
+        start += len(images)
+
+    shards = build_shards(postings)
+
+    written = []
+    current = set()
+    for key, content in shards.items():
+        path = out_dir / fingerprinted_name(f'{key}.json', content)
+        current.add(path.name)
+        if not path.exists():
+            atomic_write(path, content)
+            written.append(path)
+
+    manifest = {
+        'version': SEARCH_VERSION,
+        'images': len(index['images']),
+        'fields': FIELD_WEIGHTS,
+        'stopwords': sorted(STOPWORDS),
+        'minTokenLength': MIN_TOKEN_LENGTH,
+        'shards': {key: content_digest(content) for key, content in sorted(shards.items())},
+    }
+    validate_search_manifest(manifest)
+    manifest_path = out_dir / MANIFEST_FILENAME
+    content = _dumps(manifest)
+    if not manifest_path.exists() or manifest_path.read_text(encoding='utf-8') != content:
+        written.append(manifest_path)
+    publish(manifest_path, content, keep=1)
+
+    # Shards of the previous manifest stay while that manifest does
+    for version in versions(manifest_path):
+        current.update(_shard_names(version))
+
+    for stale in sorted(out_dir.glob('*.json')):
+        if stale.name in current or stale.name == CACHE_FILENAME or MANIFEST_FILENAME in (
+                stale.name, original_name(stale.name)):
+            continue
+        stale.unlink()
+        log('INFO', f"  Removed stale search shard {stale.name}")
+
+    if reused < len(cache) or len(cached) != len(cache):
+        atomic_write(cache_path, _dumps({'version': SEARCH_VERSION, 'collections': cache}))
+
+    if written:
+        log('SUCCESS', f"  ✓ Wrote search index: {len(postings)} terms in {len(shards)} shards "
+                       f"({len(written)} files changed, {reused} collections unchanged)")
+    else:
+        log('INFO', f"  Search index is up to date ({len(postings)} terms)")
+    return written
@@ -0,0 +1,189 @@
+"""
+Site-wide gallery index.
+
+Combines every live collection's metadata.json into one minified
+assets/images/gallery/gallery-index.json:
+
+    {
+      "version": 2,
+      "collections": [ {collection fields..., "imageCount": N}, ... ],
+      "images": [ {INDEX_IMAGE_FIELDS..., "collectionId", "collectionTitle"}, ... ],
+      "tags": { "night": [3, 17, ...], ... },   # tag -> positions in "images"
+      "sources": { "<collection id>": "<sha256 of its metadata.json>" }
+    }
+
+The browse and home pages then need a single request and no client-side
+tag scan. Images only keep the fields the index's readers use (the home
+and browse loaders, photosite.search_index and photosite.prerender):
+EXIF/IPTC and byte counts are left out, and of the print sizes only the
+first, for the "Prints starting at" price. Collections are taken in the order of the `collections` array
+in gallery-loader.js (all collection folders, alphabetically, if that
+list cannot be read).
+
+Rebuilds are incremental: a collection whose metadata.json hash matches
+"sources" in the previous index is reused from it without being parsed,
+and the file is only rewritten when its content changes. Each version is
+also published as gallery-index.<hash>.json (photosite.fingerprint), which
+the pre-rendered pages link to; the previous version is kept for one more
+build, for cached copies of those pages.
+"""
+
+import hashlib
+import json
+import re
+from pathlib import Path
+
+from photosite.fingerprint import publish
+from photosite.instrument import timed
+from photosite.schema import validate_index
+
+INDEX_FILENAME = 'gallery-index.json'
+INDEX_VERSION = 2
+
+INDEX_IMAGE_FIELDS = (
+    'id', 'title', 'filename', 'description', 'location', 'tags', 'featured',
+    'width', 'height', 'thumbnail', 'thumbnailVariants', 'renditions', 'placeholder', 'color',
+    'printAvailable', 'printSizes',
+)
+
+COLLECTIONS_PATTERN = re.compile(r"const collections = \[([^\]]*)\]", re.DOTALL)
+
+
+def site_root(gallery_dir):
+    """Site root for a gallery folder (<root>/assets/images/gallery)."""
+    return Path(gallery_dir).parents[2]
+
+
+def live_collection_ids(gallery_dir):
+    """
+    Collection IDs in display order, from gallery-loader.js.
+
+    Falls back to every folder in gallery_dir that has a metadata.json.
+    """
+    gallery_dir = Path(gallery_dir)
+    loader = site_root(gallery_dir) / 'assets' / 'js' / 'gallery-loader.js'
+    if loader.exists():
+        match = COLLECTIONS_PATTERN.search(loader.read_text(encoding='utf-8'))
+        if match:
+            return re.findall(r"'([^']+)'", match.group(1))
+    return sorted(
+        folder.name for folder in gallery_dir.iterdir()
+        if (folder / 'metadata.json').exists()
+    )
+
+
+def _paths_only(variants):
+    return {fmt: {'path': variant['path']} for fmt, variant in variants.items()}
+
+
+def _index_rendition(rendition):
+    entry = {key: rendition[key] for key in ('width', 'height', 'path')}
+    if rendition.get('variants'):
+        entry['variants'] = _paths_only(rendition['variants'])
+    return entry
+
+
+def index_image(image, collection):
+    """Compact gallery-index entry for one metadata.json image of a collection."""
+    entry = {key: image[key] for key in INDEX_IMAGE_FIELDS if key in image}
+    if entry.get('printAvailable') and entry.get('printSizes'):
+        entry['printSizes'] = entry['printSizes'][:1]
+    else:
+        entry.pop('printSizes', None)
+    if 'thumbnailVariants' in entry:
+        entry['thumbnailVariants'] = _paths_only(entry['thumbnailVariants'])
+    if 'renditions' in entry:
+        entry['renditions'] = [_index_rendition(rendition) for rendition in entry['renditions']]
+    entry['collectionId'] = collection['id']
+    entry['collectionTitle'] = collection['title']
+    return entry
+
+
+def _load_previous(index_path):
+    if not index_path.exists():
+        return None
+    try:
+        with open(index_path, 'r') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return previous if previous.get('version') == INDEX_VERSION else None
+
+
+def _previous_entries(previous, collection_id):
+    """(collection, images) for a collection from a previous index."""
+    collection = next(
+        (c for c in previous['collections'] if c['id'] == collection_id), None)
+    images = [img for img in previous['images'] if img['collectionId'] == collection_id]
+    return collection, images
+
+
+@timed('index')
+def build_gallery_index(gallery_dir, log=None):
+    """
+    Write gallery-index.json for a gallery folder if anything changed.
+
+    Returns:
+        Path or None: the index path if it was (re)written, else None
+    """
+    log = log or (lambda level, message: None)
+    gallery_dir = Path(gallery_dir)
+    index_path = gallery_dir / INDEX_FILENAME
+    previous = _load_previous(index_path)
+
+    collections = []
+    images = []
+    sources = {}
+    reused = 0
+
+    for collection_id in live_collection_ids(gallery_dir):
+        metadata_path = gallery_dir / collection_id / 'metadata.json'
+        if not metadata_path.exists():
+            log('WARNING', f"  No metadata.json for {collection_id}, leaving it out of the index")
+            continue
+
+        raw = metadata_path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+
+        collection = None
+        if previous and previous.get('sources', {}).get(collection_id) == digest:
+            collection, collection_images = _previous_entries(previous, collection_id)
+        if collection is not None:
+            reused += 1
+        else:
+            try:
+                metadata = json.loads(raw)
+                collection = dict(metadata['collection'], imageCount=len(metadata['images']))
+                collection_images = [index_image(image, collection) for image in metadata['images']]
+            except (ValueError, KeyError, TypeError) as e:
+                log('WARNING', f"  Invalid metadata.json for {collection_id} ({e}), leaving it out of the index")
+                continue
+
+        sources[collection_id] = digest
+        collections.append(collection)
+        images.extend(collection_images)
+
+    tags = {}
+    for position, image in enumerate(images):
+        for tag in image.get('tags', []):
+            tags.setdefault(tag, []).append(position)
+
+    index = {
+        'version': INDEX_VERSION,
+        'collections': collections,
+        'images': images,
+        'tags': dict(sorted(tags.items())),
+        'sources': sources,
+    }
+    validate_index(index)
+    content = json.dumps(index, separators=(',', ':'), ensure_ascii=False)
+
+    unchanged = index_path.exists() and index_path.read_text(encoding='utf-8') == content
+    publish(index_path, content, keep=1)
+    if unchanged:
+        log('INFO', f"  {INDEX_FILENAME} is up to date ({len(collections)} collections)")
+        return None
+
+    log('SUCCESS', f"  ✓ Wrote {INDEX_FILENAME}: {len(collections)} collections "
+                   f"({reused} unchanged), {len(images)} images, {len(tags)} tags")
+    return index_path
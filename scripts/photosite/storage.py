@@ -0,0 +1,180 @@
+"""
+Crash-safe writes for generated files.
+
+atomic_write() never leaves a half-written file behind: the content goes
+to a temporary file in the same folder, is fsync'ed, renamed over the
+target (an atomic replace on POSIX and Windows), and the folder entry is
+synced. An interrupted run leaves either the old file or the new one, so
+the live site never sees a truncated metadata.json or collection list.
+
+folder_lock() serializes read-modify-write cycles between processes (two
+terminals, or a --watch run next to a manual one) with an exclusive lock
+on a .photosite.lock file in the folder being written: a collection folder
+for its metadata.json and build manifest, assets/js/ for the collection
+lists. Files rebuilt from scratch (gallery-index.json, pre-rendered pages)
+only need the atomic write. The lock is re-entrant within a thread;
+another thread of the same process waits for it like another process.
+"""
+
+import contextlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from photosite.instrument import count, stage
+from photosite.schema import validate_metadata
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_FILENAME = '.photosite.lock'
+
+_held = {}  # (thread id, resolved folder) -> nesting depth
+_held_guard = threading.Lock()
+_default_mode = None
+
+
+def _new_file_mode():
+    global _default_mode
+    if _default_mode is None:
+        umask = os.umask(0)
+        os.umask(umask)
+        _default_mode = 0o666 & ~umask
+    return _default_mode
+
+
+def _fsync_folder(folder):
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return  # Folders cannot be opened on Windows
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, content, encoding='utf-8'):
+    """
+    Replace path with content (str or bytes) atomically and durably.
+
+    The file keeps its permissions if it already exists; new files get the
+    usual umask-based mode rather than mkstemp's private 0600.
+    """
+    path = Path(path)
+    data = content.encode(encoding) if isinstance(content, str) else content
+    try:
+        mode = path.stat().st_mode & 0o777
+    except FileNotFoundError:
+        mode = _new_file_mode()
+
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temp_path)
+        raise
+    _fsync_folder(path.parent)
+    count('files_written')
+    count('bytes_written', len(data))
+
+
+def write_json(path, data, validate=None, **dump_options):
+    """
+    Validate data (if a validate callable is given) and write it as JSON atomically.
+
+    validate raises (photosite.schema.SchemaError) before anything is written.
+    """
+    with stage('json_write'):
+        if validate is not None:
+            validate(data)
+        atomic_write(path, json.dumps(data, **dump_options))
+
+
+def write_metadata(metadata_path, metadata):
+    """Validate a collection's metadata against the schema and write it atomically."""
+    write_json(metadata_path, metadata, validate=validate_metadata, indent=2)
+
+
+def _try_lock(fd):
+    """Take the lock without waiting; True on success."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _wait_lock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue  # LK_LOCK gives up after ~10 s; keep waiting
+
+
+def _unlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextlib.contextmanager
+def folder_lock(folder, log=None):
+    """
+    Hold an exclusive inter-process lock on a folder for the duration of the block.
+
+    Waits (logging once) while another process or thread holds it. Nested
+    locks on the same folder within one thread do not block.
+    """
+    log = log or (lambda level, message: None)
+    folder = Path(folder).resolve()
+    key = (threading.get_ident(), folder)
+    with _held_guard:
+        depth = _held.get(key, 0)
+        _held[key] = depth + 1
+    if depth:
+        try:
+            yield
+        finally:
+            with _held_guard:
+                _held[key] -= 1
+        return
+
+    try:
+        fd = os.open(folder / LOCK_FILENAME, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if not _try_lock(fd):
+                log('INFO', f"  Waiting for another run to finish with {folder.name}/ ...")
+                _wait_lock(fd)
+            try:
+                yield
+            finally:
+                _unlock(fd)
+        finally:
+            os.close(fd)
+    finally:
+        with _held_guard:
+            del _held[key]
@@ -0,0 +1,250 @@
+"""
+HTTP client for the Perplexity vision API used to describe and tag images.
+
+One TaggingClient is shared by a whole run. It provides:
+
+- a pooled requests.Session, so TLS connections are reused between images
+- bounded concurrency: map() runs requests on a small thread pool
+- a token-bucket rate limiter shared by all worker threads
+- per-request (connect, read) timeouts, so a hung request cannot stall a run
+- retries with exponential backoff (honouring Retry-After) on 429, 5xx,
+  timeouts and dropped connections
+
+Images are never uploaded at full resolution. image_payload() sends the
+largest existing rendition that fits within max_image_edge (default 1024 px)
+or, if none is on disk, a draft-decoded downscale, as base64 JPEG.
+
+The endpoint can be pointed at a local stub server with PERPLEXITY_API_URL.
+requests is only imported once a client is created, so importing this
+module (for its defaults) stays cheap.
+"""
+
+import base64
+import io
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from photosite.imaging import TRANSPOSED_ORIENTATIONS, open_original, open_scaled, orientation, upright
+from photosite.instrument import count, stage, timed
+from photosite.renditions import RENDITION_WIDTHS, current_file, rendition_path
+
+PERPLEXITY_API_URL = os.environ.get(
+    'PERPLEXITY_API_URL', 'https://api.perplexity.ai/chat/completions')
+
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = 2.0          # requests per second, averaged
+DEFAULT_BURST = 4           # requests allowed back-to-back
+DEFAULT_TIMEOUT = (10, 90)  # (connect, read) seconds
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE = 1.0          # seconds; doubles on every retry
+BACKOFF_MAX = 60.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+DEFAULT_MAX_IMAGE_EDGE = 1024  # longest edge, in pixels, of uploaded images
+UPLOAD_QUALITY = 85
+
+
+def _fits(size, max_edge):
+    return max(size) <= max_edge
+
+
+def find_upload_rendition(image_path, max_edge=DEFAULT_MAX_IMAGE_EDGE):
+    """
+    Largest existing rendition of image_path that fits within max_edge.
+
+    Renditions older than the original are ignored. Returns None if there
+    is no suitable rendition on disk.
+    """
+    image_path = Path(image_path)
+    collection_path = image_path.parent.parent
+    source_mtime = image_path.stat().st_mtime
+    for width in sorted(RENDITION_WIDTHS, reverse=True):
+        if width > max_edge:
+            continue
+        path = current_file(rendition_path(collection_path, width, image_path.name))
+        if path is None or path.stat().st_mtime < source_mtime:
+            continue
+        with Image.open(path) as rendition:
+            if _fits(rendition.size, max_edge):
+                return path
+    return None
+
+
+@timed('api.payload')
+def image_payload(image_path, max_edge=DEFAULT_MAX_IMAGE_EDGE):
+    """
+    Base64 JPEG of image_path, no larger than max_edge on its longest side.
+
+    Reuses a rendition from the thumbnail step when one fits, otherwise
+    decodes the original at reduced scale and downsizes it in memory.
+
+    Returns:
+        tuple: (media_type, base64_str)
+    """
+    rendition = find_upload_rendition(image_path, max_edge)
+    if rendition is not None:
+        with open(rendition, 'rb') as f:
+            return 'image/jpeg', base64.standard_b64encode(f.read()).decode('ascii')
+
+    with open_original(image_path) as probe:
+        width, height = probe.size
+        if orientation(probe) in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+    scale = min(1.0, max_edge / max(width, height))
+    target_width = max(1, int(width * scale))
+
+    img, _ = open_scaled(image_path, target_width)
+    with img:
+        img = upright(img)[0].convert('RGB')
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=UPLOAD_QUALITY)
+    return 'image/jpeg', base64.standard_b64encode(buffer.getbuffer()).decode('ascii')
+
+
+def parse_rate(text):
+    """
+    Requests per second from a command-line value; must be above zero.
+
+    Raises:
+        ValueError: if text is not a positive number
+    """
+    rate = float(text)
+    if not rate > 0:
+        raise ValueError(f"rate must be above zero, got {text!r}")
+    return rate
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `burst` saved."""
+
+    def __init__(self, rate, burst):
+        if not rate > 0:
+            raise ValueError(f"rate must be above zero, got {rate!r}")
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TaggingClient:
+    """Rate-limited, retrying client for the chat completions endpoint."""
+
+    def __init__(self, api_key, url=PERPLEXITY_API_URL, workers=DEFAULT_WORKERS,
+                 rate=DEFAULT_RATE, burst=DEFAULT_BURST, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, max_image_edge=DEFAULT_MAX_IMAGE_EDGE,
+                 log=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = url
+        self.max_image_edge = max_image_edge
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate, burst)
+        self.log = log or (lambda level, message: None)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json',
+        })
+
+    def _backoff(self, attempt, response=None):
+        """Seconds to wait before retry number `attempt` (1-based)."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(BACKOFF_MAX, float(retry_after))
+                except ValueError:
+                    pass
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def post(self, payload):
+        """
+        POST a JSON payload, retrying transient failures.
+
+        Returns:
+            requests.Response: the final response (successful or not)
+
+        Raises:
+            requests.RequestException: if every attempt failed at the
+            connection level
+        """
+        import requests
+
+        attempt = 0
+        while True:
+            with stage('api.rate_limit'):
+                self.bucket.acquire()
+            count('api_requests')
+            try:
+                with stage('api.request'):
+                    response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    count('api_failures')
+                    raise
+                delay = self._backoff(attempt)
+                self.log('WARNING', f"  Request failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                count('api_retries')
+                with stage('api.backoff'):
+                    time.sleep(delay)
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                attempt += 1
+                delay = self._backoff(attempt, response)
+                self.log('WARNING', f"  API returned {response.status_code}, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                count('api_retries')
+                with stage('api.backoff'):
+                    time.sleep(delay)
+                continue
+
+            if response.status_code != 200:
+                count('api_failures')
+            return response
+
+    def map(self, fn, items):
+        """
+        Apply fn to every item on the client's worker threads.
+
+        Results are yielded in the order of `items`.
+        """
+        items = list(items)
+        if self.workers == 1 or len(items) <= 1:
+            yield from map(fn, items)
+            return
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items))) as executor:
+            yield from executor.map(fn, items)
+
+    def close(self):
+        self.session.close()
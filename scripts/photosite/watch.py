@@ -0,0 +1,244 @@
+"""
+Watch assets/images/gallery/*/full-res/ for new or changed originals.
+
+On Linux the watcher uses inotify (through ctypes, no extra packages):
+the kernel reports each file written, moved in or deleted, so nothing is
+rescanned while idle. Elsewhere, or if inotify is unavailable, it falls
+back to polling the full-res folders' directory listings and file stats
+every POLL_INTERVAL seconds.
+
+Changed files are debounced: an image is only handed on once it has been
+quiet (no events, size and mtime unchanged) for DEBOUNCE_SECONDS, so files
+still being copied or uploaded are never read half-written. Ready images
+are delivered in batches grouped by collection. A batch whose handler
+raises is logged and its images are retried RETRY_SECONDS later.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+from photosite.discovery import collection_of, is_source_image
+
+DEBOUNCE_SECONDS = 2.0
+POLL_INTERVAL = 2.0
+TICK_SECONDS = 0.5
+RETRY_SECONDS = 30.0
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+FILE_EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+DIR_EVENTS = IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Reports changed images under gallery_dir via Linux inotify."""
+
+    name = 'inotify'
+
+    def __init__(self, gallery_dir):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.gallery_dir = Path(gallery_dir)
+        self.paths = {}
+        self.overflowed = False
+        self._add(self.gallery_dir, DIR_EVENTS)
+        for collection in sorted(p for p in self.gallery_dir.iterdir() if p.is_dir()):
+            self._watch_collection(collection)
+
+    def _add(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+        self.paths[wd] = Path(path)
+
+    def _watch_collection(self, collection):
+        self._add(collection, DIR_EVENTS)
+        full_res = collection / 'full-res'
+        if full_res.is_dir():
+            self._add(full_res, FILE_EVENTS)
+            # Files that landed before the watch was in place
+            return {p for p in full_res.iterdir() if is_source_image(p)}
+        return set()
+
+    def changes(self, timeout):
+        """Paths of images changed since the last call, waiting up to `timeout`."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            parent = self.paths.get(wd)
+            if parent is None or not name:
+                continue
+            path = parent / name
+            if mask & IN_ISDIR:
+                # New collection folder, or a full-res folder inside one
+                try:
+                    if parent == self.gallery_dir:
+                        changed |= self._watch_collection(path)
+                    elif name == 'full-res':
+                        self._add(path, FILE_EVENTS)
+                        changed |= {p for p in path.iterdir() if is_source_image(p)}
+                except OSError:
+                    pass
+            elif parent.name == 'full-res' and is_source_image(path):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Reports changed images under gallery_dir by comparing file stats."""
+
+    name = 'polling'
+
+    def __init__(self, gallery_dir, interval=POLL_INTERVAL):
+        self.gallery_dir = Path(gallery_dir)
+        self.interval = interval
+        self.overflowed = False
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for full_res in self.gallery_dir.glob('*/full-res'):
+            for entry in os.scandir(full_res):
+                if entry.is_file() and is_source_image(entry.path):
+                    st = entry.stat()
+                    snapshot[Path(entry.path)] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def changes(self, timeout):
+        """Paths of images changed since the last call, waiting up to `timeout`."""
+        time.sleep(max(timeout, self.interval))
+        current = self._scan()
+        changed = {p for p, stat in current.items() if self.snapshot.get(p) != stat}
+        changed |= set(self.snapshot) - set(current)
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(gallery_dir, polling=False, log=None):
+    """inotify watcher where supported, otherwise (or if polling) a polling one."""
+    log = log or (lambda level, message: None)
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(gallery_dir)
+        except (OSError, AttributeError) as e:
+            log('WARNING', f"inotify unavailable ({e}), polling every {POLL_INTERVAL:g}s instead")
+    return PollingWatcher(gallery_dir)
+
+
+def _stat(path):
+    try:
+        st = Path(path).stat()
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def watch_galleries(gallery_dir, handle_batch, debounce=DEBOUNCE_SECONDS, polling=False,
+                    log=None, stop=None):
+    """
+    Call handle_batch for every batch of new or changed originals until interrupted.
+
+    Args:
+        gallery_dir: assets/images/gallery
+        handle_batch: called with {collection_path: [image paths]} once the
+                      images have been quiet for `debounce` seconds; deleted
+                      images are not included
+        debounce: seconds an image must go without events or size/mtime
+                  changes before it is handed on
+        polling: use the polling watcher even where inotify is available
+        stop: optional callable; watching ends when it returns True
+    """
+    log = log or (lambda level, message: None)
+    watcher = open_watcher(gallery_dir, polling, log)
+    log('INFO', f"Watching {gallery_dir}/*/full-res/ ({watcher.name}), Ctrl+C to stop")
+
+    pending = {}  # path -> (last change time, last stat)
+    try:
+        while not (stop and stop()):
+            now = time.monotonic()
+            for path in watcher.changes(TICK_SECONDS):
+                pending[path] = (now, _stat(path))
+
+            if watcher.overflowed:
+                # Events were dropped; fall back to one stat pass
+                log('WARNING', "Too many file events at once, checking every full-res folder")
+                watcher.overflowed = False
+                rescan = PollingWatcher(gallery_dir)
+                for path in rescan.snapshot:
+                    pending.setdefault(path, (now, None))
+
+            ready = []
+            now = time.monotonic()
+            for path, (changed_at, last_stat) in list(pending.items()):
+                stat = _stat(path)
+                if stat is None:
+                    del pending[path]
+                elif stat != last_stat:
+                    pending[path] = (now, stat)  # still growing
+                elif now - changed_at >= debounce:
+                    del pending[path]
+                    ready.append(path)
+
+            if ready:
+                batch = {}
+                for path in sorted(ready):
+                    batch.setdefault(collection_of(path), []).append(path)
+                try:
+                    handle_batch(batch)
+                except Exception as e:
+                    log('ERROR', f"Failed to process {len(ready)} changed images ({e}), "
+                                 f"retrying in {RETRY_SECONDS:g}s")
+                    # Counted as quiet from RETRY_SECONDS - debounce from now
+                    retry_at = time.monotonic() + RETRY_SECONDS - debounce
+                    for path in ready:
+                        pending.setdefault(path, (retry_at, _stat(path)))
+    except KeyboardInterrupt:
+        log('INFO', "Stopped watching")
+    finally:
+        watcher.close()